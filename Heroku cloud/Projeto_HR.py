@@ -7,15 +7,27 @@ Created on Tue Nov  1 10:57:13 2022
 
 ## Libraries ###-------------------------------------------------------------------
 
-import geopandas
-import pandas as pd
 import numpy as np
 import streamlit as st 
 import folium
-from streamlit_folium import folium_static
-from folium.plugins import MarkerCluster
+import streamlit.components.v1 as components
 import plotly.express as px
 from datetime import datetime
+import os
+import uuid
+
+from dados_hr import (base_compartilhada, selecao, versao_dados, indices_colunas, consulta_indices,
+                      ordem_coluna, ordem_selecao, pagina, TAMANHOS_PAGINA)
+from metricas_hr import cubo_zipcode, metricas_por_regiao, estatistica_descritiva, carregar_hipoteses, tabelas_agregados_hipoteses
+from mapas_hr import (marcadores_cluster, agregar_grade, camada_grade,
+                      COLUNAS_POPUP_INVESTIDOS, POPUP_INVESTIDOS, carregar_geometrias, geojson_zipcodes, enquadramento_regioes,
+                      html_mapa, chave_mapa, cache_mapas)
+from recomendacoes_hr import carregar_recomendacoes, calcular_compra_venda, tabela_compra
+from instrumentacao_hr import Instrumentacao, configurar_log
+from tiles_hr import camada_tiles
+from comparaveis_hr import indice_comparaveis, precificar_comparaveis
+from sql_hr import (BACKEND_AGREGACOES, conectar, metricas_por_regiao_sql, estatistica_descritiva_sql,
+                    agregados_hipoteses_sql, recomendacoes_sql, calcular_compra_venda_sql)
 
 
 ## Functions ###-------------------------------------------------------------------------------------
@@ -25,116 +37,152 @@ st.set_page_config( layout= 'wide' )
 
 
 ## Para poupar tempo em extrair informação da memória cache e não do disco
-@st.cache( allow_output_mutation = True )
+## As funções com cache recebem a versão da base para recarregar quando novas vendas forem adicionadas ( ver ingestao_hr.py )
+## st.cache_resource: objetos grandes ou não serializáveis compartilhados sem cópia pelas sessões ( conexão, índices, árvores,
+## bases linha a linha - tratados como somente leitura ); st.cache_data: tabelas derivadas pequenas, copiadas a cada leitura
+## max_entries: guarda só a versão atual e a anterior ( sessões abertas durante a ingestão ) - sem o limite, cada ingestão deixaria
+## na memória a conexão DuckDB, árvores, cubo e ordens da versão antiga enquanto o processo estiver vivo
+VERSOES_CACHE = 2
+## Ordens de tabela por versão ( base bruta e tratada, coluna e sentido ) - as menos usadas saem primeiro
+ORDENS_CACHE = 16 * VERSOES_CACHE
 
-## Função para carregar base de dados de imóveis de arquivo em formato .csv
-def get_data( path ):
+## Função para carregar base de dados de imóveis de arquivo em formato .csv (via snapshot colunar, ver dados_hr.py)
+## Base única do processo, compartilhada por todas as sessões ( sem cópia por sessão ) - nunca alterada, filtros e páginas copiam as linhas
+def get_data( path, versao ):
     
-    data = pd.read_csv( path )
+    data = base_compartilhada( path, versao )['bruto']
     
     return data 
 
-# Função para extrair informações/dados de API sobre coordenadas (LAT, LONG) de regiões representadas pelo zipcode da cidade trabalhada
-@st.cache( allow_output_mutation=True )
-def get_geofile( url ):
-    
-    geofile = geopandas.read_file( url )
 
-    return geofile
+## Base de dados tratada - lida do snapshot, sem repetir data_cleaning a cada inicialização ( também compartilhada )
+def get_data_clean( path, versao ):
+    
+    data = base_compartilhada( path, versao )['limpo']
+    
+    return data 
 
+## Versão da base de dados (hash do .csv e ano atual) - calculada de novo só quando o arquivo é modificado ou o ano muda
+## ( a idade dos imóveis, e com ela a base tratada e o status de compra, dependem do ano )
+@st.cache_data( max_entries = VERSOES_CACHE )
+def get_versao( path, modificado, ano ):
+    
+    versao = '{0}_{1}'.format( versao_dados( path ), ano )
+    
+    return versao
 
-def data_cleaning(df):
+## Índices por coluna para os filtros da visão Gráficos
+@st.cache_resource( max_entries = VERSOES_CACHE )
+def get_indices( path, versao ):
     
-    ## DATA CLEANING ------------------------------------------------------
+    indices = indices_colunas( get_data_clean( path, versao ) )
     
-    ## Outliers -----------------------------------------------------------
+    return indices
+
+## Ordem das linhas da base ( 'bruto' ou 'limpo' ) por uma coluna - para as tabelas paginadas, calculada uma vez por coluna
+@st.cache_resource( max_entries = ORDENS_CACHE )
+def get_ordem( path, versao, tipo, coluna, crescente ):
+    
+    ordem = ordem_coluna( base_compartilhada( path, versao )[tipo], coluna, crescente )
     
-    df.loc[df['bedrooms'] == 33, 'bedrooms' ] = 3
+    return ordem
+
+## Cubo de agregados por região - calculado uma única vez sobre a base tratada
+@st.cache_resource( max_entries = VERSOES_CACHE )
+def get_cubo( path, versao ):
     
-    ## Tratamento e criação de features -----------------------------------
+    cubo = cubo_zipcode( get_data_clean( path, versao ) )
     
-    # Tratar coluna date para ficar do tipo datetime
-    df['date'] = pd.to_datetime(df['date'], format = ('%Y-%m-%d'))
+    return cubo
+
+## Conexão DuckDB com a base tratada - usada só quando BACKEND_AGREGACOES = 'duckdb' ( ver sql_hr.py )
+@st.cache_resource( max_entries = VERSOES_CACHE )
+def get_conexao( path, versao ):
     
-    # Coluna para data com formato em Dia/Mês/Ano
-    df['date_str'] = df['date'].dt.strftime('%d-%m-%Y')
+    con = conectar( path )
     
-    # Criar colunas separadas para mês e ano de venda do imóvel
-    df['month'] = df['date'].dt.month 
-    df['year'] = df['date'].dt.year
+    return con
 
-    # Criar coluna para estações do ano - Verão, Inverno, Primavera, Outono.
+## Balizadores de compra/venda e análise de compra - gravados por versão da base ( ver recomendacoes_hr.py )
+@st.cache_resource( max_entries = VERSOES_CACHE )
+def get_recomendacoes( path, versao ):
     
-    #Verão: de junho a agosto.
-    #Outono: de setembro a novembro.
-    #Inverno: de dezembro a fevereiro.
-    #Primavera: de março a maio.#
+    if BACKEND_AGREGACOES == 'duckdb':
+        agregados, df_compra = recomendacoes_sql( get_conexao( path, versao ) )
+    else:
+        agregados, df_compra = carregar_recomendacoes( path )
     
-    ver_lt = [6,7,8]
-    out_lt = [9,10,11]
-    inv_lt = [12,1,2]
-    pri_lt = [3,4,5]
+    return agregados, df_compra
+
+## Grade de densidade da base inteira ( mapa da Visão Geral sem filtro de código postal )
+@st.cache_data( max_entries = VERSOES_CACHE )
+def get_grade( path, versao ):
     
+    grade = agregar_grade( get_data_clean( path, versao ) )
     
-    df.loc[df['month'].isin(ver_lt), 'seasons'] = 'Verão'
-    df.loc[df['month'].isin(out_lt), 'seasons'] = 'Outono'
-    df.loc[df['month'].isin(inv_lt), 'seasons'] = 'Inverno'
-    df.loc[df['month'].isin(pri_lt), 'seasons'] = 'Primavera'
+    return grade
+
+## Índice espacial das vendas recentes para a precificação por comparáveis ( ver comparaveis_hr.py )
+@st.cache_resource( max_entries = VERSOES_CACHE )
+def get_comparaveis( path, versao ):
     
-    # Criar uma coluna nova com unidade de medida de área m2 para o tamanho do imóvel
-    df['m2_living'] = df['sqft_living']/ 10.764
-    df['m2_lot'] = df['sqft_lot']/ 10.764
-    df['m2_above'] = df['sqft_above']/ 10.764
+    indice = indice_comparaveis( get_data_clean( path, versao ) )
     
+    return indice
+
+## Preço de venda, lucro e ROI dos imóveis recomendados - calculados uma vez por versão da base, o filtro de ROI é aplicado depois
+@st.cache_resource( max_entries = VERSOES_CACHE )
+def get_compra_venda( path, versao ):
     
-    #- Criar coluna extra que seria tamanho área externa -> sqft_outside = sqft_lot - (sqft_above/floors)
-    df['m2_outside'] = df['m2_lot'] - (df['m2_above']/df['floors'])
+    agregados, df_compra = get_recomendacoes( path, versao )
     
-    # Criar coluna preço imóvel / área construída (m2_living) 
-    df['price_per_m2_living'] = df['price'] / df['m2_living']
+    if BACKEND_AGREGACOES == 'duckdb':
+        df_compra_venda = calcular_compra_venda_sql( get_conexao( path, versao ), df_compra, agregados )
+    else:
+        df_compra_venda = calcular_compra_venda( df_compra, agregados )
     
-    # Criar coluna preço imóvel / área construída + área externa
-    df['price_per_m2_living_outside'] = df['price'] / (df['m2_living'] + df['m2_outside'])
+    ## Arredondar o roi 
+    df_compra_venda["roi"] = df_compra_venda["roi"].round(2)
     
-    # Criar coluna age
-    df['age'] = datetime.now().year - df['yr_built']
+    ## Preço pela mediana do preço/m2 das vendas vizinhas parecidas ( referência ao lado do preço de venda estimado )
+    df_compra_venda = precificar_comparaveis( df_compra_venda, get_comparaveis( path, versao ) )
     
-    # Criar coluna is_renovated
-    df['is_renovated'] = df['yr_renovated'].apply(lambda x: 'Yes' if x != 0 else 'No')
+    return df_compra_venda
+
+## Tabelas das hipóteses da aba Insights ( H1 a H5, já no formato das tabelas e gráficos ) - saem do artefato das hipóteses,
+## gravado por versão da base ( ver metricas_hr.carregar_hipoteses ), então nada é recalculado enquanto a base não mudar
+@st.cache_data( max_entries = VERSOES_CACHE )
+def get_hipoteses( path, versao ):
     
-    # Troca de valores waterfront: (0) -> No (1) -> Yes
-    df['waterfront'].replace({1:'Yes',0:'No'}, inplace = True)
+    if BACKEND_AGREGACOES == 'duckdb':
+        agregados = agregados_hipoteses_sql( get_conexao( path, versao ) )
+    else:
+        agregados = carregar_hipoteses( path )
     
-    df = df[['id','zipcode', 'date', 'date_str', 'month', 'year', 'yr_built', 'age', 'yr_renovated', 
-             'is_renovated', 'bathrooms','bedrooms','condition','floors','grade', 'lat','long',
-             'm2_living', 'm2_outside', 'price', 'price_per_m2_living', 'price_per_m2_living_outside',
-             'seasons', 'view','waterfront']]
+    return tabelas_agregados_hipoteses( agregados )
+
+# Função para extrair informações/dados de API sobre coordenadas (LAT, LONG) de regiões representadas pelo zipcode da cidade trabalhada
+# Polígonos pré-simplificados em alguns níveis e indexados por ZIP ( ver mapas_hr.py )
+@st.cache_resource
+def get_geofile( url ):
     
-    return df
+    geofile = carregar_geometrias( url )
 
+    return geofile
 
 
-def table_metrics(df):
+def table_metrics(cubo, zipcodes, con = None):
     
+    # Tabelas calculadas como reduções sobre o cubo de agregados por região (ver metricas_hr.py)
+    # ou em SQL na conexão DuckDB, quando informada (ver sql_hr.py)
     
-    ## 1.1 - Dataframes com métricas por região(zipcode)  
+    ## 1.1 - Dataframe com métricas por região(zipcode)  
     
-    # Número de imóveis distintos por região
-    n_imoveis = df[['zipcode','id']].groupby(['zipcode']).nunique().reset_index()
-    # Média de preço dos imóveis por região
-    media_price = df[['zipcode','price']].groupby(['zipcode']).mean().reset_index()
-    # Média da área contruída imóveis (m2) por região
-    media_m2_living = df[['zipcode','m2_living']].groupby(['zipcode']).mean().reset_index()
-    # Preço por área construída (m2) médio por região
-    media_price_per_m2_b = df[['zipcode','price_per_m2_living']].groupby(['zipcode']).mean().reset_index()
-    # Área externa média dos imóveis (m2) por região
-    media_m2_outside = df[['zipcode','m2_outside']].groupby(['zipcode']).mean().reset_index()
-    # Preço por área construída + área externa (m2) médio por região
-    media_price_per_m2_f = df[['zipcode','price_per_m2_living_outside']].groupby(['zipcode']).mean().reset_index()
-    
-    
-    # Merge tables - Unir todas as tabelas sobre zipcode
-    m = n_imoveis.merge(media_price, on = 'zipcode', how = 'inner').merge(media_price_per_m2_b, on = 'zipcode', how = 'inner').merge(media_price_per_m2_f, on = 'zipcode', how = 'inner').merge( media_m2_living , on = 'zipcode', how = 'inner').merge( media_m2_outside , on = 'zipcode', how = 'inner')
+    # Quantidade de imóveis distintos e médias de preço e área por região
+    if con is None:
+        m = metricas_por_regiao(cubo, zipcodes)
+    else:
+        m = metricas_por_regiao_sql(con, zipcodes)
     
     # Dar nome colunas
     m.columns = ['Código Postal', 'Quantidade','Preço','Preço / m2 construído', 
@@ -143,19 +191,10 @@ def table_metrics(df):
     
     ## 1.3 - Dataframe com estatística descritiva dos atributos da base de dados 
     
-    df_var_ed = df[[ 'year', 'age', 'yr_renovated', 'bathrooms','bedrooms','condition','floors','grade', 
-                    'm2_living', 'm2_outside', 'price', 'price_per_m2_living', 'price_per_m2_living_outside']]
-    
-    media_ed = pd.DataFrame( df_var_ed.apply(np.mean, axis = 0) )
-    mediana_ed = pd.DataFrame( df_var_ed.apply(np.median, axis = 0) )
-    desv_pad_ed = pd.DataFrame( df_var_ed.apply(np.std, axis = 0) )
-    max_ed = pd.DataFrame( df_var_ed.apply(np.max, axis = 0) )
-    min_ed = pd.DataFrame( df_var_ed.apply(np.min, axis = 0) )
-    
-    
-    # Juntar Medidas estatísticas de atributos em tabelas diferentes
-    
-    ed = pd.concat([media_ed, mediana_ed, desv_pad_ed, max_ed, min_ed], axis = 1).reset_index()
+    if con is None:
+        ed = estatistica_descritiva(cubo, zipcodes).reset_index()
+    else:
+        ed = estatistica_descritiva_sql(con, zipcodes).reset_index()
     
     # Dar nome colunas
     
@@ -165,7 +204,7 @@ def table_metrics(df):
 
 
 
-def maps(df, geofile):
+def maps(df, geofile, grade = None, url_tiles = None):
     
     
     # 2. Mapas
@@ -182,24 +221,20 @@ def maps(df, geofile):
                                         default_zoom_start=15 )
     
     
-    # Instanciando objeto para inserir os dados de imóveis no mapa, os pontos
-    marker_cluster = MarkerCluster().add_to( density_map )
+    # Densidade por células em alguns níveis de zoom - quantidade de vendas e preço/m2 médio por célula ( ver mapas_hr.py )
+    # A página recebe só as células, não os imóveis; grade já agregada da base inteira quando não há filtro
+    # Com servidor de tiles ( base inteira ) o navegador busca só os tiles da área visível ( ver tiles_hr.py )
+    if url_tiles is not None:
+        camada_tiles( density_map, url_tiles, 'densidade' )
     
-    # Inserção dos pontos imóveis no mapa transformando dataframe com dados em iterativo para usar o for com estruturas dataframe
-    # row = linha -> imóveis/amostra/observação distinta
-    # popup = descrição ao passar o mouse sobre os pontos
-    for name, row in df.iterrows():
+    else:
+        if grade is None:
+            grade = agregar_grade( df )
         
-        folium.Marker( [row['lat'], row['long'] ], popup='''Vendido por ${0} em: {1}. Características: {2} m2 de área construída, 
-                                                          {3} quartos,{4} banheiros, ano construção: {5}'''.format( row['price'],
-                                                                                                                     row['date_str'],
-                                                                                                                     row['m2_living'],
-                                                                                                                     row['bedrooms'],
-                                                                                                                     row['bathrooms'],
-                                                                                                                     row['yr_built'] ) ).add_to( marker_cluster )
+        camada_grade( density_map, grade )
+    
     
     
-
     
     
     # 2.3 Region Price per m2 built Map - 
@@ -211,13 +246,15 @@ def maps(df, geofile):
     
     # Filtrar do arquivo com as coordenadas de regiões totais apenas as regiões de amostra que peguei para analisar preço médio no dataset 
     # para depois não acabar ficando regiões sem dado de preço médio
-    geofile = geofile[geofile['ZIP'].isin( data_map['ZIP'].tolist() )]
+    # Mapa enquadrado nas regiões; polígonos buscados pela chave ZIP, no nível de simplificação desse zoom
+    centro, zoom = enquadramento_regioes( geofile, data_map['ZIP'].tolist() )
+    geo_data = geojson_zipcodes( geofile, data_map['ZIP'].tolist(), zoom )
     
     # Mapa Base - Folium - é apenas o mapa sem pontos
-    region_price_liv_map = folium.Map( location= [df['lat'].mean(), df['long'].mean() ], default_zoom_start=15 )
+    region_price_liv_map = folium.Map( location= centro or [df['lat'].mean(), df['long'].mean() ], zoom_start = zoom )
     
     
-    folium.Choropleth( data = data_map, geo_data = geofile, columns=['ZIP', 'PRICE'],
+    folium.Choropleth( data = data_map, geo_data = geo_data, columns=['ZIP', 'PRICE'],
                                  key_on='feature.properties.ZIP', fill_color='YlOrRd',
                                  fill_opacity = 0.7, line_opacity = 0.2,
                                  legend_name='PREÇO/ÁREA CONSTRUÍDA MÉDIO' ).add_to(region_price_liv_map)
@@ -228,33 +265,89 @@ def maps(df, geofile):
     return density_map, region_price_liv_map 
 
 
-def compra_house(x):
-    if (x['price_per_m2_living'] < x['target_buy']) & (x['condition'] >= 3) & (x['age'] >= 50):
-        
-        if (x['is_renovated'] == 1):
-            return 'Compra'
-        else:
-            return 'Não Compra'
-        
-    elif (x['price_per_m2_living'] < x['target_buy']) & (x['condition'] >= 3) & (x['age'] < 50):
-        return 'Compra'
+def maps_investidos(df, df_clean, geofile, url_tiles = None):
+    
+    # Plotar mapa de calor - Lucro médio por região com os investimentos estimados
+    
+    ## Preparação Mapas
+    
+    data_map = df[['Lucro estimado','Código Postal']].groupby( ['Código Postal'] ).mean().reset_index() 
+    
+    data_map.columns = ['ZIP', 'LUCRO']
+    
+    
+    # Filtrar do arquivo com as coordenadas de regiões totais apenas as regiões de amostra que peguei para analisar preço médio no dataset 
+    # para depois não acabar ficando regiões sem dado de preço médio
+    # Mapa enquadrado nas regiões; polígonos buscados pela chave ZIP, no nível de simplificação desse zoom
+    centro, zoom = enquadramento_regioes( geofile, data_map['ZIP'].tolist() )
+    geo_data = geojson_zipcodes( geofile, data_map['ZIP'].tolist(), zoom )
+    
+    # Mapa Base - Folium - é apenas o mapa sem pontos
+    region_lucro = folium.Map( location= centro or [df_clean['lat'].mean(), df_clean['long'].mean() ], 
+                               zoom_start = zoom )
+    
+    
+    folium.Choropleth( data = data_map, geo_data = geo_data, columns=['ZIP', 'LUCRO'],
+                         key_on='feature.properties.ZIP', fill_color='YlOrRd',
+                         fill_opacity = 0.7, line_opacity = 0.2,
+                         legend_name='MÉDIA LUCRO' ).add_to(region_lucro)
+    
+    
+    
+    # Preparação mapa Distribuição/Densidade dos imóveis investidos
+    
+    # Mapa Base - Folium - é apenas o mapa sem pontos
+    density_map_compra = folium.Map( location=[df_clean['lat'].mean(), df_clean['long'].mean() ], 
+                                     default_zoom_start=15 )
+    
+    
+    # Inserção dos pontos imóveis no mapa - marcadores criados no navegador a partir de arrays compactos
+    # popup = descrição ao passar o mouse sobre os pontos
+    # Com servidor de tiles ( todos os imóveis investidos, sem filtro de ROI ) vai só a camada de tiles, cor pelo lucro
+    if url_tiles is not None:
+        camada_tiles( density_map_compra, url_tiles, 'investidos' )
     
     else:
-        return 'Não Compra'
+        marcadores_cluster( density_map_compra, df, COLUNAS_POPUP_INVESTIDOS, POPUP_INVESTIDOS )
+    
+    
+    return region_lucro, density_map_compra
+
+
+# Mostra o HTML de um mapa já renderizado (mesmo tamanho padrão do folium_static)
+def mapa_static(html, width = 700, height = 500):
+    
+    return components.html( html, height = height + 10, width = width )
 
 
 
-def venda_house(x):
-         
-    if (x['price_per_m2_living'] >= x['median_venda']) & (x['grade'] > x['mean_grade_per_zip']):
-        return x['price']* 1.1
-    elif (x['price_per_m2_living'] >= x['median_venda']):
-        return x['price']* 1.05
-    elif (x['price_per_m2_living'] < x['median_venda']) & (x['grade'] > x['mean_grade_per_zip']):
-        return x['price']* 1.2
-    elif (x['price_per_m2_living'] < x['median_venda']):
-        return x['price']* 1.15
+# Tabela paginada e ordenável: só as linhas da página são copiadas e enviadas ao navegador.
+# posicoes = linhas selecionadas na base ( None = todas ); ordens( coluna, crescente ) devolve a ordem da base pela coluna;
+# estilo( pagina ) devolve um Styler só da página ( opcional )
+def tabela_paginada(base, posicoes, ordens, chave, colunas = None, estilo = None):
+    
+    c1, c2, c3, c4 = st.columns( ( 2, 1, 1, 1 ) )
+    
+    sem_ordem = 'Ordem do arquivo'
+    coluna = c1.selectbox( 'Ordenar por:', [sem_ordem] + base.columns.tolist(), key = chave + '_coluna' )
+    crescente = c2.radio( 'Sentido:', ( 'Crescente', 'Decrescente' ), key = chave + '_sentido' ) == 'Crescente'
+    tamanho = c3.selectbox( 'Linhas por página:', TAMANHOS_PAGINA, key = chave + '_tamanho' )
+    
+    ordem = ordem_selecao( None if coluna == sem_ordem else ordens( coluna, crescente ), posicoes, len( base ) )
+    
+    total = len( base ) if ordem is None else len( ordem )
+    paginas = max( 1, -( -total // tamanho ) )
+    
+    # Chave muda com a quantidade de páginas: filtro novo volta para a primeira página
+    numero = c4.number_input( 'Página:', min_value = 1, max_value = paginas, value = 1, step = 1,
+                              key = '{0}_pagina_{1}'.format( chave, paginas ) )
+    
+    st.caption( '{0} linhas - página {1} de {2}'.format( total, numero, paginas ) )
+    dados = pagina( base, ordem, numero - 1, tamanho, colunas )
     
+    st.dataframe( dados if estilo is None else estilo( dados ) )
+
+
 
 def aplic(x):
     
@@ -275,9 +368,26 @@ if __name__ == '__main__':
 ## Extract ###-------------------------------------------------------------------
 #================================================================================    
     
+    ## Instrumentação das etapas desta execução - tempos no painel da barra lateral e em linhas JSON no log
+    configurar_log()
+    
+    if 'sessao' not in st.session_state:
+        st.session_state['sessao'] = uuid.uuid4().hex[:12]
+    
+    inst = Instrumentacao( st.session_state['sessao'] )
+    
+    painel_desempenho = st.sidebar.checkbox( 'Painel de desempenho', value = False )
+    
     ## Extrair base de imóveis
     path = 'kc_house_data.csv'
-    df = get_data(path)
+    versao = get_versao( path, os.stat(path).st_mtime_ns, datetime.now().year )
+    
+    ## Servidor local de tiles dos mapas de densidade e investidos ( opcional - python tiles_hr.py servir kc_house_data.csv )
+    url_tiles = os.environ.get( 'HR_URL_TILES' )
+    
+    with inst.etapa( 'get_data' ) as reg:
+        df = get_data(path, versao)
+        reg['linhas'] = len( df )
         
     ## Extrair infomações das coordenadas das regiões por CEP de Seattle - Virá um dicionário com lista aninhada de coordenadas das regiões
     
@@ -288,20 +398,24 @@ if __name__ == '__main__':
     url = 'Zip_Codes.geojson'
     
     # Leitura dos dados 
-    geofile = get_geofile( url )
+    geofile = inst.medir( 'get_geofile', get_geofile, url )
 
 #######################################################################################   
     
-    ## Criação de Abas no layout da páginas
-    tab1, tab2, tab3, tab4 = st.tabs(["🏢 Sobre", "📈 Visão Geral", "💡 Insights", "💎 Recomendações de Investimento"]) 
+    ## Criação de Abas no layout da páginas - seleção por botões, só a aba escolhida é executada a cada rerun
+    ## ( com st.tabs o corpo das quatro abas roda sempre, mesmo mexendo só em um filtro da Visão Geral )
+    abas = ["🏢 Sobre", "📈 Visão Geral", "💡 Insights", "💎 Recomendações de Investimento"]
+    aba = st.radio( 'Navegação:', abas, horizontal = True )
 
     ## FUNC 1
-    df_clean = data_cleaning(df)
+    with inst.etapa( 'data_cleaning' ) as reg:
+        df_clean = get_data_clean(path, versao)
+        reg['linhas'] = len( df_clean )
     
     
  
     
-    with tab1:
+    if aba == abas[0]:
     
         
         st.markdown('''A House Rocket é uma empresa que realiza investimentos no mercado imobiliário. Tem por 
@@ -337,20 +451,22 @@ if __name__ == '__main__':
         
         
     
-    with tab2:
+    if aba == abas[1]:
         
         # Filtro 
         f_zip_code = st.multiselect('Selecione Código Postal:', options = df['zipcode'].sort_values().unique().tolist() )
         
         # Filtragem dos dados por zipcode 
         
+        # Posições das linhas selecionadas nas bases ( as tabelas paginadas copiam só a página mostrada )
         if (f_zip_code != []): 
-            df_raw_f = df.loc[ df['zipcode'].isin(f_zip_code) , :].reset_index(drop = True) 
-            df_clean_f = df_clean.loc[df_clean['zipcode'].isin(f_zip_code) , : ].reset_index(drop = True)
+            pos_raw = np.flatnonzero( df['zipcode'].isin(f_zip_code).to_numpy() )
+            pos_clean = consulta_indices( get_indices(path, versao), conjuntos = { 'zipcode': f_zip_code } )
        
         else:
-            df_raw_f = df.copy() ## Se tiver tudo vazio, não selecionar nada para não precisar ficar sem tabela, mostra ela completa
-            df_clean_f = df_clean.copy()
+            pos_raw = pos_clean = None ## Se tiver tudo vazio, não selecionar nada para não precisar ficar sem tabela, mostra ela completa ( sem cópia )
+        
+        df_clean_f = selecao( df_clean, pos_clean )
         
         
         ## Abrir em 3 visualizações da Visão Geral
@@ -365,35 +481,31 @@ if __name__ == '__main__':
             with see_data1:
                     
                 
-                f_colunas = st.multiselect('Selecione Atributos:', options = df_raw_f.columns.sort_values().tolist() )
+                f_colunas = st.multiselect('Selecione Atributos:', options = df.columns.sort_values().tolist(), key = 'colunas_brutos' )
                 
-                
-                if (f_colunas != []): 
-                    
-                    st.dataframe( data= df_raw_f.loc[ : , f_colunas].reset_index(drop = True) )
-               
-                else:
-                    st.dataframe( data= df_raw_f )## Se tiver tudo vazio, não selecionar nada para não precisar ficar sem tabela, mostra ela completa
+                ## Se tiver tudo vazio, mostra todas as colunas
+                tabela_paginada( df, pos_raw, lambda coluna, crescente: get_ordem( path, versao, 'bruto', coluna, crescente ),
+                                 'brutos', f_colunas or None )
                        
             ### DADOS TRATADOS
             see_data2 = st.expander('Você pode clicar aqui para ver os dados tratados 👉')
             with see_data2:  
     
-                f_colunas = st.multiselect('Selecione Atributos:', options = df_clean_f.columns.sort_values().tolist() )
-    
-    
-                if (f_colunas != []): 
-                    
-                    st.dataframe( data = df_clean_f.loc[ : , f_colunas].reset_index(drop = True) )
-       
-                else:
-                    st.dataframe( data= df_clean_f ) ## Se tiver tudo vazio, não selecionar nada para não precisar ficar sem tabela, mostra ela completa
+                f_colunas = st.multiselect('Selecione Atributos:', options = df_clean.columns.sort_values().tolist(), key = 'colunas_tratados' )
+                
+                ## Se tiver tudo vazio, mostra todas as colunas
+                tabela_paginada( df_clean, pos_clean, lambda coluna, crescente: get_ordem( path, versao, 'limpo', coluna, crescente ),
+                                 'tratados', f_colunas or None )
                     
             
             ## FUNC 2
             ### 1.TABLE ANALYSIS
             
-            m_per_zip, ed = table_metrics(df_clean_f)
+            with inst.etapa( 'table_metrics', linhas = len( df_clean_f ) ):
+                if BACKEND_AGREGACOES == 'duckdb':
+                    m_per_zip, ed = table_metrics(None, f_zip_code, get_conexao(path, versao))
+                else:
+                    m_per_zip, ed = table_metrics(get_cubo(path, versao), f_zip_code)
     
             
             # Para as tabelas ficarem lado a lado
@@ -439,7 +551,19 @@ if __name__ == '__main__':
         if tab1_viz == 'Mapas':
     
             ## FUNC 3
-            density, price_int = maps(df_clean_f, geofile)
+            # HTML dos mapas guardado em cache por filtro de código postal e versão da base
+            chave = chave_mapa( 'visao_geral', versao, zipcodes = f_zip_code )
+            
+            htmls = cache_mapas.get( chave )
+            
+            if htmls is None:
+                if f_zip_code:
+                    density, price_int = inst.medir( 'maps', maps, df_clean_f, geofile )
+                else:
+                    density, price_int = inst.medir( 'maps', maps, df_clean_f, geofile, get_grade( path, versao ), url_tiles )
+                
+                with inst.etapa( 'maps_html', linhas = len( df_clean_f ) ):
+                    htmls = cache_mapas.put( chave, ( html_mapa( density ), html_mapa( price_int ) ) )
         
             
             c4, c5 = st.columns( ( 1, 1) )
@@ -449,13 +573,13 @@ if __name__ == '__main__':
         
                 st.header('Densidade de imóveis')
                 st.markdown("Análise da distribuição dos imóveis vendidos.")
-                folium_static( density )
+                inst.medir( 'mapa_static', mapa_static, htmls[0] )
         
             with c5:
                 
                 st.header( 'Preço por área construída' )
                 st.markdown("Análise do preço por área interna habitável (em metros quadrados) médio por região.")
-                folium_static( price_int )    
+                inst.medir( 'mapa_static', mapa_static, htmls[1] )    
                 
                 
 
@@ -523,31 +647,25 @@ if __name__ == '__main__':
             
             ### FILTRAGEM DADOS------------------------------------------------------------------
 
-            ### Variáveis Condicionais
+            ### Faixas dos filtros (limites inclusivos) consultadas nos índices por coluna da base tratada,
+            ### junto com o filtro de Código Postal - retorna as posições das linhas selecionadas
             
-            # 1
-            ano_construcao = df_clean_f['yr_built'].isin( range(f_ano_construcao[0], f_ano_construcao[1] + 1) )
+            with inst.etapa( 'graficos_filtro' ) as reg:
             
-            # 2
-            disp = (df_clean_f['date'] >= f_disp[0]) & (df_clean_f['date'] <= f_disp[1])
-            
-            # 3
-            
-            price = (df_clean_f['price'] >= f_price[0]) & (df_clean_f['price'] <= f_price[1])
-            
-            # 4
-            
-            cond = df_clean_f['condition'].isin( range(f_condition[0], f_condition[1] + 1) )
-            
-            # 5
-            
-            grade = df_clean_f['grade'].isin( range(f_grade[0], f_grade[1] + 1) )
-            
-            
-            
-            ### Base de Dados sendo filtrada por todos filtros 
-
-            df_filter = df_clean_f[ (ano_construcao) & (disp) & (price) & (cond) & (grade)].reset_index( drop = True )
+                posicoes = consulta_indices( get_indices(path, versao), 
+                                             faixas = { 'yr_built': f_ano_construcao,   # 1
+                                                        'date': f_disp,                 # 2
+                                                        'price': f_price,               # 3
+                                                        'condition': f_condition,       # 4
+                                                        'grade': f_grade },             # 5
+                                             conjuntos = { 'zipcode': f_zip_code } )
+                
+                
+                
+                ### Base de Dados sendo filtrada por todos filtros ( sem cópia quando nenhum filtro restringe a base )
+    
+                df_filter = selecao( df_clean, posicoes )
+                reg['linhas'] = len( df_filter )
 
                     
             # PREPARAÇÃO DE DATASET ----------------------------------------------------------
@@ -569,7 +687,7 @@ if __name__ == '__main__':
             
             # Gráfico 3.5 Proporção de imóveis com vista pra água
             
-            im_water_grouped = df_filter.drop_duplicates(subset = 'id').loc[:,['id','waterfront']].groupby(['waterfront']).nunique().reset_index()
+            im_water_grouped = df_filter.drop_duplicates(subset = 'id').loc[:,['id','waterfront']].groupby(['waterfront'], observed = True).nunique().reset_index()
             
             # Renomeando
             
@@ -579,7 +697,7 @@ if __name__ == '__main__':
             # Gráfico 3.7 Proporção de imóveis renovados
             
             
-            im_reno_grouped = df_filter.drop_duplicates(subset = 'id').loc[:, ['id','is_renovated']].groupby(['is_renovated']).nunique().reset_index()
+            im_reno_grouped = df_filter.drop_duplicates(subset = 'id').loc[:, ['id','is_renovated']].groupby(['is_renovated'], observed = True).nunique().reset_index()
             
             
             # Renomeando
@@ -593,7 +711,7 @@ if __name__ == '__main__':
 
             
             ## PLOTAR  Gráfico 3.1 Variação Preço por ano de construção
-            fig = px.line(built_grouped, x = 'Ano Construção', y = 'Preço Médio' )
+            fig = inst.medir( 'plotly', px.line, built_grouped, x = 'Ano Construção', y = 'Preço Médio' )
             st.plotly_chart(fig, use_container_width= True)
     
 
@@ -603,7 +721,7 @@ if __name__ == '__main__':
     
 
             # PLOTAR Gráfico 3.2 Variação preço médio por data de venda do imóvel
-            fig = px.line(data_date_grouped, x = 'Data', y = 'Preço Médio' )
+            fig = inst.medir( 'plotly', px.line, data_date_grouped, x = 'Data', y = 'Preço Médio' )
             st.plotly_chart(fig, use_container_width= True) 
     
   
@@ -613,7 +731,7 @@ if __name__ == '__main__':
   
     
             # PLOTAR Gráfico 3.3 Análise de Classificação x Preço por boxplot
-            fig = px.box(df_filter.rename(columns = {'grade':'Avaliação Construção','price':'Preço'}), x = 'Avaliação Construção', y = 'Preço' )
+            fig = inst.medir( 'plotly', px.box, df_filter.rename(columns = {'grade':'Avaliação Construção','price':'Preço'}), x = 'Avaliação Construção', y = 'Preço' )
             st.plotly_chart(fig, use_container_width= True)   
             
             
@@ -625,13 +743,13 @@ if __name__ == '__main__':
   
             
             # PLOTAR Gráfico 3.4 Análise de Condição x Preço por boxplot
-            fig = px.box(df_filter.rename(columns = {'condition':'Condição','price':'Preço'}), x = 'Condição', y = 'Preço' )
+            fig = inst.medir( 'plotly', px.box, df_filter.rename(columns = {'condition':'Condição','price':'Preço'}), x = 'Condição', y = 'Preço' )
             c18.plotly_chart(fig, use_container_width= True) 
     
             c19.header( 'Proporção de imóveis com vista pra água ' )
       
             # PLOTAR Gráfico 3.5 Proporção de imóveis com vista pra água
-            fig = px.pie(im_water_grouped, names = 'Vista Água', values = 'id' )
+            fig = inst.medir( 'plotly', px.pie, im_water_grouped, names = 'Vista Água', values = 'id' )
             c19.plotly_chart(fig, use_container_width= True)
             
             c20, c21 = st.columns(( 1 , 1 ))
@@ -639,18 +757,18 @@ if __name__ == '__main__':
             c20.header( 'Quantidade de imóveis por Preço ' )
       
             # PLOTAR Gráfico 3.6 Quantidade de Imóveis por preço
-            fig = px.histogram(df_filter.rename(columns = {'price':'Preço'}), x = 'Preço' )
+            fig = inst.medir( 'plotly', px.histogram, df_filter.rename(columns = {'price':'Preço'}), x = 'Preço' )
             c20.plotly_chart(fig, use_container_width= True)
    
             c21.header( 'Proporção de imóveis reformados ' )
       
             # PLOTAR Gráfico 3.7 Proporção de imóveis renovados
-            fig = px.pie(im_reno_grouped, names = 'Renovado', values = 'id' )
+            fig = inst.medir( 'plotly', px.pie, im_reno_grouped, names = 'Renovado', values = 'id' )
             c21.plotly_chart(fig, use_container_width= True)
    
 
 
-    with tab3:
+    if aba == abas[2]:
    
         st.header("5 principais insights:")
    
@@ -666,25 +784,9 @@ if __name__ == '__main__':
 
         #### TABELA com comparativo de resultados:
 
-        # Preparação:
-            
-        # Criando dataframa Series para médias de amostras com boas condições e baixas condições   
-        im_price_high_cond = df_clean.loc[df['condition'] >= 3 , ['price','price_per_m2_living','price_per_m2_living_outside','m2_living','m2_outside']].mean()
-        im_price_low_cond = df_clean.loc[df['condition'] < 3 , ['price','price_per_m2_living','price_per_m2_living_outside','m2_living','m2_outside']].mean()
-
-
-        ## Passando cada Serie para DataFrame 
-        im_price_high_cond = pd.DataFrame(im_price_high_cond)
-        im_price_low_cond = pd.DataFrame(im_price_low_cond)
-
-        
-        ## Unindo as duas colunas de informações similares
-        price_per_condition = pd.concat([im_price_high_cond,im_price_low_cond], axis = 1)
-
-        
-        # Definindo nome das colunas da Tabela de Comparação
-        price_per_condition.columns = ['Condições Boas','Condições Ruins']
-        price_per_condition.index = ['Preço Médio','Preço / área construída (m2) Médio', 'Preço / área construída + externa (m2) Médio','Área Construída (m2) Média', 'Área Externa (m2) Média']
+        # Preparação: tabelas das hipóteses H1 a H5, lidas do artefato da versão da base
+        with inst.etapa( 'hipoteses' ):
+            hipoteses = get_hipoteses(path, versao)
 
 
         # Apresentação na tela:
@@ -695,22 +797,15 @@ if __name__ == '__main__':
         
         c22.markdown("Assumindo que imóveis com boas condições de infraestrutura possuem nota de no mínimo 3.")
 
-        c22.dataframe( price_per_condition )
-
-        #### GRÁFICO com comparativo de resultados:
-
-        ## Transpondo a tabela 
-        price_per_condition = price_per_condition.T.reset_index() 
-        
-        ## Dando nome para coluna de valores que eram coluna 
-        price_per_condition.rename(columns = {'index':'Condição'},inplace = True) 
+        c22.dataframe( hipoteses['condicao'] )
 
+        #### GRÁFICO com comparativo de resultados ( tabela já transposta no artefato, uma coluna por atributo ):
 
         ## Filtro para selecionar variável a aparecer no gráfico 
         option = c23.selectbox('Compare os atributos:', ('Preço Médio','Preço / área construída (m2) Médio', 'Preço / área construída + externa (m2) Médio','Área Construída (m2) Média', 'Área Externa (m2) Média'))
 
         ## Plotar gráficos 
-        fig = px.bar(price_per_condition, x = 'Condição' , y = option)
+        fig = inst.medir( 'plotly', px.bar, hipoteses['condicao_grafico'], x = 'Condição' , y = option)
         c23.plotly_chart(fig, use_container_width= True)        
 
         st.markdown('''**Conclusão:** Hipótese **FALSA**''') 
@@ -733,17 +828,7 @@ if __name__ == '__main__':
                        dos imóveis com mais de 50 anos na base de dados.''') 
 
 
-        # Preparação:
-  
-        #### TABELA com comparativo de resultados:
-        df_price_renovated = df_clean.loc[ df_clean['age']>= 50 , ['price','price_per_m2_living','m2_living','is_renovated']].groupby('is_renovated').mean().reset_index()
-
-        # Renomeando valores na coluna
-        df_price_renovated['is_renovated'].replace( {'Yes':'Sim','No': 'Não'}, inplace = True )
-        
-        # Definindo nome das colunas da Tabela de Comparação
-        df_price_renovated.columns = ['Renovado','Preço Médio','Preço / área construída (m2) Médio', 'Área Construída (m2) Média']
-        
+        #### TABELA com comparativo de resultados ( hipoteses['reforma'], ver metricas_hr.tabelas_agregados_hipoteses )
         
         # Apresentação na tela:
         c24, c25 = st.columns((1 , 1))
@@ -753,7 +838,7 @@ if __name__ == '__main__':
         
         #c22.markdown("Assumindo que imóveis com boas condições de infraestrutura possuem nota de no mínimo 3.")
 
-        c24.dataframe( df_price_renovated )
+        c24.dataframe( hipoteses['reforma'] )
 
         #### GRÁFICO com comparativo de resultados:           
             
@@ -761,7 +846,7 @@ if __name__ == '__main__':
         option2 = c25.selectbox('Compare os atributos:', ('Preço Médio','Preço / área construída (m2) Médio', 'Área Construída (m2) Média'))
 
         ## Plotar gráficos 
-        fig = px.bar( df_price_renovated , x = 'Renovado' , y = option2)
+        fig = inst.medir( 'plotly', px.bar, hipoteses['reforma'] , x = 'Renovado' , y = option2)
         c25.plotly_chart(fig, use_container_width= True)   
         
 
@@ -779,17 +864,7 @@ if __name__ == '__main__':
 
         st.markdown('''**Cenário:** Imóveis com vista para a água representam 0,7% dos imóveis na base de dados.''') 
 
-        # Preparação:
-  
-        #### TABELA com comparativo de resultados:
-        df_price_waterfront = df_clean[['price', 'price_per_m2_living','price_per_m2_living_outside','m2_living','m2_outside','waterfront']].groupby('waterfront').mean().reset_index()
-
-        # Renomeando valores na coluna
-        df_price_waterfront['waterfront'].replace( {'Yes':'Sim','No': 'Não'}, inplace = True )
-        
-        # Definindo nome das colunas da Tabela de Comparação
-        df_price_waterfront.columns = ['Vista Água','Preço Médio','Preço / área construída (m2) Médio', 'Preço / área construída + externa (m2) Médio','Área Construída (m2) Média','Área Externa (m2) Média']
-        
+        #### TABELA com comparativo de resultados ( hipoteses['vista_agua'], ver metricas_hr.tabelas_agregados_hipoteses )
         
         # Apresentação na tela:
         c26, c27 = st.columns((1 , 1))
@@ -799,7 +874,7 @@ if __name__ == '__main__':
         
         #c22.markdown("Assumindo que imóveis com boas condições de infraestrutura possuem nota de no mínimo 3.")
 
-        c26.dataframe( df_price_waterfront )
+        c26.dataframe( hipoteses['vista_agua'] )
 
         #### GRÁFICO com comparativo de resultados:           
             
@@ -807,7 +882,7 @@ if __name__ == '__main__':
         option3 = c27.selectbox('Compare:', ('Preço Médio','Preço / área construída (m2) Médio', 'Preço / área construída + externa (m2) Médio','Área Construída (m2) Média','Área Externa (m2) Média'))
 
         ## Plotar gráficos 
-        fig = px.bar( df_price_waterfront , x = 'Vista Água' , y = option3)
+        fig = inst.medir( 'plotly', px.bar, hipoteses['vista_agua'] , x = 'Vista Água' , y = option3)
         c27.plotly_chart(fig, use_container_width= True)   
 
 
@@ -832,27 +907,7 @@ if __name__ == '__main__':
         st.markdown('''**Cenário:** Imóveis com data de construção menor que 1955 representam 28,4% dos imóveis 
                     listados na base de dados.''') 
 
-        #### TABELA com comparativo de resultados:
-
-        # Preparação:
-            
-        # Criando dataframa Series para imoveis com ano de construção menores que 1955 e maiores   
-        df1 = df_clean.loc[df['yr_built'] < 1955, ['price','price_per_m2_living','price_per_m2_living_outside','m2_living','m2_outside']].mean()
-        df2 = df_clean.loc[df['yr_built'] >= 1955, ['price','price_per_m2_living','price_per_m2_living_outside','m2_living','m2_outside']].mean()
-
-
-        ## Passando cada Serie para DataFrame 
-        df1 = pd.DataFrame(df1)
-        df2= pd.DataFrame(df2)
-
-        
-        ## Unindo as duas colunas de informações similares
-        df3 = pd.concat([df1, df2], axis = 1)
-
-        
-        # Definindo nome das colunas da Tabela de Comparação
-        df3.columns = ['Antigos','Novos']
-        df3.index = ['Preço Médio','Preço / área construída (m2) Médio', 'Preço / área construída + externa (m2) Médio','Área Construída (m2) Média', 'Área Externa (m2) Média']
+        #### TABELA com comparativo de resultados ( hipoteses['ano_construcao'], ver metricas_hr.tabelas_agregados_hipoteses )
 
 
         # Apresentação na tela:
@@ -863,22 +918,15 @@ if __name__ == '__main__':
         
         c28.markdown("Assumindo que imóveis antigos são imóveis com data de construção menor que 1955.")
 
-        c28.dataframe( df3 )
-
-        #### GRÁFICO com comparativo de resultados:
-
-        ## Transpondo a tabela 
-        df3 = df3.T.reset_index() 
-        
-        ## Dando nome para coluna de valores que eram coluna 
-        df3.rename(columns = {'index':'1955'},inplace = True) 
+        c28.dataframe( hipoteses['ano_construcao'] )
 
+        #### GRÁFICO com comparativo de resultados ( tabela já transposta no artefato ):
 
         ## Filtro para selecionar variável a aparecer no gráfico 
         option4 = c29.selectbox('Atributos:', ('Preço Médio','Preço / área construída (m2) Médio', 'Preço / área construída + externa (m2) Médio','Área Construída (m2) Média', 'Área Externa (m2) Média'))
 
         ## Plotar gráficos 
-        fig = px.bar(df3, x = '1955' , y = option4)
+        fig = inst.medir( 'plotly', px.bar, hipoteses['ano_construcao_grafico'], x = '1955' , y = option4)
         c29.plotly_chart(fig, use_container_width= True)        
 
         st.markdown('''**Conclusão:** Hipótese **FALSA**''') 
@@ -910,11 +958,10 @@ if __name__ == '__main__':
         c30.markdown("**Desenvolvimento:**")
 
 
-        #### GRÁFICO com comparativo de resultados:
+        #### GRÁFICO com comparativo de resultados ( vendas por estação já contadas no artefato ):
 
         ## Plotar gráficos 
-        fig = px.histogram(df_clean, x = 'seasons' , title = "Vendas por estação", labels={
-                            'count': 'Quantidade', 'seasons': 'Estação'})
+        fig = inst.medir( 'plotly', px.bar, hipoteses['estacoes'], x = 'Estação', y = 'Quantidade', title = "Vendas por estação" )
         
         c30.plotly_chart(fig, use_container_width= True)        
 
@@ -924,55 +971,23 @@ if __name__ == '__main__':
  - 59% dos imóveis vendidos ocorrem no verão ou primavera.''') 
 
 
-    with tab4:
+    if aba == abas[3]:
 
         ### 1. PREPARAÇÃO BASE DE DADOS
         
         ## 1.1. Análise de Compra
         
-        # Calculo do preço mediano por metro quadrado por região
-        df_median_price_m2 = df_clean.drop_duplicates(subset = 'id').loc[:,['zipcode','price_per_m2_living']].groupby('zipcode').median().reset_index()
-        
-        # Renomear a coluna
-        df_median_price_m2.columns = ['zipcode','target_buy']
-        
-        # Merge com a base de dados geral
-        df_compra = df_clean.merge(df_median_price_m2, how = 'left', on = 'zipcode').copy()
+        # Balizadores por região/estação e status de compra de cada imóvel ( calculados uma vez por versão da base )
+        with inst.etapa( 'recomendacoes' ) as reg:
+            agregados, df_compra = get_recomendacoes(path, versao)
+            reg['linhas'] = len( df_compra )
         
-        ## Aplica fórmula para análise dos imóveis a serem comprados
-        df_compra['status'] = df_compra.apply(compra_house, axis = 1)
-
-        ## Ajuste final base de dados de compra - Ordeno pela data mais recente de imóveis e excluo os antigos e colunas desejadas
-        df_compra = df_compra.sort_values(by = ['id','date'], ascending = False).drop_duplicates(subset = 'id', keep = 'first', ignore_index = True)
-
         ## 1.2 Análise de Venda
         
-        # Calculo da mediana do preço por metro quadrado de área construída por região por estação - Balizador de regra de preço de venda 
-        df_mp_zip_sea = df_clean[['zipcode','price_per_m2_living','seasons']].groupby(['zipcode','seasons']).median().reset_index()
-        
-        # Renomeando colunas de analise preço balizador para venda
-        df_mp_zip_sea.columns = ['zipcode','seasons','median_venda']
-        
-        # Calculo da media de classificação da qualidade de construção por região - Balizador de regra de preço de venda 
-        df_zip_grade = df_compra.loc[:, ['zipcode','grade']].groupby(['zipcode']).mean().reset_index()
-        
-        # Renomeando colunas 
-        df_zip_grade.columns = ['zipcode','mean_grade_per_zip']
-        
-        # Unir ao dataset completo valores calculados para contribuir para estimar preço de venda
-        df_compra_venda = df_compra.merge(df_mp_zip_sea, how = 'left', on = ['zipcode','seasons']).merge(df_zip_grade, how = 'left', on = 'zipcode').copy()
-        
-        ## Filtrar apenas imóveis que foram comprados e dropar a coluna status
-        df_compra_venda = df_compra_venda.loc[df_compra_venda['status'] == 'Compra',:].drop(columns = 'status').reset_index( drop = True )
-        
-        ## Aplica regras de negócio para estimar preço de venda 
-        df_compra_venda['price_venda'] = df_compra_venda.apply(venda_house, axis = 1)
-        
-        ## Calcula lucro dos imóveis negociados
-        df_compra_venda['lucro'] = df_compra_venda['price_venda'] - df_compra_venda['price']
-        
-        ## Calcula ROI dos imóveis negociados
-        df_compra_venda['roi'] = (df_compra_venda['lucro'] / df_compra_venda['price']) * 100
+        # Preço de venda estimado, lucro e ROI (arredondado) dos imóveis recomendados para compra - também uma vez por versão
+        with inst.etapa( 'compra_venda' ) as reg:
+            df_compra_venda = get_compra_venda(path, versao)
+            reg['linhas'] = len( df_compra_venda )
         
         ### 2. APRESENTAÇÃO BASE DE DADOS
         
@@ -984,24 +999,12 @@ if __name__ == '__main__':
         with see_data3:
                 
             
-            # Trocar nomes das colunas 
-            
-            df_compra.rename(columns = {'zipcode':'Código Postal','price':'Preço',
-                                        'price_per_m2_living':'Preço/m2 construído','target_buy':'Balizador Compra',
-                                        'condition':'Condição','grade':'Avaliação Construção','age':'Idade',
-                                        'is_renovated':'Reformado'}, inplace = True)
-            
-            
-            # Trocar valores das colunas
-            
-            df_compra['Reformado'].replace({'No':'Não','Yes':'Sim'}, inplace = True)
-            
+            # Trocar nomes das colunas ( uma linha por imóvel, barato perto do resto da aba )
+            tabela = tabela_compra( df_compra )
             
-            # Tabela 
-            #st.dataframe(df_compra)
-            st.dataframe(df_compra[['id','status','Código Postal','Preço','Preço/m2 construído',
-                                    'Balizador Compra','Condição','Avaliação Construção','Idade',
-                                    'Reformado']].style.applymap( aplic, subset = 'status'))
+            # Só a página (ou os N primeiros numa ordem) é estilizada e vai para o navegador
+            tabela_paginada( tabela, None, lambda coluna, crescente: ordem_coluna( tabela, coluna, crescente ),
+                             'compra', estilo = lambda dados: dados.style.applymap( aplic, subset = 'status' ) )
             
             
                                                                                                                    
@@ -1010,10 +1013,6 @@ if __name__ == '__main__':
         ### 2.2 Filtros e Indicadores
         
         
-        ## Arredondar o roi 
-        df_compra_venda["roi"] = df_compra_venda["roi"].round(2)
-               
-                   
         c32, c33, c34, c35, c36 = st.columns((1,1,1,1,1))
         
         ### Valor de ROI desejado para o investimento       
@@ -1055,7 +1054,9 @@ if __name__ == '__main__':
                                               'is_renovated':'Reformado','median_venda': 'Balizador Venda',
                                               'mean_grade_per_zip':'Média Avaliação por Código Postal', 
                                               'price_venda':'Preço Venda estimado', 'lucro':'Lucro estimado',
-                                              'roi':'ROI estimado', 'm2_living':'Área construída(m2)'}, inplace = True)
+                                              'roi':'ROI estimado', 'm2_living':'Área construída(m2)',
+                                              'price_comparaveis':'Preço por comparáveis',
+                                              'n_comparaveis':'Comparáveis'}, inplace = True)
             
             
             # Trocar valores das colunas
@@ -1070,62 +1071,23 @@ if __name__ == '__main__':
             st.dataframe(df_compra_venda[['id','Código Postal','Preço Compra','Preço/m2 construído', 'Área construída(m2)',
                                     'Condição','Avaliação Construção','Reformado','Estação', 'Balizador Venda',
                                     'Média Avaliação por Código Postal','Preço Venda estimado',
+                                    'Preço por comparáveis','Comparáveis',
                                     'Lucro estimado','ROI estimado']])
             
             
-            # Plotar mapa de calor - Lucro médio por região com os investimentos estimados
-            
-            ## Preparação Mapas
-            
-            data_map = df_compra_venda[['Lucro estimado','Código Postal']].groupby( ['Código Postal'] ).mean().reset_index() 
-    
-            data_map.columns = ['ZIP', 'LUCRO']
-        
-    
-            # Filtrar do arquivo com as coordenadas de regiões totais apenas as regiões de amostra que peguei para analisar preço médio no dataset 
-            # para depois não acabar ficando regiões sem dado de preço médio
-            geofile = geofile[geofile['ZIP'].isin( data_map['ZIP'].tolist() )]
-    
-            # Mapa Base - Folium - é apenas o mapa sem pontos
-            region_lucro = folium.Map( location= [df_clean['lat'].mean(), df_clean['long'].mean() ], 
-                                       default_zoom_start=15 )
-    
-    
-            folium.Choropleth( data = data_map, geo_data = geofile, columns=['ZIP', 'LUCRO'],
-                                 key_on='feature.properties.ZIP', fill_color='YlOrRd',
-                                 fill_opacity = 0.7, line_opacity = 0.2,
-                                 legend_name='MÉDIA LUCRO' ).add_to(region_lucro)
-            
+            # HTML dos mapas guardado em cache pela faixa de ROI e versão da base
+            chave = chave_mapa( 'investidos', versao, roi = f_roi )
             
+            htmls = cache_mapas.get( chave )
             
-            # Preparação mapa Distribuição/Densidade dos imóveis investidos
-            
-            #data_map = df.sample( 10 ) # Pegar apenas 10 amostras de imóveis
-    
-            # Mapa Base - Folium - é apenas o mapa sem pontos
-            density_map_compra = folium.Map( location=[df_clean['lat'].mean(), df_clean['long'].mean() ], 
-                                             default_zoom_start=15 )
-    
-    
-            # Instanciando objeto para inserir os dados de imóveis no mapa, os pontos
-            marker_cluster = MarkerCluster().add_to( density_map_compra )
-    
-            # Inserção dos pontos imóveis no mapa transformando dataframe com dados em iterativo para usar o for com estruturas dataframe
-            # row = linha -> imóveis/amostra/observação distinta
-            # popup = descrição ao passar o mouse sobre os pontos
-            for name, row in df_compra_venda.iterrows():
-        
-                folium.Marker( [row['lat'], row['long'] ], popup='''Preço estimado de venda: ${0:.2f}, 
-                                                                    Lucro: ${1:.2f}, ROI: {2:.2f}%.                                                                     
-                                                                  Características: {3:.2f} m2 de área construída, 
-                                                                  {4} quartos,{5} banheiros, 
-                                                                  ano construção: {6}.'''.format( row['Preço Venda estimado'],
-                                                                                                  row['Lucro estimado'],
-                                                                                                  row['ROI estimado'],
-                                                                                                  row['Área construída(m2)'],
-                                                                                                  row['bedrooms'],
-                                                                                                  row['bathrooms'],
-                                                                                                  row['yr_built'] ) ).add_to( marker_cluster )
+            if htmls is None:
+                # Tiles só na faixa de ROI completa - os tiles têm todos os imóveis investidos
+                tiles_investidos = url_tiles if tuple( f_roi ) == ( min_roi, max_roi ) else None
+                region_lucro, density_map_compra = inst.medir( 'maps_investidos', maps_investidos, df_compra_venda, df_clean, geofile,
+                                                               tiles_investidos )
+                
+                with inst.etapa( 'maps_html', linhas = len( df_compra_venda ) ):
+                    htmls = cache_mapas.put( chave, ( html_mapa( region_lucro ), html_mapa( density_map_compra ) ) )
             
             
             
@@ -1140,7 +1102,7 @@ if __name__ == '__main__':
             
             
                 st.header( 'Lucro médio por região' )
-                folium_static( region_lucro ) 
+                inst.medir( 'mapa_static', mapa_static, htmls[0] ) 
 
        
             with c33:
@@ -1148,7 +1110,21 @@ if __name__ == '__main__':
                 # Plotar mapa Distribuição/Densidade dos imóveis investidos 
                 
                 st.header( 'Imóveis investidos' )
-                folium_static(density_map_compra) 
+                inst.medir( 'mapa_static', mapa_static, htmls[1] ) 
+
+
+    ## Painel de desempenho: etapas medidas nesta execução ( também emitidas como JSON no log )
+    if painel_desempenho:
+        
+        st.sidebar.subheader( 'Desempenho' )
+        st.sidebar.markdown( 'Execução {0} ( {1} ): {2:.3f} s no total, {3:.3f} s nas etapas medidas'.format(
+                             inst.execucao, aba, inst.tempo_execucao(), inst.tempo_total() ) )
+        st.sidebar.dataframe( inst.resumo() )
+        st.sidebar.dataframe( inst.tabela() )
+        st.sidebar.json( cache_mapas.info() )
+    
+    ## Latência do rerun ( da primeira linha do script até aqui ) por aba
+    inst.finalizar( aba = aba )
 
 
 
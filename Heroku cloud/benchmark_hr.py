@@ -0,0 +1,498 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks do projeto House Rocket.
+
+Uso: python benchmark_hr.py marcadores --tamanhos 20000 200000 2000000
+     python benchmark_hr.py etapas --fatores 1 10 --saida etapas.json
+     python benchmark_hr.py etapas --fatores 1 10 --repeticoes 3 --saida benchmark_baseline.json --baseline ''   ( novo baseline )
+     python benchmark_hr.py memoria --float32
+     python benchmark_hr.py tabela_compra --tamanhos 20000 200000 2000000 --linhas-pagina 100
+
+O benchmark de etapas mede tempo e memória de cada etapa do pipeline em bases com 1x, 10x, 100x...
+o tamanho de kc_house_data.csv e compara com o baseline gravado no repositório ( benchmark_baseline.json,
+fatores 1 e 10 ). A memória vem de três medidas: pico do tracemalloc ( objetos Python/NumPy ), pico da
+memória residente do processo durante a etapa ( RSS amostrado, inclui buffers do Arrow e páginas dos
+snapshots em memory map ) e memória do pool do Arrow retida no fim da etapa.
+"""
+
+## Libraries ###-------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import folium
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from folium.plugins import MarkerCluster
+
+from dados_hr import (carregar_dados, carregar_dados_limpos, caminho_snapshot, data_cleaning, indices_colunas, consulta_indices,
+                      relatorio_memoria, ordem_coluna, pagina)
+from mapas_hr import (marcadores_cluster, COLUNAS_POPUP_DENSIDADE, POPUP_DENSIDADE, agregar_grade, camada_grade,
+                      carregar_geometrias, geojson_zipcodes, enquadramento_regioes, html_mapa)
+from metricas_hr import cubo_zipcode, metricas_por_regiao, estatistica_descritiva
+from recomendacoes_hr import recomendacoes, calcular_compra_venda, tabela_compra
+from instrumentacao_hr import rss_atual
+
+
+## Configuração ###----------------------------------------------------------------
+
+# Aumento (fração) de tempo ou de pico de memória em relação ao baseline considerado regressão
+TOLERANCIA_REGRESSAO = 0.25
+
+# Etapas abaixo desse tempo (s) não são comparadas por tempo - variação de medição domina
+TEMPO_MINIMO_COMPARACAO = 0.05
+
+# Picos de RSS abaixo desse tamanho (bytes) não são comparados - reaproveitamento de memória pelo alocador domina
+RSS_MINIMO_COMPARACAO = 16 * 1024 * 1024
+
+# Intervalo (s) de amostragem do RSS durante uma etapa
+INTERVALO_RSS = 0.005
+
+# Baseline de referência do benchmark de etapas ( gravado com --fatores 1 10 )
+BASELINE_ETAPAS = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), 'benchmark_baseline.json' )
+
+
+## Functions ###-------------------------------------------------------------------------------------
+
+# Base tratada reamostrada para n linhas, com pequeno ruído nas coordenadas para não repetir pontos
+def base_escalada(df, n, seed = 42):
+
+    rng = np.random.default_rng( seed )
+
+    base = df.iloc[ rng.integers( 0, len(df), n ) ].reset_index( drop = True )
+    base['lat'] = base['lat'] + rng.normal( 0, 0.001, n )
+    base['long'] = base['long'] + rng.normal( 0, 0.001, n )
+
+    return base
+
+
+
+# Versão antiga do mapa de densidade: um folium.Marker com popup formatado em Python por imóvel
+def mapa_iterrows(df):
+
+    mapa = folium.Map( location = [df['lat'].mean(), df['long'].mean()], default_zoom_start = 15 )
+    marker_cluster = MarkerCluster().add_to( mapa )
+
+    for name, row in df.iterrows():
+
+        folium.Marker( [row['lat'], row['long'] ], popup='''Vendido por ${0} em: {1}. Características: {2} m2 de área construída,
+                                                          {3} quartos,{4} banheiros, ano construção: {5}'''.format( row['price'],
+                                                                                                                     row['date_str'],
+                                                                                                                     row['m2_living'],
+                                                                                                                     row['bedrooms'],
+                                                                                                                     row['bathrooms'],
+                                                                                                                     row['yr_built'] ) ).add_to( marker_cluster )
+
+    return mapa
+
+
+
+# Versão nova: marcadores criados no navegador a partir de arrays compactos
+def mapa_rapido(df):
+
+    mapa = folium.Map( location = [df['lat'].mean(), df['long'].mean()], default_zoom_start = 15 )
+    marcadores_cluster( mapa, df, COLUNAS_POPUP_DENSIDADE, POPUP_DENSIDADE )
+
+    return mapa
+
+
+
+# Versão atual do mapa de densidade: células agregadas em alguns níveis de zoom ( tamanho não depende dos imóveis )
+def mapa_grade(df):
+
+    mapa = folium.Map( location = [df['lat'].mean(), df['long'].mean()], default_zoom_start = 15 )
+    camada_grade( mapa, agregar_grade( df ) )
+
+    return mapa
+
+
+
+# Tempo para montar o mapa, tempo para gerar o HTML e tamanho do HTML (bytes) enviado ao navegador
+def medir_mapa(funcao, df):
+
+    t0 = time.perf_counter()
+    mapa = funcao( df )
+    t1 = time.perf_counter()
+    html = mapa.get_root().render()
+    t2 = time.perf_counter()
+
+    return { 'build_s': round( t1 - t0, 4 ), 'render_s': round( t2 - t1, 4 ),
+             'payload_bytes': len( html.encode( 'utf-8' ) ) }
+
+
+
+# Compara os modos do mapa de densidade para cada tamanho de base - o modo antigo é pulado acima de max_iterrows
+def benchmark_marcadores(path, tamanhos, max_iterrows = 200000):
+
+    df_clean = carregar_dados_limpos( path )
+
+    resultados = []
+    for n in tamanhos:
+
+        df = base_escalada( df_clean, n )
+
+        resultado = { 'linhas': n, 'grade': medir_mapa( mapa_grade, df ), 'rapido': medir_mapa( mapa_rapido, df ), 'iterrows': None }
+
+        if n <= max_iterrows:
+            resultado['iterrows'] = medir_mapa( mapa_iterrows, df )
+
+        print( json.dumps( resultado ) )
+        resultados.append( resultado )
+
+    return resultados
+
+
+
+## Etapas do pipeline ###-----------------------------------------------------------------------------
+
+# Base bruta repetida fator vezes: ids deslocados (cada cópia são imóveis novos, com as mesmas vendas repetidas)
+# e pequeno ruído nas coordenadas
+def base_bruta_escalada(df_bruto, fator, seed = 42):
+
+    if fator == 1:
+        return df_bruto.copy()
+
+    rng = np.random.default_rng( seed )
+
+    base = pd.concat( [df_bruto] * fator, ignore_index = True )
+    copia = np.repeat( np.arange( fator, dtype = 'int64' ), len( df_bruto ) )
+
+    base['id'] = base['id'] + copia * 10 ** 10
+    base['lat'] = base['lat'] + np.where( copia > 0, rng.normal( 0, 0.001, len( base ) ), 0 )
+    base['long'] = base['long'] + np.where( copia > 0, rng.normal( 0, 0.001, len( base ) ), 0 )
+
+    return base
+
+
+
+# Pico do RSS do processo acima do valor inicial, amostrado numa thread enquanto funcao() roda ( None fora do Linux )
+def pico_rss_execucao(funcao):
+
+    inicio = rss_atual()
+    if inicio is None:
+        funcao()
+        return None
+
+    pico = [inicio]
+    fim = threading.Event()
+
+    def amostrar():
+        while not fim.wait( INTERVALO_RSS ):
+            pico[0] = max( pico[0], rss_atual() )
+
+    amostrador = threading.Thread( target = amostrar, daemon = True )
+    amostrador.start()
+
+    try:
+        funcao()
+    finally:
+        fim.set()
+        amostrador.join()
+
+    return max( pico[0], rss_atual() ) - inicio
+
+
+
+# Tempo (menor de n repetições) e memória em execuções separadas, para não distorcer o tempo: pico alocado em
+# Python/NumPy ( tracemalloc ), pico do RSS ( vê também Arrow e memory map ) e bytes do pool do Arrow retidos no fim
+# - preparar() roda antes de cada execução, fora da medição
+def medir_etapa(funcao, repeticoes = 1, preparar = None, memoria = True):
+
+    tempos = []
+    for _ in range( repeticoes ):
+
+        if preparar:
+            preparar()
+
+        t0 = time.perf_counter()
+        funcao()
+        tempos.append( time.perf_counter() - t0 )
+
+    resultado = { 'tempo_s': round( min( tempos ), 4 ), 'pico_memoria_bytes': None, 'pico_rss_bytes': None,
+                  'arrow_retido_bytes': None }
+
+    if memoria:
+
+        if preparar:
+            preparar()
+
+        tracemalloc.start()
+        funcao()
+        resultado['pico_memoria_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        if preparar:
+            preparar()
+
+        arrow_antes = pa.total_allocated_bytes()
+        resultado['pico_rss_bytes'] = pico_rss_execucao( funcao )
+        resultado['arrow_retido_bytes'] = pa.total_allocated_bytes() - arrow_antes
+
+    return resultado
+
+
+
+# Mapas da Visão Geral como na aplicação: densidade de imóveis e preço/m2 médio por região (se houver geometrias)
+def mapas_visao_geral(df, geometrias = None):
+
+    density_map = folium.Map( location = [df['lat'].mean(), df['long'].mean()], default_zoom_start = 15 )
+    camada_grade( density_map, agregar_grade( df ) )
+
+    htmls = [ html_mapa( density_map ) ]
+
+    if geometrias is not None:
+
+        data_map = df[['price_per_m2_living','zipcode']].groupby( ['zipcode'] ).mean().reset_index()
+        data_map.columns = ['ZIP', 'PRICE']
+
+        centro, zoom = enquadramento_regioes( geometrias, data_map['ZIP'].tolist() )
+
+        region_map = folium.Map( location = centro or [df['lat'].mean(), df['long'].mean()], zoom_start = zoom )
+        folium.Choropleth( data = data_map, geo_data = geojson_zipcodes( geometrias, data_map['ZIP'].tolist(), zoom ),
+                           columns = ['ZIP', 'PRICE'], key_on = 'feature.properties.ZIP', fill_color = 'YlOrRd',
+                           fill_opacity = 0.7, line_opacity = 0.2, legend_name = 'PREÇO/ÁREA CONSTRUÍDA MÉDIO' ).add_to( region_map )
+
+        htmls.append( html_mapa( region_map ) )
+
+    return htmls
+
+
+
+# Mede cada etapa em uma base com o .csv gravado em pasta: leitura (get_data), tratamento, tabelas, mapas,
+# compra/venda (aba 4) e o filtro da visão Gráficos
+def benchmark_etapas_base(path, geometrias = None, repeticoes = 1, memoria = True):
+
+    snapshot_bruto = caminho_snapshot( path, 'bruto' )
+
+    def sem_snapshot():
+        if os.path.exists( snapshot_bruto ):
+            os.remove( snapshot_bruto )
+
+    df_bruto = carregar_dados( path )
+    df_clean = carregar_dados_limpos( path )
+    cubo = cubo_zipcode( df_clean )
+    indices = indices_colunas( df_clean )
+    agregados, df_compra = recomendacoes( df_clean )
+
+    # Filtro típico da visão Gráficos: faixas no meio de cada coluna e alguns códigos postais
+    zipcodes = sorted( df_clean['zipcode'].unique().tolist() )[:10]
+    faixas = { 'yr_built': (1950, 2000), 'date': (pd.Timestamp(2014, 8, 1), pd.Timestamp(2015, 3, 1)),
+               'price': (200000, 900000), 'condition': (3, 5), 'grade': (6, 10) }
+
+    def filtro_graficos():
+        posicoes = consulta_indices( indices, faixas = faixas, conjuntos = { 'zipcode': zipcodes } )
+        return df_clean if posicoes is None else df_clean.take( posicoes ).reset_index( drop = True )
+
+    etapas = {
+        'get_data_csv': ( lambda: carregar_dados( path ), sem_snapshot ),
+        'get_data_snapshot': ( lambda: carregar_dados( path ), None ),
+        'data_cleaning': ( lambda: data_cleaning( df_bruto.copy() ), None ),
+        'cubo_zipcode': ( lambda: cubo_zipcode( df_clean ), None ),
+        'table_metrics': ( lambda: ( metricas_por_regiao( cubo, [] ), estatistica_descritiva( cubo, [] ) ), None ),
+        'maps': ( lambda: mapas_visao_geral( df_clean, geometrias ), None ),
+        'compra_venda': ( lambda: calcular_compra_venda( *recomendacoes( df_clean )[::-1] ), None ),
+        'indices_graficos': ( lambda: indices_colunas( df_clean ), None ),
+        'filtro_graficos': ( filtro_graficos, None ) }
+
+    resultados = {}
+    for nome, (funcao, preparar) in etapas.items():
+        resultados[nome] = medir_etapa( funcao, repeticoes, preparar, memoria )
+
+    # Garante o snapshot da base bruta de volta para quem usar a pasta depois
+    carregar_dados( path )
+
+    return { 'linhas': len( df_bruto ), 'etapas': resultados }
+
+
+
+# Roda as etapas para cada fator de escala (bases gravadas em uma pasta temporária, apagada no fim)
+def benchmark_etapas(path, fatores, geojson = None, repeticoes = 1, memoria = True, pasta = None):
+
+    geometrias = carregar_geometrias( geojson ) if geojson else None
+    df_bruto = pd.read_csv( path )
+
+    pasta_tmp = pasta or tempfile.mkdtemp( prefix = 'benchmark_hr_' )
+    os.makedirs( pasta_tmp, exist_ok = True )
+
+    resultados = []
+    try:
+        for fator in fatores:
+
+            path_base = os.path.join( pasta_tmp, 'base_{0}x.csv'.format( fator ) )
+            base_bruta_escalada( df_bruto, fator ).to_csv( path_base, index = False )
+
+            resultado = { 'fator': fator, **benchmark_etapas_base( path_base, geometrias, repeticoes, memoria ) }
+
+            print( json.dumps( resultado ) )
+            resultados.append( resultado )
+    finally:
+        if pasta is None:
+            shutil.rmtree( pasta_tmp, ignore_errors = True )
+
+    return { 'dados': os.path.basename( path ), 'mapas_regiao': geometrias is not None, 'resultados': resultados,
+             'ambiente': { 'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+                           'plataforma': platform.platform(), 'cpus': os.cpu_count() } }
+
+
+
+# Compara com o baseline (mesmo fator e etapa): regressão quando tempo ou pico de memória passam da tolerância
+def comparar_baseline(atual, baseline, tolerancia = TOLERANCIA_REGRESSAO):
+
+    anteriores = { (r['fator'], etapa): medida for r in baseline['resultados'] for etapa, medida in r['etapas'].items() }
+
+    regressoes = []
+    for r in atual['resultados']:
+        for etapa, medida in r['etapas'].items():
+
+            anterior = anteriores.get( (r['fator'], etapa) )
+            if anterior is None:
+                continue
+
+            for campo in ('tempo_s', 'pico_memoria_bytes', 'pico_rss_bytes'):
+
+                novo, antigo = medida.get( campo ), anterior.get( campo )
+                if not novo or not antigo:
+                    continue
+
+                if campo == 'tempo_s' and max( novo, antigo ) < TEMPO_MINIMO_COMPARACAO:
+                    continue
+
+                if campo == 'pico_rss_bytes' and max( novo, antigo ) < RSS_MINIMO_COMPARACAO:
+                    continue
+
+                if novo > antigo * ( 1 + tolerancia ):
+                    regressoes.append({ 'fator': r['fator'], 'etapa': etapa, 'medida': campo,
+                                        'baseline': antigo, 'atual': novo, 'razao': round( novo / antigo, 2 ) })
+
+    return regressoes
+
+
+
+## Tabela de compra ( aba 4 ) ###-------------------------------------------------------------------
+
+# Estilo da coluna status, o mesmo da aplicação
+def aplic(x):
+
+    cor = 'blue' if x == 'Compra' else 'black'
+    return f'color: {cor}'
+
+
+
+# Versão antiga: tabela inteira com o estilo da coluna status
+def estilo_completo(df_compra):
+
+    return tabela_compra( df_compra ).style.applymap( aplic, subset = 'status' )
+
+
+
+# Versão atual: tabela ordenada pela coluna escolhida ( maiores preços ) e só a primeira página estilizada
+def estilo_pagina(df_compra, linhas_pagina):
+
+    tabela = tabela_compra( df_compra )
+    ordem = ordem_coluna( tabela, 'Preço', False )
+
+    return pagina( tabela, ordem, 0, linhas_pagina ).style.applymap( aplic, subset = 'status' )
+
+
+
+# Tempo para montar o Styler e calcular os estilos, tempo para gerar o HTML e tamanho do HTML (bytes)
+def medir_tabela(funcao):
+
+    t0 = time.perf_counter()
+    estilo = funcao()
+    estilo._compute()
+    t1 = time.perf_counter()
+    html = estilo.to_html()
+    t2 = time.perf_counter()
+
+    return { 'estilo_s': round( t1 - t0, 4 ), 'render_s': round( t2 - t1, 4 ),
+             'linhas': len( estilo.data ), 'payload_bytes': len( html.encode( 'utf-8' ) ) }
+
+
+
+# Compara a tabela de compra antiga (inteira) com a atual (só a página dos maiores preços) para cada tamanho de base
+# - a tabela inteira é pulada acima de max_completa
+def benchmark_tabela_compra(path, tamanhos, linhas_pagina = 100, max_completa = 200000):
+
+    df_clean = carregar_dados_limpos( path )
+
+    resultados = []
+    for n in tamanhos:
+
+        agregados, df_compra = recomendacoes( base_escalada( df_clean, n ) )
+
+        resultado = { 'linhas': n, 'linhas_compra': len( df_compra ),
+                      'pagina': medir_tabela( lambda: estilo_pagina( df_compra, linhas_pagina ) ), 'completa': None }
+
+        if len( df_compra ) <= max_completa:
+            resultado['completa'] = medir_tabela( lambda: estilo_completo( df_compra ) )
+
+        print( json.dumps( resultado ) )
+        resultados.append( resultado )
+
+    return resultados
+
+
+
+### -----------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser( description = 'Benchmarks do projeto House Rocket.' )
+    parser.add_argument( 'benchmark', choices = ['marcadores', 'etapas', 'memoria', 'tabela_compra'] )
+    parser.add_argument( '--dados', default = 'kc_house_data.csv' )
+    parser.add_argument( '--tamanhos', type = int, nargs = '+', default = [20000, 200000, 2000000] )
+    parser.add_argument( '--max-iterrows', type = int, default = 200000,
+                         help = 'maior base medida no modo antigo (iterrows), que é lento demais para milhões de linhas' )
+    parser.add_argument( '--fatores', type = int, nargs = '+', default = [1, 10], help = 'escalas da base (etapas) - as do baseline' )
+    parser.add_argument( '--repeticoes', type = int, default = 3, help = 'execuções por etapa, vale o menor tempo (etapas) - as do baseline' )
+    parser.add_argument( '--geojson', help = 'Zip_Codes.geojson - inclui o mapa de preço por região (etapas)' )
+    parser.add_argument( '--sem-memoria', action = 'store_true', help = 'não mede pico de memória (etapas)' )
+    parser.add_argument( '--pasta', help = 'pasta para as bases escaladas - mantida no fim (etapas)' )
+    parser.add_argument( '--baseline', default = BASELINE_ETAPAS,
+                         help = "arquivo .json de uma execução anterior para comparar, '' para não comparar (etapas)" )
+    parser.add_argument( '--tolerancia', type = float, default = TOLERANCIA_REGRESSAO,
+                         help = 'aumento (fração) considerado regressão (etapas)' )
+    parser.add_argument( '--float32', action = 'store_true', help = 'inclui float32 nas áreas e preços por m2 (memoria)' )
+    parser.add_argument( '--linhas-pagina', type = int, default = 100, help = 'linhas da página mostrada (tabela_compra)' )
+    parser.add_argument( '--max-completa', type = int, default = 200000,
+                         help = 'maior tabela de compra medida inteira, sem paginação (tabela_compra)' )
+    parser.add_argument( '--saida', help = 'arquivo .json para gravar os resultados' )
+    args = parser.parse_args()
+
+    if args.benchmark == 'marcadores':
+        resultados = benchmark_marcadores( args.dados, args.tamanhos, args.max_iterrows )
+    elif args.benchmark == 'memoria':
+        relatorio = relatorio_memoria( carregar_dados_limpos( args.dados ), args.float32 )
+        print( relatorio.to_string( index = False ) )
+        resultados = relatorio.to_dict( orient = 'records' )
+    elif args.benchmark == 'tabela_compra':
+        resultados = benchmark_tabela_compra( args.dados, args.tamanhos, args.linhas_pagina, args.max_completa )
+    else:
+        resultados = benchmark_etapas( args.dados, args.fatores, args.geojson, args.repeticoes, not args.sem_memoria, args.pasta )
+
+    if args.saida:
+        with open( args.saida, 'w', encoding = 'utf-8' ) as f:
+            json.dump( resultados, f, indent = 2 )
+
+    if args.benchmark == 'etapas' and args.baseline:
+
+        with open( args.baseline, encoding = 'utf-8' ) as f:
+            regressoes = comparar_baseline( resultados, json.load( f ), args.tolerancia )
+
+        for r in regressoes:
+            print( 'REGRESSÃO {fator}x {etapa} {medida}: {baseline} -> {atual} ({razao}x)'.format( **r ) )
+
+        print( '{0} regressões em relação a {1}'.format( len( regressoes ), args.baseline ) )
+
+        if regressoes:
+            sys.exit( 1 )
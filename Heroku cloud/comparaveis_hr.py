@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Precificação por comparáveis do projeto House Rocket.
+
+Para cada imóvel recomendado para compra, busca as k vendas recentes mais próximas (lat/long)
+de imóveis parecidos: avaliação de construção ( grade ) até DIFERENCA_GRADE e área construída
+dentro de TOLERANCIA_AREA. O preço por comparáveis é a mediana do preço/m2 construído dos
+comparáveis vezes a área construída do imóvel.
+
+As coordenadas ficam numa KD-tree ( scipy.spatial.cKDTree ) montada uma vez sobre a venda mais
+recente de cada imóvel. As consultas são feitas em lotes: cada imóvel busca os vizinhos mais próximos
+dentro de RAIO_MAXIMO_KM ( FATOR_BUSCA vezes k, para sobrar candidatos depois do filtro de grade
+e área ), então o custo cresce com n log n, e não n² como numa matriz de distâncias.
+
+Uso: python comparaveis_hr.py kc_house_data.csv --k 5
+"""
+
+## Libraries ###-------------------------------------------------------------------
+
+import argparse
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from dados_hr import carregar_dados_limpos
+from recomendacoes_hr import recomendacoes, calcular_compra_venda, _vendas_recentes
+
+
+## Configuração ###----------------------------------------------------------------
+
+# Quantidade de comparáveis por imóvel e mínimo para o preço por comparáveis valer
+K_COMPARAVEIS = 5
+MINIMO_COMPARAVEIS = 3
+
+# Vizinhos buscados por comparável desejado ( candidatos para os filtros de grade e área )
+FATOR_BUSCA = 8
+
+# Semelhança: diferença máxima de grade e variação relativa máxima da área construída
+DIFERENCA_GRADE = 1
+TOLERANCIA_AREA = 0.25
+
+# Distância máxima (km) de um comparável
+RAIO_MAXIMO_KM = 5.0
+
+# Imóveis por consulta à KD-tree ( limita a memória das matrizes de vizinhos )
+LOTE_CONSULTA = 100000
+
+# Quilômetros por grau de latitude ( projeção equiretangular, suficiente na escala de uma região )
+KM_POR_GRAU = 111.2
+
+
+## Functions ###-------------------------------------------------------------------------------------
+
+# Coordenadas planas em km em torno da latitude de referência - distância euclidiana ~ distância real
+def coordenadas_km(lat, long, lat_ref):
+
+    lat = np.asarray( lat, dtype = 'float64' )
+    long = np.asarray( long, dtype = 'float64' )
+
+    return np.column_stack([ long * KM_POR_GRAU * np.cos( np.radians( lat_ref ) ), lat * KM_POR_GRAU ])
+
+
+
+# Índice espacial das vendas recentes ( venda mais recente de cada imóvel ) - montado uma vez por versão da base
+def indice_comparaveis(df_clean):
+
+    vendas = _vendas_recentes( df_clean[['id','date','lat','long','grade','m2_living','price_per_m2_living']] )
+
+    lat_ref = float( vendas['lat'].mean() )
+
+    return { 'arvore': cKDTree( coordenadas_km( vendas['lat'], vendas['long'], lat_ref ) ),
+             'lat_ref': lat_ref,
+             'id': vendas['id'].to_numpy(),
+             'grade': vendas['grade'].to_numpy( dtype = 'float64' ),
+             'm2_living': vendas['m2_living'].to_numpy( dtype = 'float64' ),
+             'price_per_m2_living': vendas['price_per_m2_living'].to_numpy( dtype = 'float64' ) }
+
+
+
+# Consulta de um lote com n_busca vizinhos: posições e distâncias dos k primeiros válidos, e se a busca terminou
+# ( k encontrados ou nenhum vizinho a mais dentro do raio )
+def _consultar(indice, pontos, ids, grade, m2_living, k, n_busca):
+
+    n_vendas = len( indice['id'] )
+
+    dist, viz = indice['arvore'].query( pontos, k = n_busca, distance_upper_bound = RAIO_MAXIMO_KM, workers = -1 )
+    dist, viz = dist.reshape( -1, n_busca ), viz.reshape( -1, n_busca )
+
+    # Vizinhos fora do raio vêm com posição n_vendas - trocados por 0 só para indexar, e descartados pela máscara
+    encontrado = viz < n_vendas
+    viz = np.where( encontrado, viz, 0 )
+
+    valido = ( encontrado & ( indice['id'][viz] != ids[:, None] )
+               & ( np.abs( indice['grade'][viz] - grade[:, None] ) <= DIFERENCA_GRADE )
+               & ( np.abs( indice['m2_living'][viz] / m2_living[:, None] - 1 ) <= TOLERANCIA_AREA ) )
+
+    # Primeiros k válidos de cada linha (os vizinhos já vêm ordenados pela distância)
+    ordem = np.argsort( ~valido, axis = 1, kind = 'stable' )[:, :k]
+    escolhido = np.take_along_axis( valido, ordem, axis = 1 )
+
+    posicoes = np.where( escolhido, np.take_along_axis( viz, ordem, axis = 1 ), -1 )
+    distancias = np.where( escolhido, np.take_along_axis( dist, ordem, axis = 1 ), np.nan )
+
+    terminou = ( escolhido.sum( axis = 1 ) >= k ) | ~encontrado[:, -1] | ( n_busca >= n_vendas )
+
+    return posicoes, distancias, terminou
+
+
+
+# Posições (no índice) e distâncias (km) dos k comparáveis de cada imóvel, do mais próximo ao mais distante.
+# Posição -1 e distância NaN onde faltaram comparáveis. Imóveis com vizinhos demais fora do filtro de
+# grade e área são consultados de novo com FATOR_BUSCA vezes mais vizinhos.
+def buscar_comparaveis(indice, df, k = K_COMPARAVEIS):
+
+    n = len( df )
+    n_vendas = len( indice['id'] )
+
+    posicoes = np.full( (n, k), -1, dtype = 'int64' )
+    distancias = np.full( (n, k), np.nan )
+
+    pontos = coordenadas_km( df['lat'], df['long'], indice['lat_ref'] )
+    ids = df['id'].to_numpy()
+    grade = df['grade'].to_numpy( dtype = 'float64' )
+    m2_living = df['m2_living'].to_numpy( dtype = 'float64' )
+
+    for inicio in range( 0, n, LOTE_CONSULTA ):
+
+        pendentes = np.arange( inicio, min( inicio + LOTE_CONSULTA, n ) )
+        n_busca = min( k * FATOR_BUSCA, n_vendas )
+
+        while len( pendentes ):
+
+            pos, dist, terminou = _consultar( indice, pontos[pendentes], ids[pendentes], grade[pendentes],
+                                              m2_living[pendentes], k, n_busca )
+
+            posicoes[pendentes, :pos.shape[1]] = pos
+            distancias[pendentes, :pos.shape[1]] = dist
+
+            pendentes = pendentes[~terminou]
+            n_busca = min( n_busca * FATOR_BUSCA, n_vendas )
+
+    return posicoes, distancias
+
+
+
+# Acrescenta n_comparaveis, distancia_comparaveis_km (média), price_m2_comparaveis (mediana) e price_comparaveis.
+# Com menos de MINIMO_COMPARAVEIS o preço por comparáveis fica vazio.
+def precificar_comparaveis(df, indice, k = K_COMPARAVEIS):
+
+    posicoes, distancias = buscar_comparaveis( indice, df, k )
+
+    encontrado = posicoes >= 0
+    quantidade = encontrado.sum( axis = 1 )
+
+    # Mediana por linha com quantidades diferentes de comparáveis: valores ordenados com os vazios no fim
+    valores = np.sort( np.where( encontrado, indice['price_per_m2_living'][np.maximum( posicoes, 0 )], np.inf ), axis = 1 )
+    linhas = np.arange( len( df ) )
+    meio_baixo = np.maximum( quantidade - 1, 0 ) // 2
+    meio_alto = quantidade // 2
+
+    mediana = ( valores[linhas, meio_baixo] + valores[linhas, np.minimum( meio_alto, k - 1 )] ) / 2
+    mediana = np.where( quantidade >= MINIMO_COMPARAVEIS, mediana, np.nan )
+
+    distancia_media = np.where( quantidade > 0, np.nansum( distancias, axis = 1 ) / np.maximum( quantidade, 1 ), np.nan )
+
+    df = df.copy()
+    df['n_comparaveis'] = quantidade
+    df['distancia_comparaveis_km'] = distancia_media
+    df['price_m2_comparaveis'] = mediana
+    df['price_comparaveis'] = mediana * df['m2_living'].to_numpy()
+
+    return df
+
+
+
+### -----------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser( description = 'Preço por comparáveis dos imóveis recomendados para compra.' )
+    parser.add_argument( 'dados', help = 'arquivo .csv da base ( kc_house_data.csv )' )
+    parser.add_argument( '--k', type = int, default = K_COMPARAVEIS, help = 'comparáveis por imóvel' )
+    args = parser.parse_args()
+
+    df_clean = carregar_dados_limpos( args.dados )
+    agregados, df_compra = recomendacoes( df_clean )
+    df_compra_venda = calcular_compra_venda( df_compra, agregados )
+
+    t0 = time.perf_counter()
+    indice = indice_comparaveis( df_clean )
+    t_indice = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    df_compra_venda = precificar_comparaveis( df_compra_venda, indice, args.k )
+    t_consulta = time.perf_counter() - t0
+
+    com_preco = df_compra_venda['price_comparaveis'].notna()
+
+    print( 'índice: {0} vendas em {1:.3f} s - consultas: {2} imóveis em {3:.3f} s'.format(
+           len( indice['id'] ), t_indice, len( df_compra_venda ), t_consulta ) )
+
+    print( '  com preço por comparáveis: {0} ({1:.1%}), distância média {2:.2f} km'.format(
+           int( com_preco.sum() ), com_preco.mean(), df_compra_venda['distancia_comparaveis_km'].mean() ) )
+
+    print( '  preço por comparáveis / preço de venda estimado (mediana): {0:.3f}'.format(
+           ( df_compra_venda['price_comparaveis'] / df_compra_venda['price_venda'] )[com_preco].median() ) )
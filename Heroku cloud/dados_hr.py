@@ -0,0 +1,586 @@
+# -*- coding: utf-8 -*-
+"""
+Camada de dados do projeto House Rocket: leitura da base de imóveis, tratamento
+e snapshots colunares (Arrow/Feather) para não repetir o parse do .csv.
+
+Não importa o Streamlit, pode ser usada por scripts fora da aplicação web.
+
+A aplicação usa uma única cópia das bases por processo ( base_compartilhada ), compartilhada por
+todas as sessões e nunca alterada: subconjuntos filtrados e páginas copiam só as linhas selecionadas
+( selecao, pagina ), e é nessas cópias que a aplicação altera valores.
+No modo compacto a base tratada usa categorias e inteiros estreitos ( ver compactar ).
+"""
+
+## Libraries ###-------------------------------------------------------------------
+
+import argparse
+import hashlib
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+
+## Schemas ###---------------------------------------------------------------------
+
+# Versão do formato dos snapshots - aumentar sempre que data_cleaning ou os schemas mudarem
+VERSAO_SNAPSHOT = 1
+
+# Pasta (ao lado do .csv) onde ficam os snapshots
+PASTA_SNAPSHOT = 'snapshots'
+
+# Quantidade de linhas lidas por vez no modo streaming
+TAMANHO_CHUNK = 100000
+
+# Colunas indexadas para os filtros da visão Gráficos ( mais o zipcode do filtro de Código Postal )
+COLUNAS_INDICE = ['zipcode', 'yr_built', 'date', 'price', 'condition', 'grade']
+
+# Opções de linhas por página das tabelas paginadas ( ver pagina )
+TAMANHOS_PAGINA = [100, 500, 1000, 5000]
+
+# Modo compacto da base tratada compartilhada pela aplicação ( ver compactar e relatorio_memoria )
+MODO_COMPACTO = True
+
+# Tipos do modo compacto - sem perda: textos com poucos valores viram categorias e inteiros pequenos tipos estreitos
+# (categorias em ordem alfabética, a mesma ordem do groupby sobre texto)
+TIPOS_COMPACTOS = { 'seasons': 'category', 'waterfront': 'category', 'is_renovated': 'category', 'date_str': 'category',
+                    'bedrooms': 'int8', 'condition': 'int8', 'grade': 'int8', 'view': 'int8', 'month': 'int8',
+                    'year': 'int16', 'yr_built': 'int16', 'age': 'int16', 'yr_renovated': 'int16', 'zipcode': 'int32' }
+
+# Colunas de ponto flutuante que podem ir para float32 ( opcional - muda as últimas casas decimais das médias )
+COLUNAS_FLOAT32 = ['bathrooms', 'floors', 'm2_living', 'm2_outside', 'price_per_m2_living', 'price_per_m2_living_outside']
+
+# Colunas com até esse número de valores distintos usam bitmaps (1 bit por linha por valor) em vez de índice ordenado
+MAX_CARDINALIDADE_BITMAP = 32
+
+# Schema explícito da base bruta ( kc_house_data.csv )
+SCHEMA_BRUTO = pa.schema([
+    ('id', pa.int64()), ('date', pa.string()), ('price', pa.float64()),
+    ('bedrooms', pa.int64()), ('bathrooms', pa.float64()), ('sqft_living', pa.int64()),
+    ('sqft_lot', pa.int64()), ('floors', pa.float64()), ('waterfront', pa.int64()),
+    ('view', pa.int64()), ('condition', pa.int64()), ('grade', pa.int64()),
+    ('sqft_above', pa.int64()), ('sqft_basement', pa.int64()), ('yr_built', pa.int64()),
+    ('yr_renovated', pa.int64()), ('zipcode', pa.int64()), ('lat', pa.float64()),
+    ('long', pa.float64()), ('sqft_living15', pa.int64()), ('sqft_lot15', pa.int64()) ])
+
+# Schema explícito da base tratada (saída de data_cleaning)
+SCHEMA_LIMPO = pa.schema([
+    ('id', pa.int64()), ('zipcode', pa.int64()), ('date', pa.timestamp('ns')),
+    ('date_str', pa.string()), ('month', pa.int64()), ('year', pa.int64()),
+    ('yr_built', pa.int64()), ('age', pa.int64()), ('yr_renovated', pa.int64()),
+    ('is_renovated', pa.string()), ('bathrooms', pa.float64()), ('bedrooms', pa.int64()),
+    ('condition', pa.int64()), ('floors', pa.float64()), ('grade', pa.int64()),
+    ('lat', pa.float64()), ('long', pa.float64()), ('m2_living', pa.float64()),
+    ('m2_outside', pa.float64()), ('price', pa.float64()), ('price_per_m2_living', pa.float64()),
+    ('price_per_m2_living_outside', pa.float64()), ('seasons', pa.string()),
+    ('view', pa.int64()), ('waterfront', pa.string()) ])
+
+
+## Functions ###-------------------------------------------------------------------------------------
+
+def data_cleaning(df):
+
+    ## DATA CLEANING ------------------------------------------------------
+
+    ## Outliers -----------------------------------------------------------
+
+    df.loc[df['bedrooms'] == 33, 'bedrooms' ] = 3
+
+    ## Tratamento e criação de features -----------------------------------
+
+    # Tratar coluna date para ficar do tipo datetime
+    df['date'] = pd.to_datetime(df['date'], format = ('%Y-%m-%d'))
+
+    # Coluna para data com formato em Dia/Mês/Ano
+    df['date_str'] = df['date'].dt.strftime('%d-%m-%Y')
+
+    # Criar colunas separadas para mês e ano de venda do imóvel
+    df['month'] = df['date'].dt.month
+    df['year'] = df['date'].dt.year
+
+    # Criar coluna para estações do ano - Verão, Inverno, Primavera, Outono.
+
+    #Verão: de junho a agosto.
+    #Outono: de setembro a novembro.
+    #Inverno: de dezembro a fevereiro.
+    #Primavera: de março a maio.#
+
+    ver_lt = [6,7,8]
+    out_lt = [9,10,11]
+    inv_lt = [12,1,2]
+    pri_lt = [3,4,5]
+
+
+    df.loc[df['month'].isin(ver_lt), 'seasons'] = 'Verão'
+    df.loc[df['month'].isin(out_lt), 'seasons'] = 'Outono'
+    df.loc[df['month'].isin(inv_lt), 'seasons'] = 'Inverno'
+    df.loc[df['month'].isin(pri_lt), 'seasons'] = 'Primavera'
+
+    # Criar uma coluna nova com unidade de medida de área m2 para o tamanho do imóvel
+    df['m2_living'] = df['sqft_living']/ 10.764
+    df['m2_lot'] = df['sqft_lot']/ 10.764
+    df['m2_above'] = df['sqft_above']/ 10.764
+
+
+    #- Criar coluna extra que seria tamanho área externa -> sqft_outside = sqft_lot - (sqft_above/floors)
+    df['m2_outside'] = df['m2_lot'] - (df['m2_above']/df['floors'])
+
+    # Criar coluna preço imóvel / área construída (m2_living)
+    df['price_per_m2_living'] = df['price'] / df['m2_living']
+
+    # Criar coluna preço imóvel / área construída + área externa
+    df['price_per_m2_living_outside'] = df['price'] / (df['m2_living'] + df['m2_outside'])
+
+    # Criar coluna age
+    df['age'] = datetime.now().year - df['yr_built']
+
+    # Criar coluna is_renovated
+    df['is_renovated'] = df['yr_renovated'].apply(lambda x: 'Yes' if x != 0 else 'No')
+
+    # Troca de valores waterfront: (0) -> No (1) -> Yes
+    df['waterfront'].replace({1:'Yes',0:'No'}, inplace = True)
+
+    df = df[['id','zipcode', 'date', 'date_str', 'month', 'year', 'yr_built', 'age', 'yr_renovated',
+             'is_renovated', 'bathrooms','bedrooms','condition','floors','grade', 'lat','long',
+             'm2_living', 'm2_outside', 'price', 'price_per_m2_living', 'price_per_m2_living_outside',
+             'seasons', 'view','waterfront']]
+
+    return df
+
+
+
+## Snapshots ###-------------------------------------------------------------------------------------
+
+# Hashes já calculados: { path: ( (st_mtime_ns, st_size), hash ) } - um por arquivo, refeito só quando o arquivo muda
+_HASHES = {}
+_LOCK_HASHES = threading.Lock()
+
+
+
+# Hash do conteúdo do .csv (lido em blocos para não carregar o arquivo inteiro na memória).
+# Calculado uma vez por ( caminho, data de modificação, tamanho ): snapshots, versão e conexão pedem o mesmo hash várias vezes
+def hash_arquivo( path, tamanho_bloco = 1 << 20 ):
+
+    path = os.path.abspath( path )
+    info = os.stat( path )
+    chave = ( info.st_mtime_ns, info.st_size )
+
+    with _LOCK_HASHES:
+        guardado = _HASHES.get( path )
+    if guardado is not None and guardado[0] == chave:
+        return guardado[1]
+
+    h = hashlib.sha256()
+
+    with open( path, 'rb' ) as f:
+        for bloco in iter( lambda: f.read( tamanho_bloco ), b'' ):
+            h.update( bloco )
+
+    with _LOCK_HASHES:
+        _HASHES[path] = ( chave, h.hexdigest() )
+
+    return h.hexdigest()
+
+
+
+# Caminho do snapshot - chave pelo hash do .csv, versão do formato e ano atual (a coluna age depende do ano)
+def caminho_snapshot( path, tipo ):
+
+    pasta = os.path.join( os.path.dirname( os.path.abspath( path ) ), PASTA_SNAPSHOT )
+    base = os.path.splitext( os.path.basename( path ) )[0]
+    chave = hash_arquivo( path )[:16]
+
+    if tipo == 'limpo':
+        chave = '{0}_{1}'.format( chave, datetime.now().year )
+
+    return os.path.join( pasta, '{0}_{1}_v{2}_{3}.arrow'.format( base, tipo, VERSAO_SNAPSHOT, chave ) )
+
+
+
+# Versão da base de dados - muda quando o conteúdo do .csv ou o formato dos snapshots mudam
+def versao_dados( path ):
+
+    return 'v{0}_{1}'.format( VERSAO_SNAPSHOT, hash_arquivo( path )[:16] )
+
+
+
+# Grava o DataFrame em formato Arrow IPC (Feather v2) sem compressão, para poder ser lido com memory map
+def salvar_snapshot( df, path_snapshot, schema ):
+
+    os.makedirs( os.path.dirname( path_snapshot ), exist_ok = True )
+
+    tabela = pa.Table.from_pandas( df, schema = schema, preserve_index = False )
+
+    # Escreve em arquivo temporário e renomeia, para nunca deixar snapshot pela metade
+    tmp = path_snapshot + '.tmp'
+    feather.write_feather( tabela, tmp, compression = 'uncompressed' )
+    os.replace( tmp, path_snapshot )
+
+    return path_snapshot
+
+
+
+# Lê o snapshot com memory map - colunas numéricas viram arrays NumPy sem cópia dos dados
+def ler_snapshot( path_snapshot ):
+
+    tabela = feather.read_table( path_snapshot, memory_map = True )
+
+    return tabela.to_pandas( split_blocks = True )
+
+
+
+# Base bruta: lê do snapshot se existir, senão faz o parse do .csv e grava o snapshot
+def carregar_dados( path ):
+
+    path_snapshot = caminho_snapshot( path, 'bruto' )
+
+    if os.path.exists( path_snapshot ):
+        return ler_snapshot( path_snapshot )
+
+    data = pd.read_csv( path )
+    salvar_snapshot( data, path_snapshot, SCHEMA_BRUTO )
+
+    return data
+
+
+
+# Tratamento em streaming: lê o .csv em blocos de linhas, aplica data_cleaning em cada bloco e grava a saída
+# incrementalmente em um arquivo Arrow - a memória usada depende do tamanho do bloco e não do tamanho da base
+def data_cleaning_chunks( path, path_saida, tamanho_chunk = TAMANHO_CHUNK ):
+
+    os.makedirs( os.path.dirname( os.path.abspath( path_saida ) ), exist_ok = True )
+
+    tmp = path_saida + '.tmp'
+    n_linhas = 0
+
+    # Todas as regras de data_cleaning são por linha, então tratar bloco a bloco dá o mesmo resultado da base inteira
+    with pa.OSFile( tmp, 'wb' ) as sink, pa.ipc.new_file( sink, SCHEMA_LIMPO ) as writer:
+
+        for chunk in pd.read_csv( path, chunksize = tamanho_chunk ):
+
+            chunk_clean = data_cleaning( chunk )
+            writer.write_table( pa.Table.from_pandas( chunk_clean, schema = SCHEMA_LIMPO, preserve_index = False ) )
+
+            n_linhas += len( chunk_clean )
+
+    os.replace( tmp, path_saida )
+
+    return n_linhas
+
+
+
+# Base tratada: lê do snapshot se existir, senão gera o snapshot em streaming a partir do .csv
+def carregar_dados_limpos( path ):
+
+    path_snapshot = caminho_snapshot( path, 'limpo' )
+
+    if not os.path.exists( path_snapshot ):
+        data_cleaning_chunks( path, path_snapshot )
+
+    return ler_snapshot( path_snapshot )
+
+
+
+## Índices ###---------------------------------------------------------------------------------------
+
+# Índices por coluna para filtros por faixa sem varrer a base:
+#   - 'bitmap' (baixa cardinalidade): um bitmap compactado (np.packbits) por valor distinto
+#   - 'ordenado': posições das linhas em ordem do valor (argsort) e os valores ordenados, para busca binária
+# Os valores originais da coluna ficam guardados para conferir os candidatos das outras colunas
+def indices_colunas( df, colunas = COLUNAS_INDICE ):
+
+    n = len( df )
+    tipo_posicao = np.int32 if n < 2 ** 31 else np.int64
+
+    indices = { '_n': n }
+    for col in colunas:
+
+        valores = df[col].to_numpy()
+
+        ordem = np.argsort( valores, kind = 'stable' ).astype( tipo_posicao )
+        ordenados = valores[ordem]
+
+        # Início de cada valor distinto nos valores ordenados
+        novos = np.flatnonzero( np.r_[ True, ordenados[1:] != ordenados[:-1] ] ) if n else np.zeros( 0, np.int64 )
+
+        if len( novos ) <= MAX_CARDINALIDADE_BITMAP:
+
+            chaves = ordenados[novos]
+            contagem = np.diff( np.r_[novos, n] )
+            codigos = np.searchsorted( chaves, valores )
+
+            bitmaps = np.vstack([ np.packbits( codigos == i ) for i in range( len( chaves ) ) ]) if n else np.zeros( (0, 0), np.uint8 )
+            indices[col] = { 'tipo': 'bitmap', 'valores': valores, 'chaves': chaves, 'contagem': contagem, 'bitmaps': bitmaps }
+
+        else:
+
+            indices[col] = { 'tipo': 'ordenado', 'valores': valores, 'ordenados': ordenados, 'ordem': ordem }
+
+    return indices
+
+
+
+# Converte o limite da faixa para o tipo da coluna (datas do slider viram datetime64)
+def _limite( valor, dtype ):
+
+    if dtype.kind == 'M':
+        return pd.Timestamp( valor ).to_datetime64()
+
+    return valor
+
+
+
+# Intervalos [inicio, fim) nas chaves (bitmap) ou nos valores ordenados de uma faixa ou de um conjunto de valores
+def _intervalos( indice, faixa = None, conjunto = None ):
+
+    base = indice['chaves'] if indice['tipo'] == 'bitmap' else indice['ordenados']
+
+    if conjunto is not None:
+        chaves = np.unique( np.asarray( list( conjunto ), dtype = base.dtype ) )
+        return np.searchsorted( base, chaves, 'left' ), np.searchsorted( base, chaves, 'right' )
+
+    lo, hi = _limite( faixa[0], base.dtype ), _limite( faixa[1], base.dtype )
+    inicio, fim = np.searchsorted( base, lo, 'left' ), np.searchsorted( base, hi, 'right' )
+
+    return np.array([ inicio ]), np.array([ max( inicio, fim ) ])
+
+
+
+# Quantidade de linhas que atendem a condição - usada para escolher a coluna mais seletiva
+def _quantidade( indice, inicio, fim ):
+
+    if indice['tipo'] == 'bitmap':
+        acumulado = np.r_[0, np.cumsum( indice['contagem'] )]
+        return int( ( acumulado[fim] - acumulado[inicio] ).sum() )
+
+    return int( ( fim - inicio ).sum() )
+
+
+
+# Posições (em ordem crescente) das linhas que atendem a condição de uma coluna
+def _posicoes( indice, inicio, fim, n ):
+
+    if indice['tipo'] == 'bitmap':
+        selecionadas = [ i for a, b in zip( inicio, fim ) for i in range( a, b ) ]
+
+        if not selecionadas:
+            return np.zeros( 0, np.int64 )
+
+        bits = np.bitwise_or.reduce( indice['bitmaps'][selecionadas], axis = 0 )
+
+        # Só os bytes com algum bit ligado são expandidos ( posição = byte * 8 + bit )
+        bytes_ligados = np.flatnonzero( bits )
+        linhas, bits_ligados = np.nonzero( np.unpackbits( bits[bytes_ligados] ).reshape( -1, 8 ) )
+
+        return bytes_ligados[linhas] * 8 + bits_ligados
+
+    return np.sort( np.concatenate([ indice['ordem'][a:b] for a, b in zip( inicio, fim ) ]) )
+
+
+
+# Confere as posições candidatas nos valores originais da coluna
+def _conferir( indice, posicoes, faixa = None, conjunto = None ):
+
+    valores = indice['valores'][posicoes]
+
+    if conjunto is not None:
+        return posicoes[ np.isin( valores, np.asarray( list( conjunto ), dtype = valores.dtype ) ) ]
+
+    lo, hi = _limite( faixa[0], valores.dtype ), _limite( faixa[1], valores.dtype )
+
+    return posicoes[ (valores >= lo) & (valores <= hi) ]
+
+
+
+# Consulta com várias faixas (limites inclusivos) e conjuntos de valores: a coluna mais seletiva gera os candidatos
+# por busca binária / bitmaps e as demais só conferem esses candidatos. Retorna None quando nenhuma condição
+# restringe a base (todas as linhas), para o chamador usar o DataFrame sem cópia.
+def consulta_indices( indices, faixas = None, conjuntos = None ):
+
+    n = indices['_n']
+
+    condicoes = []
+    for col, faixa in ( faixas or {} ).items():
+        inicio, fim = _intervalos( indices[col], faixa = faixa )
+        condicoes.append( (col, { 'faixa': faixa }, inicio, fim) )
+
+    for col, conjunto in ( conjuntos or {} ).items():
+        if conjunto:
+            inicio, fim = _intervalos( indices[col], conjunto = conjunto )
+            condicoes.append( (col, { 'conjunto': conjunto }, inicio, fim) )
+
+    # Condições que cobrem a base inteira não filtram nada
+    condicoes = [ (col, cond, inicio, fim, _quantidade( indices[col], inicio, fim )) for col, cond, inicio, fim in condicoes ]
+    condicoes = sorted( [ c for c in condicoes if c[4] < n ], key = lambda c: c[4] )
+
+    if not condicoes:
+        return None
+
+    col, _, inicio, fim, _ = condicoes[0]
+    posicoes = _posicoes( indices[col], inicio, fim, n )
+
+    for col, cond, _, _, _ in condicoes[1:]:
+        if len( posicoes ) == 0:
+            break
+        posicoes = _conferir( indices[col], posicoes, **cond )
+
+    return posicoes
+
+
+
+## Modo compacto ###----------------------------------------------------------------------------------
+
+# Cópia da base tratada com os tipos compactos - inteiros só são estreitados se todos os valores couberem no tipo
+def compactar( df, float32 = False ):
+
+    tipos = dict( TIPOS_COMPACTOS )
+    if float32:
+        tipos.update( { col: 'float32' for col in COLUNAS_FLOAT32 } )
+
+    convertidas = {}
+    for col, tipo in tipos.items():
+
+        if col not in df.columns:
+            continue
+
+        if tipo not in ('category', 'float32'):
+
+            limites = np.iinfo( tipo )
+            if len( df ) and ( df[col].min() < limites.min or df[col].max() > limites.max ):
+                continue
+
+        convertidas[col] = df[col].astype( tipo )
+
+    return df.assign( **convertidas )
+
+
+
+# Bytes por coluna (memória real, incluindo os textos) antes e depois do modo compacto, com a linha de total
+def relatorio_memoria( df, float32 = False ):
+
+    compacto = compactar( df, float32 )
+
+    antes = df.memory_usage( index = False, deep = True )
+    depois = compacto.memory_usage( index = False, deep = True )
+
+    relatorio = pd.DataFrame({ 'tipo': df.dtypes.astype( str ), 'bytes': antes,
+                               'tipo_compacto': compacto.dtypes.astype( str ), 'bytes_compacto': depois })
+
+    relatorio.loc['total'] = [ '', antes.sum(), '', depois.sum() ]
+    relatorio['reducao_%'] = ( 100 * ( 1 - relatorio['bytes_compacto'] / relatorio['bytes'] ) ).round( 1 )
+
+    return relatorio.rename_axis( 'coluna' ).reset_index()
+
+
+
+## Base compartilhada ###-----------------------------------------------------------------------------
+
+# Bases compartilhadas do processo: { path: { 'versao', 'bruto', 'limpo' } } - uma versão por arquivo
+_BASES = {}
+_LOCK_BASES = threading.Lock()
+
+
+
+# Bases bruta e tratada da versão atual do arquivo, carregadas uma vez por processo e compartilhadas por todas as sessões.
+# Uma versão nova ( ver ingestao_hr.py ) substitui a anterior, que é liberada quando nenhuma sessão a usa mais.
+def base_compartilhada( path, versao = None, compacto = MODO_COMPACTO ):
+
+    versao = versao or versao_dados( path )
+    chave = os.path.abspath( path )
+
+    with _LOCK_BASES:
+
+        base = _BASES.get( chave )
+
+        if base is None or base['versao'] != versao or base['compacto'] != compacto:
+
+            limpo = carregar_dados_limpos( path )
+
+            base = { 'versao': versao, 'compacto': compacto,
+                     'bruto': carregar_dados( path ),
+                     'limpo': compactar( limpo ) if compacto else limpo }
+
+            _BASES[chave] = base
+
+    return base
+
+
+
+# Linhas selecionadas por posição com índice 0..n-1: copia só essas linhas ( reset_index copiaria de novo ).
+# Sem seleção ( posicoes None ) devolve a própria base, sem cópia.
+def selecao( df, posicoes ):
+
+    if posicoes is None:
+        return df
+
+    sub = df.take( posicoes )
+    sub.index = pd.RangeIndex( len( sub ) )
+
+    return sub
+
+
+
+## Paginação ###-------------------------------------------------------------------------------------
+
+# Posições das linhas na ordem da coluna - mesma ordem de sort_values( kind = 'stable', na_position = 'last' ):
+# empates ficam na ordem do arquivo também na ordem decrescente. Calculada uma vez por base e coluna.
+def ordem_coluna( df, coluna, crescente = True ):
+
+    n = len( df )
+    tipo_posicao = np.int32 if n < 2 ** 31 else np.int64
+
+    posto = df[coluna].rank( method = 'dense', ascending = crescente, na_option = 'bottom' ).to_numpy()
+
+    return np.argsort( posto, kind = 'stable' ).astype( tipo_posicao )
+
+
+
+# Ordem das linhas de uma seleção ( posições na base, None = todas ): sem ordem de coluna fica a ordem do arquivo
+def ordem_selecao( ordem, posicoes, n ):
+
+    if posicoes is None:
+        return ordem
+
+    if ordem is None:
+        return posicoes
+
+    marcadas = np.zeros( n, dtype = bool )
+    marcadas[posicoes] = True
+
+    return ordem[ marcadas[ordem] ]
+
+
+
+# Linhas de uma página ( numero a partir de 0 ) na ordem dada ( None = ordem do arquivo ): copia só as linhas da página.
+# O índice mostra a posição da linha na base.
+def pagina( df, ordem, numero, tamanho, colunas = None ):
+
+    inicio = numero * tamanho
+    posicoes = np.arange( inicio, min( inicio + tamanho, len( df ) ) ) if ordem is None else ordem[inicio:inicio + tamanho]
+
+    # Linhas e colunas da página de uma vez - df[colunas] antes copiaria as colunas inteiras
+    sub = df.take( posicoes ) if colunas is None else df.iloc[ posicoes, df.columns.get_indexer( colunas ) ]
+    sub.index = pd.Index( posicoes )
+
+    return sub
+
+
+
+### -----------------------------------------------------------------------------------
+
+# Uso: python dados_hr.py kc_house_data.csv saida.arrow --chunk 100000
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser( description = 'Tratamento da base de imóveis em streaming (blocos de linhas).' )
+    parser.add_argument( 'entrada', help = 'arquivo .csv no formato de kc_house_data.csv' )
+    parser.add_argument( 'saida', help = 'arquivo Arrow/Feather de saída com a base tratada' )
+    parser.add_argument( '--chunk', type = int, default = TAMANHO_CHUNK, help = 'linhas por bloco' )
+    args = parser.parse_args()
+
+    n = data_cleaning_chunks( args.entrada, args.saida, args.chunk )
+
+    print( '{0} linhas tratadas -> {1}'.format( n, args.saida ) )
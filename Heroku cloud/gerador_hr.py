@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Gerador de bases sintéticas no formato de kc_house_data.csv para testes de carga.
+
+Os imóveis são reamostrados da base real (mantendo a distribuição conjunta dos atributos)
+com perturbações: área e preço variam juntos pela elasticidade preço x área medida dentro
+de cada código postal, coordenadas variam dentro da dispersão do próprio código postal,
+datas seguem a distribuição real das vendas e cada imóvel pode ter revendas (intervalo e
+valorização reamostrados das revendas reais). O outlier de quartos ( bedrooms == 33 ) é
+injetado na mesma frequência da base real.
+
+A base é gerada em blocos com sementes derivadas da semente principal (mesmo resultado com
+qualquer número de processos) e gravada bloco a bloco, com memória constante.
+
+Uso: python gerador_hr.py kc_house_data.csv base_10M.csv --linhas 10000000 --seed 42 --processos 8
+"""
+
+## Libraries ###-------------------------------------------------------------------
+
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from dados_hr import SCHEMA_BRUTO, TAMANHO_CHUNK
+
+
+## Configuração ###----------------------------------------------------------------
+
+# Ids sintéticos começam acima dos ids reais ( até 9.900.000.190 )
+ID_INICIAL = 10 ** 10
+
+# Desvio (escala log) da variação de área construída e do terreno por imóvel gerado
+SIGMA_AREA = 0.08
+SIGMA_TERRENO = 0.10
+
+# Desvio (escala log) do ruído de preço que não vem da área
+SIGMA_PRECO = 0.05
+
+# Fração da dispersão de lat/long do código postal usada como ruído nas coordenadas
+FRACAO_DISPERSAO_COORDENADAS = 0.1
+
+# Blocos em andamento por processo (limita a memória quando a gravação é mais lenta que a geração)
+BLOCOS_POR_PROCESSO = 2
+
+# Modelo carregado em cada processo do pool
+_MODELO = None
+
+
+## Functions ###-------------------------------------------------------------------------------------
+
+# Parâmetros da geração medidos na base real
+def modelo_base(df):
+
+    df = df.copy()
+    df['dia'] = pd.to_datetime( df['date'].astype( str ).str[:8], format = '%Y%m%d' )
+
+    data_min = df['dia'].min()
+    df['dia'] = ( df['dia'] - data_min ).dt.days
+
+    # Revendas reais: intervalo (dias) e razão de preço entre vendas seguidas do mesmo imóvel
+    df = df.sort_values(by = ['id','dia'], ignore_index = True)
+    mesmo = df['id'].to_numpy()[1:] == df['id'].to_numpy()[:-1]
+
+    gaps = np.diff( df['dia'].to_numpy() )[mesmo]
+    razoes = ( df['price'].to_numpy()[1:] / df['price'].to_numpy()[:-1] )[mesmo]
+
+    vendas = df['id'].value_counts().value_counts().sort_index()
+
+    # Imóveis (primeira venda) sem o outlier - ele é injetado na geração com a frequência real
+    imoveis = df.drop_duplicates(subset = 'id', keep = 'first', ignore_index = True)
+    taxa_outlier = float( ( imoveis['bedrooms'] == 33 ).mean() )
+    imoveis.loc[ imoveis['bedrooms'] == 33, 'bedrooms' ] = 3
+
+    # Elasticidade preço x área: inclinação de log(preço) por log(área) dentro de cada código postal
+    log_preco = np.log( imoveis['price'] )
+    log_area = np.log( imoveis['sqft_living'] )
+    x = log_area - log_area.groupby( imoveis['zipcode'] ).transform( 'mean' )
+    y = log_preco - log_preco.groupby( imoveis['zipcode'] ).transform( 'mean' )
+
+    dispersao = imoveis.groupby( 'zipcode' )[['lat','long']].transform( 'std' ).fillna( 0 )
+
+    return { 'imoveis': imoveis.drop(columns = ['date']),
+             'sigma_lat': dispersao['lat'].to_numpy() * FRACAO_DISPERSAO_COORDENADAS,
+             'sigma_long': dispersao['long'].to_numpy() * FRACAO_DISPERSAO_COORDENADAS,
+             'dias': df['dia'].to_numpy(),
+             'datas': ( data_min + pd.to_timedelta( np.arange( df['dia'].max() + 1 ), unit = 'D' ) ).strftime( '%Y%m%dT000000' ).to_numpy(),
+             'gaps': gaps, 'razoes': razoes,
+             'n_vendas': vendas.index.to_numpy(), 'p_vendas': ( vendas / vendas.sum() ).to_numpy(),
+             'elasticidade': float( ( x * y ).sum() / ( x * x ).sum() ),
+             'taxa_outlier': taxa_outlier }
+
+
+
+# Gera n_linhas vendas de imóveis novos (ids a partir de id_inicial), com a semente do bloco
+def gerar_bloco(modelo, n_linhas, id_inicial, seed):
+
+    rng = np.random.default_rng( seed )
+    imoveis = modelo['imoveis']
+
+    # Imóveis e quantidade de vendas de cada um, até completar n_linhas
+    vendas = rng.choice( modelo['n_vendas'], size = n_linhas, p = modelo['p_vendas'] )
+    k = int( np.searchsorted( np.cumsum( vendas ), n_linhas ) ) + 1
+    vendas = vendas[:k]
+
+    amostra = rng.integers( 0, len( imoveis ), k )
+    base = imoveis.iloc[amostra].reset_index( drop = True )
+
+    base['id'] = id_inicial + np.arange( k, dtype = 'int64' )
+
+    # Área e preço variam juntos (elasticidade), mais um ruído próprio do preço
+    fator_area = np.exp( rng.normal( 0, SIGMA_AREA, k ) )
+    for col in ['sqft_living', 'sqft_above', 'sqft_basement']:
+        base[col] = np.round( base[col].to_numpy() * fator_area ).astype( 'int64' )
+
+    base['sqft_lot'] = np.maximum( np.round( base['sqft_lot'].to_numpy() * np.exp( rng.normal( 0, SIGMA_TERRENO, k ) ) ), 1 ).astype( 'int64' )
+
+    preco = base['price'].to_numpy() * fator_area ** modelo['elasticidade'] * np.exp( rng.normal( 0, SIGMA_PRECO, k ) )
+
+    base['lat'] = np.round( base['lat'].to_numpy() + rng.normal( 0, 1, k ) * modelo['sigma_lat'][amostra], 4 )
+    base['long'] = np.round( base['long'].to_numpy() + rng.normal( 0, 1, k ) * modelo['sigma_long'][amostra], 3 )
+
+    base.loc[ rng.random( k ) < modelo['taxa_outlier'], 'bedrooms' ] = 33
+
+    # Uma linha por venda: a primeira na data sorteada, as revendas depois de um intervalo e com valorização reais
+    linhas = np.repeat( np.arange( k ), vendas )
+    inicio = np.repeat( np.cumsum( vendas ) - vendas, vendas )
+    revenda = np.arange( len( linhas ) ) > inicio
+
+    revendas = rng.integers( 0, len( modelo['gaps'] ), len( linhas ) )
+    gap = np.where( revenda, modelo['gaps'][revendas], 0 )
+    log_razao = np.where( revenda, np.log( modelo['razoes'][revendas] ), 0.0 )
+
+    gap_acumulado = np.cumsum( gap )
+    gap_acumulado = gap_acumulado - np.repeat( gap_acumulado[ np.cumsum( vendas ) - vendas ], vendas )
+    razao_acumulada = np.cumsum( log_razao )
+    razao_acumulada = razao_acumulada - np.repeat( razao_acumulada[ np.cumsum( vendas ) - vendas ], vendas )
+
+    # Primeira venda adiantada quando as revendas passariam da última data da base
+    ultimo = len( modelo['datas'] ) - 1
+    dia_inicial = modelo['dias'][ rng.integers( 0, len( modelo['dias'] ), k ) ]
+    dia_inicial = np.maximum( dia_inicial - np.maximum( dia_inicial + np.add.reduceat( gap, np.cumsum( vendas ) - vendas ) - ultimo, 0 ), 0 )
+
+    dia = np.minimum( dia_inicial[linhas] + gap_acumulado, ultimo )
+
+    df = base.iloc[linhas].reset_index( drop = True )
+    df['date'] = modelo['datas'][dia]
+    df['price'] = np.round( preco[linhas] * np.exp( razao_acumulada ) )
+
+    # Revendas espalhadas pelo bloco, como na base real
+    df = df.iloc[ rng.permutation( len( df ) )[:n_linhas] ]
+
+    return df[SCHEMA_BRUTO.names].reset_index( drop = True )
+
+
+
+def _iniciar_processo(modelo):
+
+    global _MODELO
+    _MODELO = modelo
+
+
+
+# Bloco já convertido em texto .csv (sem cabeçalho) - a conversão também roda em paralelo
+def _bloco_csv(args):
+
+    n_linhas, id_inicial, seed = args
+
+    return gerar_bloco( _MODELO, n_linhas, id_inicial, seed ).to_csv( index = False, header = False )
+
+
+
+# Gera a base sintética em path_saida com n_linhas vendas, bloco a bloco
+def gerar_base(path_base, path_saida, n_linhas, seed = 42, processos = 1, tamanho_bloco = TAMANHO_CHUNK):
+
+    modelo = modelo_base( pd.read_csv( path_base ) )
+
+    # Sementes independentes por bloco: o resultado não depende do número de processos
+    n_blocos = -( -n_linhas // tamanho_bloco )
+    sementes = np.random.SeedSequence( seed ).spawn( n_blocos )
+
+    blocos = ( ( min( tamanho_bloco, n_linhas - i * tamanho_bloco ), ID_INICIAL + i * tamanho_bloco, sementes[i] )
+               for i in range( n_blocos ) )
+
+    tmp = path_saida + '.tmp'
+    with open( tmp, 'w', encoding = 'utf-8', newline = '' ) as f:
+
+        f.write( ','.join( SCHEMA_BRUTO.names ) + '\n' )
+
+        if processos == 1:
+
+            _iniciar_processo( modelo )
+            for bloco in blocos:
+                f.write( _bloco_csv( bloco ) )
+
+        else:
+
+            # Janela de blocos em andamento, gravados na ordem
+            with ProcessPoolExecutor( max_workers = processos, initializer = _iniciar_processo, initargs = (modelo,) ) as pool:
+
+                pendentes = deque()
+                for bloco in blocos:
+
+                    pendentes.append( pool.submit( _bloco_csv, bloco ) )
+
+                    if len( pendentes ) >= processos * BLOCOS_POR_PROCESSO:
+                        f.write( pendentes.popleft().result() )
+
+                while pendentes:
+                    f.write( pendentes.popleft().result() )
+
+    os.replace( tmp, path_saida )
+
+    return n_linhas
+
+
+
+### -----------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser( description = 'Gera uma base sintética no formato de kc_house_data.csv.' )
+    parser.add_argument( 'base', help = 'base real usada como modelo ( kc_house_data.csv )' )
+    parser.add_argument( 'saida', help = 'arquivo .csv gerado' )
+    parser.add_argument( '--linhas', type = int, required = True, help = 'quantidade de vendas' )
+    parser.add_argument( '--seed', type = int, default = 42 )
+    parser.add_argument( '--processos', type = int, default = 1 )
+    parser.add_argument( '--tamanho-bloco', type = int, default = TAMANHO_CHUNK )
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    gerar_base( args.base, args.saida, args.linhas, args.seed, args.processos, args.tamanho_bloco )
+
+    print( '{0} vendas gravadas em {1} ({2:.1f} s)'.format( args.linhas, args.saida, time.perf_counter() - t0 ) )
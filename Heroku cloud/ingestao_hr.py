@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Ingestão incremental de novas vendas na base de imóveis do projeto House Rocket.
+
+Acrescenta um lote de vendas ao .csv, gera os snapshots da nova versão a partir dos
+snapshots anteriores (tratando só as linhas novas) e recalcula balizadores e
+recomendações de compra/venda apenas para os códigos postais do lote. O artefato das
+hipóteses da aba Insights recebe só as somas e contagens do lote.
+
+Com --geojson os códigos postais do lote são conferidos pelas coordenadas ( ver zipcodes_hr.py ):
+zipcodes vazios são preenchidos e os que não batem com o polígono são listados.
+Com --tiles a pirâmide de tiles dos mapas é atualizada só onde entraram vendas ( ver tiles_hr.py ).
+
+Uso: python ingestao_hr.py kc_house_data.csv novas_vendas.csv --geojson Zip_Codes.geojson
+"""
+
+## Libraries ###-------------------------------------------------------------------
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from dados_hr import (carregar_dados, carregar_dados_limpos, caminho_snapshot, data_cleaning,
+                      salvar_snapshot, versao_dados, SCHEMA_BRUTO, SCHEMA_LIMPO)
+from metricas_hr import carregar_hipoteses, agregados_hipoteses, somar_agregados_hipoteses, salvar_hipoteses
+from recomendacoes_hr import carregar_recomendacoes, atualizar_recomendacoes, salvar_recomendacoes
+from zipcodes_hr import indice_zipcodes, preencher_zipcodes
+from tiles_hr import construir_tiles
+
+
+## Functions ###-------------------------------------------------------------------------------------
+
+# Confere se o lote tem as colunas da base bruta e deixa na mesma ordem do .csv
+def validar_vendas(novas):
+
+    faltando = [ col for col in SCHEMA_BRUTO.names if col not in novas.columns ]
+
+    if faltando:
+        raise ValueError( 'Colunas faltando nas novas vendas: {0}'.format( ', '.join( faltando ) ) )
+
+    return novas[SCHEMA_BRUTO.names].reset_index( drop = True )
+
+
+
+# Confere os zipcodes do lote pelas coordenadas: vazios são preenchidos com o ZIP do polígono,
+# divergentes são devolvidos ( id, zipcode, zipcode_geo ) sem correção
+def conferir_lote(novas, path_geojson):
+
+    if 'zipcode' not in novas.columns:
+        novas = novas.assign( zipcode = np.nan )
+
+    novas = preencher_zipcodes( novas, indice_zipcodes( path_geojson ) )
+
+    sem_zipcode = novas['zipcode'].isna()
+    if sem_zipcode.any():
+        raise ValueError( 'Vendas sem zipcode e fora dos polígonos ( ou sem coordenadas ): {0}'.format( ', '.join( map( str, novas.loc[sem_zipcode, 'id'] ) ) ) )
+
+    novas['zipcode'] = novas['zipcode'].astype( 'int64' )
+
+    divergentes = novas.loc[ novas['conferencia_zipcode'] == 'divergente', ['id','zipcode','zipcode_geo'] ].reset_index( drop = True )
+
+    return novas, divergentes
+
+
+
+# Acrescenta as novas vendas à base e atualiza snapshots e recomendações de forma incremental
+def adicionar_vendas(path, novas, path_geojson = None):
+
+    divergentes = None
+    if path_geojson is not None:
+        novas, divergentes = conferir_lote( novas, path_geojson )
+
+    novas = validar_vendas( novas )
+
+    if novas.empty:
+        return { 'linhas': 0, 'zipcodes': [], 'versao': versao_dados( path ), 'divergentes': divergentes }
+
+    # Estado da versão atual (gerado agora se ainda não existir)
+    df_bruto = carregar_dados( path )
+    df_clean = carregar_dados_limpos( path )
+    agregados, df_compra = carregar_recomendacoes( path )
+    hipoteses = carregar_hipoteses( path )
+
+    # 1. Grava o lote no .csv - a partir daqui a versão da base muda
+    novas.to_csv( path, mode = 'a', header = False, index = False )
+
+    # 2. Snapshots da nova versão: anteriores + lote (data_cleaning é por linha, só o lote precisa ser tratado)
+    df_bruto = pd.concat([ df_bruto, novas ], ignore_index = True)
+    salvar_snapshot( df_bruto, caminho_snapshot( path, 'bruto' ), SCHEMA_BRUTO )
+
+    novas_clean = data_cleaning( novas.copy() )
+    df_clean = pd.concat([ df_clean, novas_clean ], ignore_index = True)
+    salvar_snapshot( df_clean, caminho_snapshot( path, 'limpo' ), SCHEMA_LIMPO )
+
+    # 3. Balizadores e recomendações recalculados só nas regiões do lote
+    zipcodes = sorted( novas['zipcode'].unique().tolist() )
+
+    df_clean_zips = df_clean.loc[ df_clean['zipcode'].isin( zipcodes ) ]
+    agregados, df_compra = atualizar_recomendacoes( agregados, df_compra, df_clean_zips, zipcodes )
+
+    versao = versao_dados( path )
+    salvar_recomendacoes( path, agregados, df_compra, versao )
+
+    # 4. Artefato das hipóteses: somas e contagens do lote acrescentadas às da versão anterior
+    salvar_hipoteses( path, somar_agregados_hipoteses( hipoteses, agregados_hipoteses( novas_clean ) ), versao )
+
+    return { 'linhas': len( novas ), 'zipcodes': zipcodes, 'versao': versao, 'divergentes': divergentes }
+
+
+
+### -----------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser( description = 'Acrescenta novas vendas à base de imóveis.' )
+    parser.add_argument( 'base', help = 'arquivo .csv da base ( kc_house_data.csv )' )
+    parser.add_argument( 'novas', help = 'arquivo .csv com as novas vendas, mesmas colunas da base' )
+    parser.add_argument( '--geojson', default = None, help = 'polígonos dos códigos postais para conferir os zipcodes do lote' )
+    parser.add_argument( '--divergencias', default = None, help = 'arquivo .csv para gravar os zipcodes divergentes' )
+    parser.add_argument( '--tiles', action = 'store_true', help = 'atualiza a pirâmide de tiles dos mapas ( incremental )' )
+    args = parser.parse_args()
+
+    if not os.path.exists( args.base ):
+        parser.error( 'base não encontrada: {0}'.format( args.base ) )
+
+    resumo = adicionar_vendas( args.base, pd.read_csv( args.novas ), args.geojson )
+
+    print( '{0} vendas adicionadas, {1} códigos postais atualizados, versão {2}'.format(
+           resumo['linhas'], len( resumo['zipcodes'] ), resumo['versao'] ) )
+
+    if resumo['divergentes'] is not None:
+
+        print( '  {0} zipcodes divergentes das coordenadas'.format( len( resumo['divergentes'] ) ) )
+
+        if args.divergencias:
+            resumo['divergentes'].to_csv( args.divergencias, index = False )
+
+    if args.tiles:
+
+        for r in construir_tiles( args.base, os.cpu_count() or 1 ):
+            print( '  tiles {camada}: {tiles_gravados} gravados de {tiles_processados} processados'.format( **r ) )
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentação leve das etapas do projeto House Rocket.
+
+Cada etapa medida vira um registro com tempo (s), variação da memória residente (RSS) atual
+do processo entre o início e o fim da etapa, pico de RSS do processo até ali e quantidade de
+linhas. Os registros de cada execução ficam numa lista (para o painel de desempenho da
+aplicação) e também são emitidos como linhas JSON no logger 'house_rocket.etapas', para
+agregar entre sessões.
+
+A memória é do processo inteiro: no Streamlit as sessões rodam em threads do mesmo processo,
+então a variação de RSS de uma etapa inclui o que outras sessões alocaram ao mesmo tempo.
+"""
+
+## Libraries ###-------------------------------------------------------------------
+
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+## Configuração ###----------------------------------------------------------------
+
+logger = logging.getLogger( 'house_rocket.etapas' )
+
+# Memória residente atual do processo ( Linux ) - segundo campo, em páginas
+PROC_STATM = '/proc/self/statm'
+
+
+## Functions ###-------------------------------------------------------------------------------------
+
+# Memória residente atual do processo em bytes ( /proc/self/statm ) ou None fora do Linux
+def rss_atual():
+
+    try:
+        with open( PROC_STATM ) as f:
+            paginas = int( f.read().split()[1] )
+    except (OSError, ValueError, IndexError):
+        return None
+
+    return paginas * os.sysconf( 'SC_PAGE_SIZE' )
+
+
+
+# Pico de memória residente do processo desde o início, em bytes (ru_maxrss vem em KB no Linux e em bytes no macOS)
+# ou None - só cresce, não serve para medir uma etapa que fica abaixo de um pico anterior
+def pico_rss():
+
+    if resource is None:
+        return None
+
+    pico = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+
+    return pico if sys.platform == 'darwin' else pico * 1024
+
+
+
+# Handler que escreve uma linha JSON por etapa no stderr - chamado uma vez, não duplica handlers
+def configurar_log(nivel = logging.INFO):
+
+    if not logger.handlers:
+
+        handler = logging.StreamHandler()
+        handler.setFormatter( logging.Formatter( '%(message)s' ) )
+
+        logger.addHandler( handler )
+        logger.setLevel( nivel )
+        logger.propagate = False
+
+    return logger
+
+
+
+# Registros das etapas de uma execução (rerun) de uma sessão
+class Instrumentacao:
+
+    def __init__(self, sessao = None):
+
+        self.sessao = sessao
+        self.execucao = uuid.uuid4().hex[:12]
+        self.registros = []
+
+        self._inicio = time.perf_counter()
+
+
+    # Mede o bloco: with inst.etapa( 'data_cleaning', linhas = len( df ) ) as reg: ... - reg['linhas'] pode ser
+    # preenchido dentro do bloco quando a quantidade só é conhecida no fim
+    @contextmanager
+    def etapa(self, nome, linhas = None):
+
+        registro = { 'etapa': nome, 'linhas': linhas }
+
+        rss_antes = rss_atual()
+        t0 = time.perf_counter()
+
+        try:
+            yield registro
+        finally:
+
+            registro['tempo_s'] = round( time.perf_counter() - t0, 4 )
+
+            rss_depois = rss_atual()
+            registro['rss_delta_bytes'] = None if rss_antes is None or rss_depois is None else rss_depois - rss_antes
+            registro['pico_rss_processo_bytes'] = pico_rss()
+
+            self.registros.append( registro )
+
+            logger.info( json.dumps({ 'sessao': self.sessao, 'execucao': self.execucao, 'ts': round( time.time(), 3 ),
+                                      **registro }, ensure_ascii = False, default = str) )
+
+
+    # Mede uma chamada e devolve o resultado: fig = inst.medir( 'plotly', px.line, df, x = ..., y = ... )
+    def medir(self, nome, funcao, *args, **kwargs):
+
+        linhas = len( args[0] ) if args and isinstance( args[0], pd.DataFrame ) else None
+
+        with self.etapa( nome, linhas ):
+            return funcao( *args, **kwargs )
+
+
+    # Registros da execução em uma tabela (ordem em que as etapas terminaram)
+    def tabela(self):
+
+        colunas = ['etapa', 'tempo_s', 'rss_delta_bytes', 'pico_rss_processo_bytes', 'linhas']
+
+        return pd.DataFrame( self.registros, columns = colunas )
+
+
+    # Tempo, quantidade de medições e linhas somados por etapa
+    def resumo(self):
+
+        return self.tabela().groupby( 'etapa', sort = False ).agg( tempo_s = ('tempo_s', 'sum'), medicoes = ('tempo_s', 'count'),
+                                                                   linhas = ('linhas', 'sum') ).reset_index()
+
+
+    def tempo_total(self):
+
+        return sum( r['tempo_s'] for r in self.registros )
+
+
+    # Tempo desde a criação ( início do rerun na aplicação )
+    def tempo_execucao(self):
+
+        return round( time.perf_counter() - self._inicio, 4 )
+
+
+    # Linha JSON de fechamento da execução com a latência total, soma das etapas e campos extras ( ex.: aba )
+    def finalizar(self, **extras):
+
+        resumo = { 'sessao': self.sessao, 'execucao': self.execucao, 'ts': round( time.time(), 3 ), 'etapa': 'execucao',
+                   'tempo_s': self.tempo_execucao(), 'tempo_etapas_s': round( self.tempo_total(), 4 ),
+                   'etapas': len( self.registros ), 'rss_bytes': rss_atual(), 'pico_rss_processo_bytes': pico_rss(), **extras }
+
+        logger.info( json.dumps( resumo, ensure_ascii = False, default = str ) )
+
+        return resumo
@@ -0,0 +1,483 @@
+# -*- coding: utf-8 -*-
+"""
+Funções de apoio aos mapas (Folium) do projeto House Rocket.
+
+Marcadores em massa: as coordenadas e os campos do popup vão para a página como arrays
+compactos e os marcadores são criados no navegador (FastMarkerCluster), em vez de um
+objeto folium.Marker com o texto do popup montado em Python para cada imóvel.
+
+Geometrias das regiões: os polígonos de Zip_Codes.geojson são pré-simplificados em alguns
+níveis de tolerância e gravados em binário (WKB) indexados por ZIP; os mapas de calor abrem
+enquadrados nas regiões mostradas, pegam o nível adequado a esse zoom e buscam os polígonos pela
+chave, sem filtrar o GeoDataFrame inteiro.
+
+Grade de densidade: as vendas são agregadas em células quadradas (tiles Web Mercator subdivididos)
+em alguns níveis de zoom, com quantidade e preço/m2 médio por célula; a página recebe só as células
+e desenha o nível do zoom atual, então o tamanho não depende da quantidade de imóveis.
+
+Cache de HTML: o HTML já renderizado dos mapas fica guardado (LRU limitado por tamanho em bytes),
+com chave pelos filtros normalizados e pela versão da base, e é reaproveitado entre reruns e sessões.
+"""
+
+## Libraries ###-------------------------------------------------------------------
+
+import os
+import threading
+from collections import OrderedDict
+
+import folium
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import shapely.wkb
+from branca.element import MacroElement, Template
+from folium.plugins import FastMarkerCluster
+from shapely.geometry import mapping
+
+from dados_hr import hash_arquivo, PASTA_SNAPSHOT
+
+
+## Geometrias ###------------------------------------------------------------------
+
+# Versão do formato do arquivo de geometrias
+VERSAO_GEOMETRIAS = 1
+
+# Tolerâncias de simplificação (em graus) - 0.0 guarda o polígono original
+TOLERANCIAS = [0.0, 0.0002, 0.0005, 0.001, 0.003]
+
+# Zoom inicial dos mapas Folium ( padrão do folium.Map ) e limites do zoom de enquadramento das regiões
+ZOOM_MAPA = 10
+ZOOM_MINIMO = 8
+ZOOM_MAXIMO = 16
+
+# Tamanho (px) dos mapas na página ( mapa_static da aplicação )
+LARGURA_MAPA_PX = 700
+ALTURA_MAPA_PX = 500
+
+# Casas decimais das coordenadas enviadas para a página (~1 m)
+CASAS_DECIMAIS_GEOMETRIA = 5
+
+SCHEMA_GEOMETRIAS = pa.schema([ ('ZIP', pa.int64()), ('tolerancia', pa.float64()), ('wkb', pa.binary()) ])
+
+
+## Grade ###-----------------------------------------------------------------------
+
+# Zoom do mapa a partir do qual cada nível da grade é usado
+NIVEIS_GRADE = [8, 10, 12, 14]
+
+# Cada tile do nível é dividido em 2^SUBDIVISAO_GRADE x 2^SUBDIVISAO_GRADE células ( 3 = células de 32 px )
+SUBDIVISAO_GRADE = 3
+
+# Cores das classes de quantidade por célula ( YlOrRd ) - classes por quantis dentro de cada nível
+CORES_GRADE = ['#ffffb2', '#fed976', '#feb24c', '#fd8d3c', '#f03b20', '#bd0026']
+
+
+## Cache ###-----------------------------------------------------------------------
+
+# Tamanho máximo (bytes) do HTML guardado no cache de mapas
+MAX_BYTES_CACHE = 256 * 1024 * 1024
+
+
+## Popups ###----------------------------------------------------------------------
+
+# Função JavaScript executada no navegador para cada linha dos dados - row[0] e row[1] são lat e long,
+# {popup} é uma expressão JavaScript que monta o texto do popup a partir das demais posições de row
+CALLBACK_MARCADOR = '''function (row) {{
+    var marker = L.marker( new L.LatLng( row[0], row[1] ) );
+    marker.bindPopup( {popup} );
+    return marker;
+}}'''
+
+# Popup do mapa de densidade da Visão Geral
+# colunas: lat, long, price, date_str, m2_living, bedrooms, bathrooms, yr_built
+COLUNAS_POPUP_DENSIDADE = ['lat', 'long', 'price', 'date_str', 'm2_living', 'bedrooms', 'bathrooms', 'yr_built']
+
+POPUP_DENSIDADE = ( "'Vendido por $' + row[2] + ' em: ' + row[3] + '. Características: ' + row[4] + "
+                    "' m2 de área construída, ' + row[5] + ' quartos,' + row[6] + ' banheiros, ano construção: ' + row[7]" )
+
+# Popup do mapa de imóveis investidos ( aba Recomendações de Investimento )
+# colunas: lat, long, Preço Venda estimado, Lucro estimado, ROI estimado, Área construída(m2), bedrooms, bathrooms, yr_built
+COLUNAS_POPUP_INVESTIDOS = ['lat', 'long', 'Preço Venda estimado', 'Lucro estimado', 'ROI estimado',
+                            'Área construída(m2)', 'bedrooms', 'bathrooms', 'yr_built']
+
+POPUP_INVESTIDOS = ( "'Preço estimado de venda: $' + row[2].toFixed(2) + ', Lucro: $' + row[3].toFixed(2) + "
+                     "', ROI: ' + row[4].toFixed(2) + '%. Características: ' + row[5].toFixed(2) + "
+                     "' m2 de área construída, ' + row[6] + ' quartos,' + row[7] + ' banheiros, ano construção: ' + row[8] + '.'" )
+
+
+## Functions ###-------------------------------------------------------------------------------------
+
+# Linhas compactas (listas) com as colunas dos marcadores - floats arredondados para diminuir o tamanho da página
+def dados_marcadores(df, colunas, casas_decimais = 2):
+
+    dados = df[colunas].copy()
+
+    for col in dados.columns[2:]:
+        if dados[col].dtype.kind == 'f':
+            dados[col] = np.round( dados[col].to_numpy(), casas_decimais )
+
+    return dados.values.tolist()
+
+
+
+# Adiciona ao mapa um cluster de marcadores criados no navegador a partir das colunas do DataFrame
+def marcadores_cluster(mapa, df, colunas, popup):
+
+    cluster = FastMarkerCluster( dados_marcadores( df, colunas ),
+                                 callback = CALLBACK_MARCADOR.format( popup = popup ) )
+
+    cluster.add_to( mapa )
+
+    return cluster
+
+
+
+## Geometrias ###-------------------------------------------------------------------------------------
+
+# Caminho do arquivo de geometrias simplificadas - chave pelo hash do .geojson, como os snapshots da base
+def caminho_geometrias(path_geojson):
+
+    pasta = os.path.join( os.path.dirname( os.path.abspath( path_geojson ) ), PASTA_SNAPSHOT )
+    base = os.path.splitext( os.path.basename( path_geojson ) )[0]
+
+    return os.path.join( pasta, '{0}_geom_v{1}_{2}.arrow'.format( base, VERSAO_GEOMETRIAS, hash_arquivo( path_geojson )[:16] ) )
+
+
+
+# Pré-processamento: simplifica os polígonos de cada ZIP em cada tolerância e grava tudo em WKB (Arrow/Feather)
+def preparar_geometrias(path_geojson, path_saida = None, tolerancias = TOLERANCIAS):
+
+    import geopandas
+
+    path_saida = path_saida or caminho_geometrias( path_geojson )
+
+    geofile = geopandas.read_file( path_geojson )
+    geofile = geofile.loc[ geofile['ZIP'].notna() & geofile.geometry.notna() & ~geofile.geometry.is_empty, ['ZIP', 'geometry'] ]
+
+    # Uma geometria por ZIP ( regiões com mais de uma feição são unidas )
+    geofile['ZIP'] = geofile['ZIP'].astype( 'int64' )
+    geofile = geofile.dissolve( by = 'ZIP' ).reset_index()
+
+    zips, tols, wkbs = [], [], []
+    for tol in tolerancias:
+
+        geometrias = geofile.geometry if tol == 0 else geofile.geometry.simplify( tol, preserve_topology = True )
+
+        zips.extend( geofile['ZIP'].astype( 'int64' ).tolist() )
+        tols.extend( [float( tol )] * len( geofile ) )
+        wkbs.extend( shapely.wkb.dumps( g ) for g in geometrias )
+
+    os.makedirs( os.path.dirname( os.path.abspath( path_saida ) ), exist_ok = True )
+
+    tabela = pa.Table.from_arrays( [ pa.array( zips, pa.int64() ), pa.array( tols, pa.float64() ), pa.array( wkbs, pa.binary() ) ],
+                                   schema = SCHEMA_GEOMETRIAS )
+
+    tmp = path_saida + '.tmp'
+    feather.write_feather( tabela, tmp, compression = 'uncompressed' )
+    os.replace( tmp, path_saida )
+
+    return path_saida
+
+
+
+# Índice das geometrias: { tolerancia: { ZIP: wkb } } - gera o arquivo pré-processado se ainda não existir
+def carregar_geometrias(path_geojson):
+
+    path_geom = caminho_geometrias( path_geojson )
+
+    if not os.path.exists( path_geom ):
+        preparar_geometrias( path_geojson, path_geom )
+
+    tabela = feather.read_table( path_geom, memory_map = True ).to_pydict()
+
+    geometrias = {}
+    for zip_code, tol, wkb in zip( tabela['ZIP'], tabela['tolerancia'], tabela['wkb'] ):
+        geometrias.setdefault( tol, {} )[zip_code] = wkb
+
+    return geometrias
+
+
+
+# Nível de simplificação para o zoom: maior tolerância que ainda fica abaixo do tamanho de um pixel (tile de 256 px)
+def tolerancia_zoom(geometrias, zoom = ZOOM_MAPA):
+
+    pixel = 360.0 / ( 256 * 2 ** zoom )
+
+    return max( tol for tol in geometrias if tol <= pixel )
+
+
+
+# Centro [lat, long] e zoom que enquadram as regiões pedidas no mapa ( ZOOM_MAPA se nenhuma for encontrada ).
+# Os limites vêm do nível mais simplificado, que já basta para o retângulo envolvente.
+def enquadramento_regioes(geometrias, zipcodes, largura = LARGURA_MAPA_PX, altura = ALTURA_MAPA_PX):
+
+    nivel = geometrias[ max( geometrias ) ]
+    wkbs = [ nivel[z] for z in dict.fromkeys( int( z ) for z in zipcodes ) if z in nivel ]
+
+    if not wkbs:
+        return None, ZOOM_MAPA
+
+    limites = np.array([ shapely.wkb.loads( wkb ).bounds for wkb in wkbs ])
+    long_min, lat_min = limites[:, 0].min(), limites[:, 1].min()
+    long_max, lat_max = limites[:, 2].max(), limites[:, 3].max()
+
+    # Em Web Mercator a largura de um tile no zoom z é 360 / 2^z graus; na vertical a escala cresce com 1 / cos(lat)
+    lat_centro = ( lat_min + lat_max ) / 2
+    graus_long = max( long_max - long_min, 1e-6 )
+    graus_lat = max( lat_max - lat_min, 1e-6 ) / np.cos( np.radians( lat_centro ) )
+
+    zoom = np.floor( np.log2( min( largura / graus_long, altura / graus_lat ) * 360.0 / 256 ) )
+
+    return [ float( lat_centro ), float( ( long_min + long_max ) / 2 ) ], int( np.clip( zoom, ZOOM_MINIMO, ZOOM_MAXIMO ) )
+
+
+
+# Arredonda as coordenadas de um GeoJSON (listas aninhadas) para diminuir o tamanho da página
+def _arredondar(coords, casas):
+
+    if isinstance( coords[0], (int, float) ):
+        return [ round( c, casas ) for c in coords ]
+
+    return [ _arredondar( c, casas ) for c in coords ]
+
+
+
+# GeoJSON (FeatureCollection) só com as regiões pedidas, buscadas pela chave ZIP no nível do zoom
+def geojson_zipcodes(geometrias, zipcodes, zoom = ZOOM_MAPA):
+
+    nivel = geometrias[ tolerancia_zoom( geometrias, zoom ) ]
+
+    features = []
+    for zip_code in dict.fromkeys( int( z ) for z in zipcodes ):
+
+        wkb = nivel.get( zip_code )
+        if wkb is None:
+            continue
+
+        geometria = mapping( shapely.wkb.loads( wkb ) )
+
+        features.append({ 'type': 'Feature', 'properties': { 'ZIP': zip_code },
+                          'geometry': { 'type': geometria['type'],
+                                        'coordinates': _arredondar( geometria['coordinates'], CASAS_DECIMAIS_GEOMETRIA ) } })
+
+    return { 'type': 'FeatureCollection', 'features': features }
+
+
+
+## Grade ###-----------------------------------------------------------------------------------------
+
+# Coluna e linha da célula ( tile Web Mercator no zoom_celula ) de cada coordenada
+def celulas_grade(lat, long, zoom_celula):
+
+    n = 2 ** zoom_celula
+    lat = np.radians( np.clip( np.asarray( lat, dtype = 'float64' ), -85.0511, 85.0511 ) )
+
+    x = np.floor( ( np.asarray( long, dtype = 'float64' ) + 180.0 ) / 360.0 * n )
+    y = np.floor( ( 1.0 - np.log( np.tan( lat ) + 1.0 / np.cos( lat ) ) / np.pi ) / 2.0 * n )
+
+    return np.clip( x, 0, n - 1 ).astype( 'int64' ), np.clip( y, 0, n - 1 ).astype( 'int64' )
+
+
+
+# Quantidade de vendas e preço/m2 médio por célula em cada nível: { nivel: DataFrame( x, y, quantidade, preco_m2 ) }
+def agregar_grade(df, niveis = NIVEIS_GRADE):
+
+    preco_m2 = df['price_per_m2_living'].to_numpy( dtype = 'float64' )
+
+    grade = {}
+    for nivel in niveis:
+
+        zoom_celula = nivel + SUBDIVISAO_GRADE
+        x, y = celulas_grade( df['lat'], df['long'], zoom_celula )
+
+        # Chave única da célula e somas por bincount ( sem groupby por linha )
+        codigos, inversa = np.unique( x * 2 ** zoom_celula + y, return_inverse = True )
+        quantidade = np.bincount( inversa, minlength = len( codigos ) )
+
+        grade[nivel] = pd.DataFrame({ 'x': codigos // 2 ** zoom_celula, 'y': codigos % 2 ** zoom_celula, 'quantidade': quantidade,
+                                      'preco_m2': np.bincount( inversa, weights = preco_m2, minlength = len( codigos ) ) / quantidade })
+
+    return grade
+
+
+
+# Dados enviados para a página: por nível, zoom das células e linhas [x, y, quantidade, preço/m2 médio, classe de cor]
+def dados_grade(grade):
+
+    niveis = []
+    for nivel, celulas in sorted( grade.items() ):
+
+        quantidade = celulas['quantidade'].to_numpy()
+
+        # Classes de cor por quantis da quantidade ( escala log, poucas células com muitas vendas )
+        limites = np.quantile( np.log1p( quantidade ), np.linspace( 0, 1, len( CORES_GRADE ) + 1 )[1:-1] ) if len( quantidade ) else []
+        classe = np.searchsorted( limites, np.log1p( quantidade ), side = 'right' )
+
+        # Inteiros em listas Python para o JSON não levar casas decimais ( preço/m2 em unidades inteiras )
+        linhas = zip( celulas['x'].tolist(), celulas['y'].tolist(), quantidade.tolist(),
+                      np.round( celulas['preco_m2'].to_numpy() ).astype( 'int64' ).tolist(), classe.tolist() )
+
+        niveis.append({ 'zoom': nivel, 'z': nivel + SUBDIVISAO_GRADE, 'celulas': [ list( linha ) for linha in linhas ] })
+
+    return niveis
+
+
+
+# Camada Leaflet com as células do nível do zoom atual ( só as visíveis ), redesenhada ao mover ou mudar o zoom
+class CamadaGrade(MacroElement):
+
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var mapa = {{ this._parent.get_name() }};
+            var niveis = {{ this.niveis|tojson }};
+            var cores = {{ this.cores|tojson }};
+            var camada = L.layerGroup().addTo( mapa );
+            var renderer = L.canvas();
+
+            function lat(y, z) {
+                var n = Math.PI - 2 * Math.PI * y / Math.pow( 2, z );
+                return 180 / Math.PI * Math.atan( 0.5 * ( Math.exp( n ) - Math.exp( -n ) ) );
+            }
+            function lng(x, z) { return x / Math.pow( 2, z ) * 360 - 180; }
+
+            function desenhar() {
+                var zoom = mapa.getZoom(), nivel = niveis[0];
+                niveis.forEach( function (n) { if ( n.zoom <= zoom ) { nivel = n; } } );
+
+                var limites = mapa.getBounds();
+                camada.clearLayers();
+
+                nivel.celulas.forEach( function (c) {
+                    var celula = L.latLngBounds( [ lat( c[1] + 1, nivel.z ), lng( c[0], nivel.z ) ], [ lat( c[1], nivel.z ), lng( c[0] + 1, nivel.z ) ] );
+                    if ( !limites.intersects( celula ) ) { return; }
+                    L.rectangle( celula, { renderer: renderer, stroke: false, fillColor: cores[c[4]], fillOpacity: 0.6 } )
+                     .bindTooltip( c[2] + ' imóveis, preço/m2 médio $' + c[3] )
+                     .addTo( camada );
+                } );
+            }
+
+            mapa.on( 'moveend', desenhar );
+            desenhar();
+        })();
+        {% endmacro %}
+        """)
+
+    def __init__(self, grade, cores = CORES_GRADE):
+
+        super().__init__()
+        self._name = 'CamadaGrade'
+
+        self.niveis = dados_grade( grade )
+        self.cores = cores
+
+
+
+# Adiciona ao mapa a camada de densidade por células
+def camada_grade(mapa, grade):
+
+    camada = CamadaGrade( grade )
+    camada.add_to( mapa )
+
+    return camada
+
+
+
+## Cache de HTML ###----------------------------------------------------------------------------------
+
+# HTML do mapa como o folium_static gera ( mapa dentro de uma folium.Figure )
+def html_mapa(mapa):
+
+    figura = folium.Figure().add_child( mapa )
+
+    return figura.render()
+
+
+
+# Chave do cache: nome do mapa, versão da base e filtros normalizados (listas viram tuplas ordenadas sem repetição)
+def chave_mapa(nome, versao, **filtros):
+
+    normalizados = []
+    for campo, valor in sorted( filtros.items() ):
+
+        if isinstance( valor, (list, set) ):
+            valor = tuple( sorted( set( valor ) ) )
+        elif isinstance( valor, tuple ):
+            valor = tuple( valor )
+
+        normalizados.append( (campo, valor) )
+
+    return (nome, versao, tuple( normalizados ))
+
+
+
+# Cache LRU de HTML de mapas, limitado pelo total de bytes guardados, com contadores de acertos e faltas.
+# Compartilhado por todas as sessões do processo (Streamlit roda cada sessão em uma thread).
+class CacheHTML:
+
+    def __init__(self, max_bytes = MAX_BYTES_CACHE):
+
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    # Valor guardado (tupla de HTMLs) ou None - um acerto move a chave para o fim (mais recente)
+    def get(self, chave):
+
+        with self._lock:
+
+            valor = self._itens.get( chave )
+
+            if valor is None:
+                self.misses += 1
+                return None
+
+            self._itens.move_to_end( chave )
+            self.hits += 1
+
+            return valor[0]
+
+
+    # Guarda os HTMLs e remove os menos usados até caber no limite de bytes ( tamanho em UTF-8 - popups com acentos
+    # têm mais bytes que caracteres )
+    def put(self, chave, htmls):
+
+        tamanho = sum( len( h.encode( 'utf-8' ) ) for h in htmls )
+
+        with self._lock:
+
+            if chave in self._itens:
+                self.bytes -= self._itens.pop( chave )[1]
+
+            if tamanho <= self.max_bytes:
+
+                self._itens[chave] = (htmls, tamanho)
+                self.bytes += tamanho
+
+            while self.bytes > self.max_bytes:
+
+                _, (_, tamanho_antigo) = self._itens.popitem( last = False )
+                self.bytes -= tamanho_antigo
+                self.evictions += 1
+
+        return htmls
+
+
+    def info(self):
+
+        with self._lock:
+
+            return { 'itens': len( self._itens ), 'bytes': self.bytes, 'max_bytes': self.max_bytes,
+                     'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions }
+
+
+
+# Cache de mapas do processo
+cache_mapas = CacheHTML()
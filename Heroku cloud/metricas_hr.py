@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Agregações da base tratada do projeto House Rocket.
+
+Cubo de agregados por região (zipcode): calculado uma única vez sobre a base tratada,
+as tabelas "Imóveis por Região" e "Estatística Descritiva" de qualquer seleção de
+códigos postais passam a ser reduções sobre o cubo, sem percorrer as linhas da base.
+
+Hipóteses da aba Insights: somas e contagens por combinação dos grupos das hipóteses
+( condição, ano de construção, idade, reforma, vista para água e estação ) calculadas em
+uma passada pela base tratada e gravadas por versão da base - as tabelas H1 a H5 saem
+desse artefato de poucas linhas.
+"""
+
+## Libraries ###-------------------------------------------------------------------
+
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from dados_hr import carregar_dados_limpos, ler_snapshot, versao_dados, PASTA_SNAPSHOT
+
+
+## Colunas ###---------------------------------------------------------------------
+
+# Atributos com médias por região ( tabela Imóveis por Região ), na ordem de apresentação
+COLUNAS_REGIAO = ['price', 'price_per_m2_living', 'price_per_m2_living_outside', 'm2_living', 'm2_outside']
+
+# Atributos da tabela de Estatística Descritiva, na ordem de apresentação
+COLUNAS_ED = ['year', 'age', 'yr_renovated', 'bathrooms','bedrooms','condition','floors','grade',
+              'm2_living', 'm2_outside', 'price', 'price_per_m2_living', 'price_per_m2_living_outside']
+
+# Rótulos das médias das tabelas de hipóteses ( mesmos atributos de COLUNAS_REGIAO )
+ROTULOS_HIPOTESES = ['Preço Médio','Preço / área construída (m2) Médio', 'Preço / área construída + externa (m2) Médio',
+                     'Área Construída (m2) Média', 'Área Externa (m2) Média']
+
+# Grupos das hipóteses no artefato: H1 condição >= 3, H4 construção antes de 1955, H2 idade >= 50 e reforma, H3 vista para água
+GRUPOS_HIPOTESES = ['condicao_boa', 'antigo', 'idade_50', 'renovado', 'vista_agua']
+
+
+## Functions ###-------------------------------------------------------------------------------------
+
+# Cubo de agregados por zipcode: contagem, soma, média, soma dos quadrados dos desvios (m2), mínimo, máximo e mediana
+# de cada atributo, mais o número de imóveis distintos. Guarda também os valores ordenados por região para
+# medianas exatas de seleções com mais de um código postal, e as estatísticas da base inteira (sem filtro).
+def cubo_zipcode(df):
+
+    g = df[['zipcode'] + COLUNAS_ED].groupby('zipcode')
+
+    count = g.count()
+    media = g.mean()
+
+    cubo = {
+        'n_imoveis': df[['zipcode','id']].groupby('zipcode')['id'].nunique(),
+        'count': count,
+        'soma': g.sum(),
+        'media': media,
+        'm2': g.var( ddof = 0 ) * count,
+        'min': g.min(),
+        'max': g.max(),
+        'mediana': g.median(),
+    }
+
+    # Valores de cada atributo ordenados dentro de cada região - posição inicial de cada zipcode em 'inicio'
+    zipcodes = cubo['n_imoveis'].index.to_numpy()
+    valores = {}
+    for col in COLUNAS_ED:
+        ordenado = df[['zipcode', col]].dropna().sort_values(['zipcode', col])
+        valores[col] = ordenado[col].to_numpy()
+
+    cubo['valores'] = valores
+    cubo['inicio'] = pd.DataFrame( np.vstack([ np.r_[0, count[col].cumsum().to_numpy()[:-1]] for col in COLUNAS_ED ]).T,
+                                   index = zipcodes, columns = COLUNAS_ED )
+
+    # Estatísticas da base inteira - caso mais comum (nenhum código postal selecionado)
+    df_var_ed = df[COLUNAS_ED]
+    cubo['total'] = pd.DataFrame({ 'media': df_var_ed.mean(), 'mediana': df_var_ed.median(),
+                                   'desvio': df_var_ed.std( ddof = 0 ), 'max': df_var_ed.max(),
+                                   'min': df_var_ed.min() })
+
+    return cubo
+
+
+
+# Zipcodes da seleção que existem no cubo (lista vazia = todos)
+def selecao_cubo(cubo, zipcodes):
+
+    todos = cubo['n_imoveis'].index
+
+    if not zipcodes:
+        return todos
+
+    return todos[ todos.isin( zipcodes ) ]
+
+
+
+# Tabela "Imóveis por Região" - cada linha já está no cubo, basta selecionar
+def metricas_por_regiao(cubo, zipcodes = None):
+
+    sel = selecao_cubo( cubo, zipcodes )
+
+    m = pd.concat([ cubo['n_imoveis'].loc[sel], cubo['media'].loc[sel, COLUNAS_REGIAO] ], axis = 1).reset_index()
+
+    return m
+
+
+
+# Mediana exata de uma seleção de regiões a partir dos valores ordenados por região
+def _mediana_selecao(cubo, sel, col):
+
+    inicio = cubo['inicio'].loc[sel, col].to_numpy()
+    fim = inicio + cubo['count'].loc[sel, col].to_numpy()
+
+    valores = np.concatenate([ cubo['valores'][col][i:f] for i, f in zip(inicio, fim) ])
+
+    return np.median( valores ) if len( valores ) else np.nan
+
+
+
+# Tabela "Estatística Descritiva" - média, mediana, desvio padrão, máximo e mínimo da seleção combinando o cubo
+def estatistica_descritiva(cubo, zipcodes = None):
+
+    if not zipcodes:
+        return cubo['total'].copy()
+
+    sel = selecao_cubo( cubo, zipcodes )
+
+    count = cubo['count'].loc[sel]
+    n = count.sum()
+    media = cubo['soma'].loc[sel].sum() / n
+
+    # Desvio padrão populacional (ddof = 0) combinando as somas dos quadrados dos desvios de cada região
+    m2 = ( cubo['m2'].loc[sel] + count * ( cubo['media'].loc[sel] - media ) ** 2 ).sum()
+
+    if len( sel ) == 1:
+        mediana = cubo['mediana'].loc[sel[0]]
+    else:
+        mediana = pd.Series({ col: _mediana_selecao( cubo, sel, col ) for col in COLUNAS_ED })
+
+    return pd.DataFrame({ 'media': media, 'mediana': mediana, 'desvio': np.sqrt( m2 / n ),
+                          'max': cubo['max'].loc[sel].max(), 'min': cubo['min'].loc[sel].min() }).loc[COLUNAS_ED]
+
+
+
+# Artefato das hipóteses: uma linha por combinação de grupos e estação com a quantidade de vendas e, para cada
+# atributo, a soma e a quantidade de valores ( médias de qualquer grupo saem daqui sem voltar à base )
+def agregados_hipoteses(df_clean):
+
+    grupos = pd.DataFrame({ 'condicao_boa': df_clean['condition'].to_numpy() >= 3,
+                            'antigo': df_clean['yr_built'].to_numpy() < 1955,
+                            'idade_50': df_clean['age'].to_numpy() >= 50,
+                            'renovado': ( df_clean['is_renovated'] == 'Yes' ).to_numpy(),
+                            'vista_agua': ( df_clean['waterfront'] == 'Yes' ).to_numpy(),
+                            'seasons': df_clean['seasons'].astype( object ).to_numpy() })
+
+    valores = df_clean[COLUNAS_REGIAO].set_axis( grupos.index )
+
+    # sort = False: combinações ( e estações ) na ordem em que aparecem na base
+    g = valores.groupby( [ grupos[c] for c in grupos.columns ], sort = False, dropna = False )
+
+    agregados = pd.concat([ g.size().rename( 'vendas' ),
+                            g.sum( min_count = 0 ).add_prefix( 'soma_' ),
+                            g.count().add_prefix( 'n_' ) ], axis = 1).reset_index()
+
+    return agregados
+
+
+
+# Soma dois artefatos ( base anterior + lote novo na ingestão ) - estações novas ficam no fim
+def somar_agregados_hipoteses(agregados, novos):
+
+    chaves = GRUPOS_HIPOTESES + ['seasons']
+
+    return pd.concat([ agregados, novos ], ignore_index = True).groupby( chaves, sort = False, dropna = False ).sum().reset_index()
+
+
+
+# Médias dos atributos nas linhas do artefato marcadas pela máscara
+def _medias_hipoteses(agregados, mascara, colunas = COLUNAS_REGIAO):
+
+    sel = agregados.loc[mascara]
+
+    soma = sel[[ 'soma_' + c for c in colunas ]].sum().to_numpy()
+    n = sel[[ 'n_' + c for c in colunas ]].sum().to_numpy()
+
+    return pd.Series( np.where( n > 0, soma / np.maximum( n, 1 ), np.nan ), index = colunas )
+
+
+
+# Comparação de um grupo contra o resto ( H1 e H4 ): atributos nas linhas, grupo e resto nas colunas
+def _comparacao_hipoteses(agregados, grupo, nomes):
+
+    tabela = pd.concat([ _medias_hipoteses( agregados, agregados[grupo] ),
+                         _medias_hipoteses( agregados, ~agregados[grupo] ) ], axis = 1)
+
+    tabela.columns = nomes
+    tabela.index = ROTULOS_HIPOTESES
+
+    return tabela
+
+
+
+# Médias por Não/Sim de um grupo ( H2 e H3 ) - só os valores que aparecem, como no groupby das tabelas originais
+def _por_grupo_hipoteses(agregados, grupo, colunas, nomes, mascara = True):
+
+    linhas = []
+    for valor, rotulo in ( (False, 'Não'), (True, 'Sim') ):
+
+        sel = mascara & ( agregados[grupo] == valor )
+        if agregados.loc[sel, 'vendas'].sum() > 0:
+            linhas.append( [rotulo] + _medias_hipoteses( agregados, sel, colunas ).tolist() )
+
+    return pd.DataFrame( linhas, columns = nomes )
+
+
+
+# Tabelas da aba Insights a partir do artefato: H1 a H4 ( comparações de médias ), as versões transpostas
+# dos gráficos de H1 e H4 e a quantidade de vendas por estação ( H5 )
+def tabelas_agregados_hipoteses(agregados):
+
+    price_per_condition = _comparacao_hipoteses( agregados, 'condicao_boa', ['Condições Boas','Condições Ruins'] )
+
+    df_price_renovated = _por_grupo_hipoteses( agregados, 'renovado', ['price','price_per_m2_living','m2_living'],
+                                               ['Renovado','Preço Médio','Preço / área construída (m2) Médio', 'Área Construída (m2) Média'],
+                                               mascara = agregados['idade_50'] )
+
+    df_price_waterfront = _por_grupo_hipoteses( agregados, 'vista_agua', COLUNAS_REGIAO, ['Vista Água'] + ROTULOS_HIPOTESES )
+
+    df3 = _comparacao_hipoteses( agregados, 'antigo', ['Antigos','Novos'] )
+
+    estacoes = agregados.groupby( 'seasons', sort = False )['vendas'].sum().rename_axis( 'Estação' ).reset_index( name = 'Quantidade' )
+
+    return { 'condicao': price_per_condition,
+             'condicao_grafico': price_per_condition.T.rename_axis( 'Condição' ).reset_index(),
+             'reforma': df_price_renovated,
+             'vista_agua': df_price_waterfront,
+             'ano_construcao': df3,
+             'ano_construcao_grafico': df3.T.rename_axis( '1955' ).reset_index(),
+             'estacoes': estacoes }
+
+
+
+## Persistência ###-----------------------------------------------------------------------------------
+
+# Caminho do artefato das hipóteses de uma versão da base - com o ano atual, porque a idade dos imóveis depende dele
+def caminho_hipoteses(path, versao = None):
+
+    pasta = os.path.join( os.path.dirname( os.path.abspath( path ) ), PASTA_SNAPSHOT )
+    base = os.path.splitext( os.path.basename( path ) )[0]
+    versao = versao or versao_dados( path )
+
+    return os.path.join( pasta, '{0}_hipoteses_{1}_{2}.arrow'.format( base, versao, datetime.now().year ) )
+
+
+
+def salvar_hipoteses(path, agregados, versao = None):
+
+    destino = caminho_hipoteses( path, versao )
+    os.makedirs( os.path.dirname( destino ), exist_ok = True )
+
+    tmp = destino + '.tmp'
+    feather.write_feather( pa.Table.from_pandas( agregados, preserve_index = False ), tmp, compression = 'uncompressed' )
+    os.replace( tmp, destino )
+
+
+
+# Artefato das hipóteses da versão atual da base - calcula e grava se ainda não existir
+def carregar_hipoteses(path):
+
+    destino = caminho_hipoteses( path )
+
+    if os.path.exists( destino ):
+        return ler_snapshot( destino )
+
+    agregados = agregados_hipoteses( carregar_dados_limpos( path ) )
+    salvar_hipoteses( path, agregados )
+
+    return agregados
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline em lote (sem Streamlit) das recomendações do projeto House Rocket.
+
+Leitura da base -> data_cleaning -> balizadores e análise de compra/venda -> exportação.
+Como tratamento e recomendações dependem só das vendas de cada código postal, a base é
+dividida em partições de códigos postais e cada partição é processada em um processo.
+
+Uso: python pipeline_hr.py kc_house_data.csv saida --processos 8 --formato csv
+"""
+
+## Libraries ###-------------------------------------------------------------------
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from dados_hr import carregar_dados, data_cleaning
+from recomendacoes_hr import recomendacoes, calcular_compra_venda, BACKEND_MEDIANAS
+
+
+## Configuração ###----------------------------------------------------------------
+
+# Partições por processo - mais de uma ajuda a equilibrar regiões de tamanhos diferentes
+PARTICOES_POR_PROCESSO = 4
+
+# Formatos de exportação aceitos
+FORMATOS = ['csv', 'arrow']
+
+
+## Functions ###-------------------------------------------------------------------------------------
+
+# Divide os códigos postais em n partições com quantidades de vendas parecidas (maiores regiões primeiro)
+def particoes_zipcode(df, n):
+
+    contagem = df['zipcode'].value_counts()
+
+    cargas = [0] * n
+    particoes = [ [] for _ in range( n ) ]
+
+    for zip_code, quantidade in contagem.items():
+
+        i = cargas.index( min( cargas ) )
+
+        particoes[i].append( zip_code )
+        cargas[i] += quantidade
+
+    return [ p for p in particoes if p ]
+
+
+
+# Processa uma partição (vendas brutas de alguns códigos postais): tratamento, balizadores, compra e venda
+def processar_particao(df_bruto, backend = BACKEND_MEDIANAS):
+
+    df_clean = data_cleaning( df_bruto.reset_index( drop = True ) )
+
+    agregados, df_compra = recomendacoes( df_clean, backend )
+    df_compra_venda = calcular_compra_venda( df_compra, agregados )
+
+    return agregados, df_compra, df_compra_venda
+
+
+
+# Junta os resultados das partições na mesma ordem do cálculo na base inteira
+def juntar_resultados(resultados):
+
+    agregados, df_compra, df_compra_venda = ( pd.concat( partes, ignore_index = True ) for partes in zip( *resultados ) )
+
+    agregados = agregados.sort_values(by = ['zipcode','seasons'], ignore_index = True)
+    df_compra = df_compra.sort_values(by = ['id','date'], ascending = False, ignore_index = True)
+    df_compra_venda = df_compra_venda.sort_values(by = ['id','date'], ascending = False, ignore_index = True)
+
+    return agregados, df_compra, df_compra_venda
+
+
+
+def exportar(df, destino, formato):
+
+    tmp = destino + '.tmp'
+
+    if formato == 'csv':
+        df.to_csv( tmp, index = False )
+    else:
+        feather.write_feather( pa.Table.from_pandas( df, preserve_index = False ), tmp, compression = 'uncompressed' )
+
+    os.replace( tmp, destino )
+
+
+
+# Executa o pipeline completo e grava agregados, lista de compra e preços de venda na pasta de saída
+def executar_pipeline(path, pasta_saida, processos = None, formato = 'csv', backend = BACKEND_MEDIANAS):
+
+    if formato not in FORMATOS:
+        raise ValueError( 'formato deve ser um de {0}: {1}'.format( FORMATOS, formato ) )
+
+    processos = processos or os.cpu_count() or 1
+    tempos = {}
+
+    t0 = time.perf_counter()
+    df_bruto = carregar_dados( path )
+    tempos['leitura_s'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    particoes = [ df_bruto.loc[ df_bruto['zipcode'].isin( zips ) ]
+                  for zips in particoes_zipcode( df_bruto, processos * PARTICOES_POR_PROCESSO ) ]
+
+    if processos == 1:
+        resultados = [ processar_particao( p, backend ) for p in particoes ]
+    else:
+        with ProcessPoolExecutor( max_workers = processos ) as pool:
+            resultados = list( pool.map( processar_particao, particoes, [backend] * len( particoes ) ) )
+
+    agregados, df_compra, df_compra_venda = juntar_resultados( resultados )
+    tempos['processamento_s'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    os.makedirs( pasta_saida, exist_ok = True )
+
+    arquivos = {}
+    for nome, df in ( ('agregados', agregados), ('compra', df_compra), ('venda', df_compra_venda) ):
+
+        arquivos[nome] = os.path.join( pasta_saida, '{0}.{1}'.format( nome, formato ) )
+        exportar( df, arquivos[nome], formato )
+
+    tempos['exportacao_s'] = time.perf_counter() - t0
+
+    return { 'vendas': len( df_bruto ), 'zipcodes': int( df_bruto['zipcode'].nunique() ), 'particoes': len( particoes ),
+             'processos': processos, 'compra': int( ( df_compra['status'] == 'Compra' ).sum() ),
+             'arquivos': arquivos, 'tempos': { k: round( v, 3 ) for k, v in tempos.items() } }
+
+
+
+### -----------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser( description = 'Gera as recomendações de compra e venda sem a aplicação web.' )
+    parser.add_argument( 'dados', help = 'arquivo .csv da base ( kc_house_data.csv )' )
+    parser.add_argument( 'saida', help = 'pasta onde gravar agregados, compra e venda' )
+    parser.add_argument( '--processos', type = int, default = None, help = 'processos em paralelo (padrão: todos os núcleos)' )
+    parser.add_argument( '--formato', choices = FORMATOS, default = 'csv' )
+    parser.add_argument( '--backend', choices = ['exato', 'sketch'], default = BACKEND_MEDIANAS, help = 'cálculo das medianas' )
+    args = parser.parse_args()
+
+    if not os.path.exists( args.dados ):
+        parser.error( 'base não encontrada: {0}'.format( args.dados ) )
+
+    resumo = executar_pipeline( args.dados, args.saida, args.processos, args.formato, args.backend )
+
+    print( '{0} vendas, {1} códigos postais em {2} partições ({3} processos): {4} imóveis para compra'.format(
+           resumo['vendas'], resumo['zipcodes'], resumo['particoes'], resumo['processos'], resumo['compra'] ) )
+
+    for nome, arquivo in resumo['arquivos'].items():
+        print( '  {0}: {1}'.format( nome, arquivo ) )
+
+    print( '  tempos: {0}'.format( resumo['tempos'] ) )
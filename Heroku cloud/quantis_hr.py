@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+Sketches de quantis (KLL) para as medianas de preço/m2 por região e por região e estação.
+
+Cada sketch usa memória limitada pelo erro escolhido, recebe valores em blocos e pode ser
+mesclado com outros sketches (de outros blocos, processos ou lotes de ingestão), então
+os balizadores de compra e venda podem ser mantidos sem a coluna inteira na memória.
+
+Os imóveis já vistos ( para contar cada imóvel uma vez ) ficam num filtro de Bloom de tamanho
+fixo, também mesclável: um imóvel novo é tomado por já visto com probabilidade de no máximo
+FALSO_POSITIVO_IDS enquanto a quantidade de imóveis distintos não passar de CAPACIDADE_IDS.
+
+Uso: python quantis_hr.py kc_house_data.csv --erro 0.01   ( relatório de precisão )
+"""
+
+## Libraries ###-------------------------------------------------------------------
+
+import argparse
+import math
+
+import numpy as np
+import pandas as pd
+
+
+## Configuração ###----------------------------------------------------------------
+
+# Erro de rank padrão (fração) das medianas aproximadas
+ERRO_SKETCH = 0.01
+
+# Fator de decaimento da capacidade dos níveis do KLL
+C_KLL = 2.0 / 3.0
+
+# Filtro de Bloom dos ids: imóveis distintos previstos e taxa de falso positivo nessa quantidade ( ~9 MB )
+CAPACIDADE_IDS = 5000000
+FALSO_POSITIVO_IDS = 0.001
+
+
+## Sketch ###----------------------------------------------------------------------
+
+# Sketch KLL (Karnin, Lang, Liberty): níveis de "compactadores"; quando um nível enche, seus valores são
+# ordenados e metade deles (posições pares ou ímpares, ao acaso) sobe para o nível seguinte com peso dobrado
+class KLL:
+
+    def __init__(self, erro = ERRO_SKETCH, seed = None):
+
+        self.erro = erro
+        self.k = int( math.ceil( 1.65 / erro ) )
+        self.n = 0
+
+        self._niveis = [ np.zeros( 0 ) ]
+        self._rng = np.random.default_rng( seed )
+
+
+    # Capacidade do nível h - os níveis mais altos guardam mais valores (k no topo, decaindo por C_KLL)
+    def _capacidade(self, h):
+
+        profundidade = len( self._niveis ) - h - 1
+
+        return int( math.ceil( ( C_KLL ** profundidade ) * self.k ) ) + 1
+
+
+    def _tamanho(self):
+
+        return sum( len( nivel ) for nivel in self._niveis )
+
+
+    def _tamanho_maximo(self):
+
+        return sum( self._capacidade( h ) for h in range( len( self._niveis ) ) )
+
+
+    # Compacta o primeiro nível cheio até o sketch voltar a caber na memória prevista
+    def _comprimir(self):
+
+        while self._tamanho() >= self._tamanho_maximo():
+
+            for h, nivel in enumerate( self._niveis ):
+
+                if len( nivel ) >= self._capacidade( h ):
+
+                    if h + 1 == len( self._niveis ):
+                        self._niveis.append( np.zeros( 0 ) )
+
+                    ordenado = np.sort( nivel )
+
+                    # Com quantidade ímpar, o último valor fica no nível atual
+                    sobra = ordenado[-1:] if len( ordenado ) % 2 else ordenado[:0]
+                    pares = ordenado[:len( ordenado ) - len( sobra )]
+
+                    self._niveis[h + 1] = np.concatenate([ self._niveis[h + 1], pares[ self._rng.integers( 0, 2 )::2 ] ])
+                    self._niveis[h] = sobra
+
+                    break
+
+
+    # Acrescenta um bloco de valores (NaN são ignorados)
+    def atualizar(self, valores):
+
+        valores = np.asarray( valores, dtype = float )
+        valores = valores[ ~np.isnan( valores ) ]
+
+        self.n += len( valores )
+        self._niveis[0] = np.concatenate([ self._niveis[0], valores ])
+        self._comprimir()
+
+        return self
+
+
+    # Junta outro sketch neste (mesmo resultado aproximado de ter visto os dois conjuntos de valores)
+    def mesclar(self, outro):
+
+        while len( self._niveis ) < len( outro._niveis ):
+            self._niveis.append( np.zeros( 0 ) )
+
+        for h, nivel in enumerate( outro._niveis ):
+            self._niveis[h] = np.concatenate([ self._niveis[h], nivel ])
+
+        self.n += outro.n
+        self._comprimir()
+
+        return self
+
+
+    # Quantil q (0 a 1) - sem nenhuma compactação ainda, é o valor exato ( mesma mediana do pandas )
+    def quantil(self, q):
+
+        if self.n == 0:
+            return np.nan
+
+        if all( len( nivel ) == 0 for nivel in self._niveis[1:] ):
+            return float( np.quantile( self._niveis[0], q ) )
+
+        valores = np.concatenate( self._niveis )
+        pesos = np.concatenate([ np.full( len( nivel ), 2 ** h ) for h, nivel in enumerate( self._niveis ) ])
+
+        ordem = np.argsort( valores, kind = 'stable' )
+        acumulado = np.cumsum( pesos[ordem] )
+
+        posicao = np.searchsorted( acumulado, q * acumulado[-1], 'left' )
+
+        return float( valores[ordem][ min( posicao, len( valores ) - 1 ) ] )
+
+
+    def mediana(self):
+
+        return self.quantil( 0.5 )
+
+
+
+# Mistura de bits de 64 bits ( splitmix64 ) - espalha ids sequenciais por todo o filtro
+def _misturar(x):
+
+    x = ( x + np.uint64( 0x9E3779B97F4A7C15 ) )
+    x = ( x ^ ( x >> np.uint64( 30 ) ) ) * np.uint64( 0xBF58476D1CE4E5B9 )
+    x = ( x ^ ( x >> np.uint64( 27 ) ) ) * np.uint64( 0x94D049BB133111EB )
+
+    return x ^ ( x >> np.uint64( 31 ) )
+
+
+
+# Filtro de Bloom de ids inteiros: m bits e h funções de hash ( hashing duplo ), memória fixa escolhida pela capacidade
+# e pela taxa de falso positivo. Não tem falso negativo: um id adicionado é sempre encontrado.
+class FiltroBloom:
+
+    def __init__(self, capacidade = CAPACIDADE_IDS, falso_positivo = FALSO_POSITIVO_IDS):
+
+        self.capacidade = capacidade
+        self.m = int( math.ceil( -capacidade * math.log( falso_positivo ) / math.log( 2 ) ** 2 ) )
+        self.h = max( 1, int( round( self.m / capacidade * math.log( 2 ) ) ) )
+        self.n = 0
+
+        self._bits = np.zeros( ( self.m + 7 ) // 8, dtype = np.uint8 )
+
+
+    # Posições dos bits de cada id: matriz ( ids, h )
+    def _posicoes(self, ids):
+
+        x = np.asarray( ids ).astype( np.int64 ).view( np.uint64 )
+
+        h1 = _misturar( x )
+        h2 = _misturar( h1 ) | np.uint64( 1 )
+
+        with np.errstate( over = 'ignore' ):
+            return ( ( h1[:, None] + np.arange( self.h, dtype = np.uint64 ) * h2[:, None] ) % np.uint64( self.m ) ).astype( np.int64 )
+
+
+    # Quais ids ( talvez ) já foram adicionados
+    def contem(self, ids):
+
+        pos = self._posicoes( ids )
+
+        return ( ( self._bits[pos >> 3] >> ( pos & 7 ).astype( np.uint8 ) ) & 1 ).all( axis = 1 )
+
+
+    # Adiciona ids ( sem repetição dentro do bloco, para a contagem n )
+    def adicionar(self, ids):
+
+        pos = self._posicoes( ids ).ravel()
+
+        np.bitwise_or.at( self._bits, pos >> 3, np.left_shift( 1, pos & 7 ).astype( np.uint8 ) )
+        self.n += len( ids )
+
+        return self
+
+
+    # Junta outro filtro com os mesmos parâmetros ( união dos conjuntos )
+    def mesclar(self, outro):
+
+        if ( outro.m, outro.h ) != ( self.m, self.h ):
+            raise ValueError( 'Filtros de Bloom com tamanhos diferentes não podem ser mesclados' )
+
+        self._bits |= outro._bits
+        self.n += outro.n
+
+        return self
+
+
+    # Taxa de falso positivo esperada com os n ids adicionados ( n de filtros mesclados pode contar repetidos: estimativa alta )
+    def falso_positivo(self):
+
+        return ( 1 - math.exp( -self.h * self.n / self.m ) ) ** self.h
+
+
+
+## Functions ###-------------------------------------------------------------------------------------
+
+# Sketches por grupo: { chave do grupo: KLL } - pode receber vários blocos do mesmo dataset
+def atualizar_sketches(sketches, df, chaves, coluna, erro = ERRO_SKETCH):
+
+    for chave, valores in df.groupby( chaves, observed = True )[coluna]:
+        sketches.setdefault( chave, KLL( erro ) ).atualizar( valores.to_numpy() )
+
+    return sketches
+
+
+
+# Junta dois dicionários de sketches por grupo (ex.: resultados de processos diferentes)
+def mesclar_sketches(sketches, outros):
+
+    for chave, sketch in outros.items():
+
+        if chave in sketches:
+            sketches[chave].mesclar( sketch )
+        else:
+            sketches[chave] = sketch
+
+    return sketches
+
+
+
+# Medianas aproximadas dos grupos, no mesmo formato do groupby(...).median().reset_index()
+def medianas_sketches(sketches, chaves, nome):
+
+    linhas = [ ( chave if isinstance( chave, tuple ) else (chave,) ) + ( sketch.mediana(), ) for chave, sketch in sketches.items() ]
+
+    medianas = pd.DataFrame( linhas, columns = list( chaves ) + [nome] )
+
+    return medianas.sort_values( by = list( chaves ), ignore_index = True )
+
+
+
+# Relatório de precisão: medianas exatas x sketch dos dois balizadores, com erro de rank (fração) e erro relativo
+def relatorio_precisao(df_clean, erro = ERRO_SKETCH):
+
+    bases = { 'target_buy': ( df_clean.drop_duplicates(subset = 'id'), ['zipcode'] ),
+              'median_venda': ( df_clean, ['zipcode','seasons'] ) }
+
+    relatorios = []
+    for nome, (base, chaves) in bases.items():
+
+        exato = base.groupby( chaves, observed = True )['price_per_m2_living'].median().reset_index( name = 'exato' )
+        aproximado = medianas_sketches( atualizar_sketches( {}, base, chaves, 'price_per_m2_living', erro ), chaves, 'sketch' )
+
+        relatorio = exato.merge( aproximado, on = chaves )
+
+        # Erro de rank: distância entre a posição do valor aproximado e a mediana (0.5), dentro do grupo
+        ranks = []
+        for _, linha in relatorio.iterrows():
+
+            filtro = np.logical_and.reduce([ base[c].to_numpy() == linha[c] for c in chaves ])
+            valores = base.loc[ filtro, 'price_per_m2_living' ].to_numpy()
+
+            ranks.append( abs( ( valores < linha['sketch'] ).mean() + ( valores == linha['sketch'] ).mean() / 2 - 0.5 ) )
+
+        relatorio['erro_rank'] = ranks
+        relatorio['erro_relativo'] = ( relatorio['sketch'] - relatorio['exato'] ).abs() / relatorio['exato']
+        relatorio.insert( 0, 'balizador', nome )
+
+        relatorios.append( relatorio )
+
+    return pd.concat( relatorios, ignore_index = True )
+
+
+
+### -----------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    from dados_hr import carregar_dados_limpos
+
+    parser = argparse.ArgumentParser( description = 'Precisão das medianas aproximadas (sketch KLL) x exatas.' )
+    parser.add_argument( 'dados', help = 'arquivo .csv da base ( kc_house_data.csv )' )
+    parser.add_argument( '--erro', type = float, default = ERRO_SKETCH, help = 'erro de rank do sketch (fração)' )
+    args = parser.parse_args()
+
+    relatorio = relatorio_precisao( carregar_dados_limpos( args.dados ), args.erro )
+
+    resumo = relatorio.groupby( 'balizador' )[['erro_rank','erro_relativo']].agg( ['mean','max'] )
+
+    print( 'Erro de rank configurado: {0}'.format( args.erro ) )
+    print( resumo.to_string() )
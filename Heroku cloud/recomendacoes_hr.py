@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Recomendações de compra e venda de imóveis do projeto House Rocket.
+
+Todos os balizadores (mediana do preço/m2 por região, mediana por região e estação e
+média de avaliação por região) e as recomendações dependem só das vendas do próprio
+código postal, então podem ser recalculados apenas para as regiões que mudaram.
+
+As medianas podem vir do cálculo exato (padrão) ou de sketches de quantis mescláveis
+( backend 'sketch', ver quantis_hr.py ), que usam memória limitada e aceitam blocos.
+"""
+
+## Libraries ###-------------------------------------------------------------------
+
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from dados_hr import carregar_dados_limpos, data_cleaning, ler_snapshot, versao_dados, PASTA_SNAPSHOT, TAMANHO_CHUNK
+from quantis_hr import atualizar_sketches, mesclar_sketches, medianas_sketches, FiltroBloom, ERRO_SKETCH
+
+
+## Configuração ###----------------------------------------------------------------
+
+# Cálculo das medianas dos balizadores: 'exato' ( groupby().median() ) ou 'sketch' ( KLL, aproximado )
+BACKEND_MEDIANAS = 'exato'
+
+# Colunas da tabela de compra ( aba 4 ) e os nomes mostrados na página
+COLUNAS_TABELA_COMPRA = {'id':'id','status':'status','zipcode':'Código Postal','price':'Preço',
+                         'price_per_m2_living':'Preço/m2 construído','target_buy':'Balizador Compra',
+                         'condition':'Condição','grade':'Avaliação Construção','age':'Idade',
+                         'is_renovated':'Reformado'}
+
+
+## Functions ###-------------------------------------------------------------------------------------
+
+def compra_house(df):
+
+    # Regras de compra avaliadas em todas as linhas de uma vez (máscaras booleanas sobre arrays NumPy),
+    # com o mesmo resultado da versão antiga linha a linha com apply( axis = 1 )
+    price_m2 = df['price_per_m2_living'].to_numpy()
+    target = df['target_buy'].to_numpy()
+    condition = df['condition'].to_numpy()
+    age = df['age'].to_numpy()
+
+    # Comparação mantida igual à regra original ( is_renovated == 1 )
+    renovated = df['is_renovated'].to_numpy() == 1
+
+    abaixo_target = (price_m2 < target) & (condition >= 3)
+
+    compra = abaixo_target & ( ((age >= 50) & renovated) | (age < 50) )
+
+    # Indexar array de objetos evita criar uma string nova por linha
+    status = np.array(['Não Compra', 'Compra'], dtype = object)
+
+    return status[compra.astype(np.intp)]
+
+
+
+def venda_house(df):
+
+    # Regras de venda avaliadas em todas as linhas de uma vez - seleciona o percentual de acréscimo por condição
+    price_m2 = df['price_per_m2_living'].to_numpy()
+    median_venda = df['median_venda'].to_numpy()
+    grade_acima = df['grade'].to_numpy() > df['mean_grade_per_zip'].to_numpy()
+
+    acima_mediana = price_m2 >= median_venda
+    abaixo_mediana = price_m2 < median_venda
+
+    fator = np.select( [acima_mediana & grade_acima, acima_mediana, abaixo_mediana & grade_acima, abaixo_mediana],
+                       [1.1, 1.05, 1.2, 1.15], default = np.nan )
+
+    # Sem mediana de referência (NaN) nenhuma regra se aplica e o preço de venda fica vazio
+    return df['price'].to_numpy() * fator
+
+
+
+# Tabela de compra com os nomes de colunas da página ( índice = posição da linha na tabela )
+def tabela_compra(df_compra):
+
+    tabela = df_compra[list( COLUNAS_TABELA_COMPRA )].rename( columns = COLUNAS_TABELA_COMPRA ).reset_index( drop = True )
+
+    # Trocar valores das colunas
+    tabela['Reformado'] = tabela['Reformado'].replace({'No':'Não','Yes':'Sim'})
+
+    return tabela
+
+
+
+# Imóveis distintos, mantendo a venda mais recente de cada um
+def _vendas_recentes(df):
+
+    return df.sort_values(by = ['id','date'], ascending = False).drop_duplicates(subset = 'id', keep = 'first', ignore_index = True)
+
+
+
+# Balizadores de compra e venda por região e estação:
+# zipcode, seasons, target_buy (por região), median_venda (por região e estação), mean_grade_per_zip (por região)
+def calcular_agregados(df_clean, backend = BACKEND_MEDIANAS, erro = ERRO_SKETCH):
+
+    if backend == 'sketch':
+        return agregados_estado_sketch( atualizar_estado_sketch( estado_sketch( erro ), df_clean ) )
+
+    if backend != 'exato':
+        raise ValueError( "backend deve ser 'exato' ou 'sketch': {0}".format( backend ) )
+
+    # Calculo do preço mediano por metro quadrado por região
+    df_median_price_m2 = df_clean.drop_duplicates(subset = 'id').loc[:,['zipcode','price_per_m2_living']].groupby('zipcode').median().reset_index()
+    df_median_price_m2.columns = ['zipcode','target_buy']
+
+    # Calculo da mediana do preço por metro quadrado de área construída por região por estação - Balizador de regra de preço de venda
+    # ( observed e a ordenação final deixam o resultado igual com seasons em texto ou categoria - ver dados_hr.compactar )
+    df_mp_zip_sea = df_clean[['zipcode','price_per_m2_living','seasons']].groupby(['zipcode','seasons'], observed = True).median().reset_index()
+    df_mp_zip_sea = df_mp_zip_sea.sort_values(by = ['zipcode','seasons'], ignore_index = True)
+    df_mp_zip_sea.columns = ['zipcode','seasons','median_venda']
+
+    # Calculo da media de classificação da qualidade de construção por região (imóveis distintos) - Balizador de regra de preço de venda
+    df_zip_grade = _vendas_recentes( df_clean[['id','date','zipcode','grade']] ).loc[:, ['zipcode','grade']].groupby(['zipcode']).mean().reset_index()
+    df_zip_grade.columns = ['zipcode','mean_grade_per_zip']
+
+    agregados = df_mp_zip_sea.merge(df_median_price_m2, how = 'left', on = 'zipcode').merge(df_zip_grade, how = 'left', on = 'zipcode')
+
+    return agregados[['zipcode','seasons','target_buy','median_venda','mean_grade_per_zip']]
+
+
+
+# Análise de Compra: status de cada imóvel distinto (venda mais recente)
+def calcular_compra(df_clean, agregados):
+
+    # Merge com a base de dados geral
+    df_compra = df_clean.merge(agregados[['zipcode','target_buy']].drop_duplicates(subset = 'zipcode'), how = 'left', on = 'zipcode')
+
+    ## Aplica fórmula para análise dos imóveis a serem comprados
+    df_compra['status'] = compra_house(df_compra)
+
+    ## Ajuste final base de dados de compra - Ordeno pela data mais recente de imóveis e excluo os antigos
+    return _vendas_recentes( df_compra )
+
+
+
+# Análise de Venda: preço de venda, lucro e ROI dos imóveis recomendados para compra
+def calcular_compra_venda(df_compra, agregados):
+
+    ## Filtrar apenas imóveis que foram comprados e dropar a coluna status
+    df_compra_venda = df_compra.loc[df_compra['status'] == 'Compra',:].drop(columns = 'status')
+
+    # Unir valores calculados para contribuir para estimar preço de venda
+    df_compra_venda = df_compra_venda.merge(agregados[['zipcode','seasons','median_venda','mean_grade_per_zip']],
+                                            how = 'left', on = ['zipcode','seasons']).reset_index( drop = True )
+
+    ## Aplica regras de negócio para estimar preço de venda
+    df_compra_venda['price_venda'] = venda_house(df_compra_venda)
+
+    ## Calcula lucro dos imóveis negociados
+    df_compra_venda['lucro'] = df_compra_venda['price_venda'] - df_compra_venda['price']
+
+    ## Calcula ROI dos imóveis negociados
+    df_compra_venda['roi'] = (df_compra_venda['lucro'] / df_compra_venda['price']) * 100
+
+    return df_compra_venda
+
+
+
+# Balizadores e análise de compra da base inteira
+def recomendacoes(df_clean, backend = BACKEND_MEDIANAS, erro = ERRO_SKETCH):
+
+    agregados = calcular_agregados( df_clean, backend, erro )
+    df_compra = calcular_compra( df_clean, agregados )
+
+    return agregados, df_compra
+
+
+
+# Recalcula balizadores e análise de compra só das regiões afetadas e substitui essas regiões nos resultados anteriores.
+# df_clean_zips precisa ter todas as vendas (antigas e novas, na ordem do arquivo) dessas regiões.
+def atualizar_recomendacoes(agregados, df_compra, df_clean_zips, zipcodes):
+
+    agregados_novos, df_compra_novo = recomendacoes( df_clean_zips )
+
+    agregados = pd.concat([ agregados.loc[ ~agregados['zipcode'].isin( zipcodes ) ], agregados_novos ])
+    agregados = agregados.sort_values(by = ['zipcode','seasons'], ignore_index = True)
+
+    df_compra = pd.concat([ df_compra.loc[ ~df_compra['zipcode'].isin( zipcodes ) ], df_compra_novo ])
+    df_compra = df_compra.sort_values(by = ['id','date'], ascending = False, ignore_index = True)
+
+    return agregados, df_compra
+
+
+
+## Backend de sketches ###-----------------------------------------------------------------------------
+
+# Estado mesclável dos balizadores: sketches das medianas, soma e contagem de avaliação por região
+# e os ids já vistos (a mediana de compra e a média de avaliação consideram cada imóvel uma vez).
+# Os ids ficam num filtro de Bloom de tamanho fixo: um imóvel novo é tomado por já visto com probabilidade
+# estado['ids'].falso_positivo() ( até FALSO_POSITIVO_IDS dentro da capacidade ) e fica fora da amostra de compra
+# e da média de avaliação - uma amostra ao acaso a menos, que soma no máximo essa fração ao erro de rank da mediana.
+def estado_sketch(erro = ERRO_SKETCH):
+
+    return { 'erro': erro, 'compra': {}, 'venda': {}, 'grade': pd.DataFrame( columns = ['soma','contagem'], dtype = float ), 'ids': FiltroBloom() }
+
+
+
+# Acrescenta um bloco da base tratada ao estado
+def atualizar_estado_sketch(estado, df_clean):
+
+    # Primeira venda de cada imóvel ainda não visto ( avaliação não muda entre vendas do mesmo imóvel ) - repetidos
+    # do bloco saem aqui, os de blocos anteriores pelo filtro de Bloom
+    novos = df_clean.drop_duplicates(subset = 'id')
+    novos = novos.loc[ ~estado['ids'].contem( novos['id'].to_numpy() ) ]
+    estado['ids'].adicionar( novos['id'].to_numpy() )
+
+    atualizar_sketches( estado['compra'], novos, ['zipcode'], 'price_per_m2_living', estado['erro'] )
+    atualizar_sketches( estado['venda'], df_clean, ['zipcode','seasons'], 'price_per_m2_living', estado['erro'] )
+
+    grade = novos.groupby('zipcode')['grade'].agg( soma = 'sum', contagem = 'count' )
+    estado['grade'] = estado['grade'].add( grade, fill_value = 0 )
+
+    return estado
+
+
+
+# Junta dois estados (ex.: blocos processados em paralelo)
+def mesclar_estado_sketch(estado, outro):
+
+    mesclar_sketches( estado['compra'], outro['compra'] )
+    mesclar_sketches( estado['venda'], outro['venda'] )
+
+    estado['grade'] = estado['grade'].add( outro['grade'], fill_value = 0 )
+    estado['ids'].mesclar( outro['ids'] )
+
+    return estado
+
+
+
+# Tabela de balizadores (mesmo formato de calcular_agregados) a partir do estado
+def agregados_estado_sketch(estado):
+
+    df_median_price_m2 = medianas_sketches( estado['compra'], ['zipcode'], 'target_buy' )
+    df_mp_zip_sea = medianas_sketches( estado['venda'], ['zipcode','seasons'], 'median_venda' )
+
+    df_zip_grade = ( estado['grade']['soma'] / estado['grade']['contagem'] ).rename( 'mean_grade_per_zip' ).rename_axis( 'zipcode' ).reset_index()
+    df_zip_grade['zipcode'] = df_zip_grade['zipcode'].astype( df_mp_zip_sea['zipcode'].dtype )
+
+    agregados = df_mp_zip_sea.merge(df_median_price_m2, how = 'left', on = 'zipcode').merge(df_zip_grade, how = 'left', on = 'zipcode')
+
+    return agregados[['zipcode','seasons','target_buy','median_venda','mean_grade_per_zip']]
+
+
+
+# Balizadores direto do .csv em blocos, com memória limitada pelos sketches e pelo filtro de Bloom dos ids
+def agregados_streaming(path, erro = ERRO_SKETCH, tamanho_chunk = TAMANHO_CHUNK):
+
+    estado = estado_sketch( erro )
+
+    for chunk in pd.read_csv( path, chunksize = tamanho_chunk ):
+        atualizar_estado_sketch( estado, data_cleaning( chunk ) )
+
+    return agregados_estado_sketch( estado ), estado
+
+
+
+## Persistência ###-----------------------------------------------------------------------------------
+
+# Caminhos dos arquivos de balizadores e de análise de compra de uma versão da base - com o ano atual, porque
+# o status de compra depende da idade dos imóveis
+def caminhos_recomendacoes(path, versao = None):
+
+    pasta = os.path.join( os.path.dirname( os.path.abspath( path ) ), PASTA_SNAPSHOT )
+    base = os.path.splitext( os.path.basename( path ) )[0]
+    versao = versao or versao_dados( path )
+    ano = datetime.now().year
+
+    return ( os.path.join( pasta, '{0}_agregados_{1}_{2}.arrow'.format( base, versao, ano ) ),
+             os.path.join( pasta, '{0}_compra_{1}_{2}.arrow'.format( base, versao, ano ) ) )
+
+
+
+def salvar_recomendacoes(path, agregados, df_compra, versao = None):
+
+    for df, destino in zip( (agregados, df_compra), caminhos_recomendacoes( path, versao ) ):
+
+        os.makedirs( os.path.dirname( destino ), exist_ok = True )
+
+        tmp = destino + '.tmp'
+        feather.write_feather( pa.Table.from_pandas( df, preserve_index = False ), tmp, compression = 'uncompressed' )
+        os.replace( tmp, destino )
+
+
+
+# Balizadores e análise de compra da versão atual da base - calcula e grava se ainda não existirem
+def carregar_recomendacoes(path):
+
+    path_agregados, path_compra = caminhos_recomendacoes( path )
+
+    if os.path.exists( path_agregados ) and os.path.exists( path_compra ):
+        return ler_snapshot( path_agregados ), ler_snapshot( path_compra )
+
+    agregados, df_compra = recomendacoes( carregar_dados_limpos( path ) )
+    salvar_recomendacoes( path, agregados, df_compra )
+
+    return agregados, df_compra
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+Backend opcional DuckDB para as agregações do projeto House Rocket.
+
+As mesmas tabelas do caminho em pandas ( Imóveis por Região, Estatística Descritiva, hipóteses
+da aba Insights, balizadores e análise de compra/venda ) calculadas em SQL sobre o snapshot
+colunar da base tratada, com execução vetorizada em várias threads. A tabela fica ordenada por
+zipcode dentro do DuckDB, então filtros de código postal pulam os blocos das outras regiões.
+
+O pandas continua sendo o padrão ( BACKEND_AGREGACOES ). O DuckDB não está no requirements.txt:
+para usar, pip install duckdb e troque BACKEND_AGREGACOES para 'duckdb'.
+
+Uso: python sql_hr.py kc_house_data.csv   ( confere se os dois backends geram as mesmas tabelas )
+"""
+
+## Libraries ###-------------------------------------------------------------------
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from dados_hr import caminho_snapshot, carregar_dados_limpos, data_cleaning_chunks
+from metricas_hr import (COLUNAS_REGIAO, COLUNAS_ED, ROTULOS_HIPOTESES, cubo_zipcode, metricas_por_regiao, estatistica_descritiva,
+                         agregados_hipoteses, tabelas_agregados_hipoteses)
+from recomendacoes_hr import compra_house, venda_house, recomendacoes, calcular_compra_venda
+
+
+## Configuração ###----------------------------------------------------------------
+
+# Backend das agregações da aplicação: 'pandas' (padrão) ou 'duckdb'
+BACKEND_AGREGACOES = 'pandas'
+
+# Tolerância relativa da conferência - médias somadas em outra ordem diferem nas últimas casas
+RTOL_PARIDADE = 1e-9
+
+# Atributos das tabelas de hipóteses ( rótulos em metricas_hr.ROTULOS_HIPOTESES )
+COLUNAS_HIPOTESES = ['price','price_per_m2_living','price_per_m2_living_outside','m2_living','m2_outside']
+
+
+## Functions ###-------------------------------------------------------------------------------------
+
+# Conexão DuckDB em memória com a base tratada na tabela 'vendas' ( _linha guarda a ordem do arquivo )
+def conectar(path, threads = None):
+
+    import duckdb
+
+    path_snapshot = caminho_snapshot( path, 'limpo' )
+
+    if not os.path.exists( path_snapshot ):
+        data_cleaning_chunks( path, path_snapshot )
+
+    tabela = feather.read_table( path_snapshot, memory_map = True )
+    tabela = tabela.append_column( '_linha', pa.array( np.arange( tabela.num_rows, dtype = 'int64' ) ) )
+
+    con = duckdb.connect()
+
+    if threads:
+        con.execute( 'SET threads = {0}'.format( int( threads ) ) )
+
+    con.register( 'snapshot', tabela )
+    con.execute( 'CREATE TABLE vendas AS SELECT * FROM snapshot ORDER BY zipcode, _linha' )
+    con.unregister( 'snapshot' )
+
+    return con
+
+
+
+# Condição de código postal (lista vazia = todos) - valores convertidos para int antes de entrar no SQL
+def _filtro_zipcode(zipcodes):
+
+    if not zipcodes:
+        return ''
+
+    return 'WHERE zipcode IN ({0})'.format( ', '.join( str( int( z ) ) for z in zipcodes ) )
+
+
+
+# Cada consulta usa um cursor próprio - a conexão é compartilhada pelas sessões (threads) da aplicação
+def _consulta(con, sql, **tabelas):
+
+    cur = con.cursor()
+
+    for nome, df in tabelas.items():
+        cur.register( nome, df )
+
+    return cur.execute( sql ).df()
+
+
+
+# Tabela "Imóveis por Região" - mesmo formato de metricas_hr.metricas_por_regiao
+def metricas_por_regiao_sql(con, zipcodes = None):
+
+    medias = ', '.join( 'avg({0}) AS {0}'.format( col ) for col in COLUNAS_REGIAO )
+
+    return _consulta( con, '''SELECT zipcode, count(DISTINCT id) AS id, {0} FROM vendas {1}
+                              GROUP BY zipcode ORDER BY zipcode'''.format( medias, _filtro_zipcode( zipcodes ) ) )
+
+
+
+# Tabela "Estatística Descritiva" - mesmo formato de metricas_hr.estatistica_descritiva
+def estatistica_descritiva_sql(con, zipcodes = None):
+
+    estatisticas = { 'media': 'avg', 'mediana': 'median', 'desvio': 'stddev_pop', 'max': 'max', 'min': 'min' }
+
+    campos = ', '.join( '{0}({1}) AS "{2}_{1}"'.format( funcao, col, nome ) for nome, funcao in estatisticas.items() for col in COLUNAS_ED )
+    linha = _consulta( con, 'SELECT {0} FROM vendas {1}'.format( campos, _filtro_zipcode( zipcodes ) ) ).iloc[0]
+
+    return pd.DataFrame({ nome: [ linha['{0}_{1}'.format( nome, col )] for col in COLUNAS_ED ] for nome in estatisticas },
+                        index = COLUNAS_ED, dtype = float )
+
+
+
+# Médias dos atributos das hipóteses nos dois grupos da condição ( verdadeiro, falso ), como colunas
+def _comparacao(con, condicao, colunas):
+
+    medias = ', '.join( 'avg({0})'.format( col ) for col in COLUNAS_HIPOTESES )
+    grupos = _consulta( con, 'SELECT {0} AS grupo, {1} FROM vendas GROUP BY grupo ORDER BY grupo DESC'.format( condicao, medias ) )
+
+    tabela = grupos.drop(columns = ['grupo']).T
+    tabela.columns = colunas
+    tabela.index = ROTULOS_HIPOTESES
+
+    return tabela
+
+
+
+# Médias por grupo de uma coluna Yes/No, com os valores traduzidos e os nomes de colunas da aplicação
+def _por_grupo(con, coluna, colunas, nomes, where = ''):
+
+    medias = ', '.join( 'avg({0}) AS {0}'.format( col ) for col in colunas )
+    tabela = _consulta( con, 'SELECT {0}, {1} FROM vendas {2} GROUP BY {0} ORDER BY {0}'.format( coluna, medias, where ) )
+
+    tabela[coluna] = tabela[coluna].replace( {'Yes':'Sim','No': 'Não'} )
+    tabela.columns = nomes
+
+    return tabela
+
+
+
+# Tabelas das hipóteses H1 a H4 - mesmo formato de metricas_hr.tabelas_agregados_hipoteses
+def tabelas_hipoteses_sql(con):
+
+    price_per_condition = _comparacao( con, 'condition >= 3', ['Condições Boas','Condições Ruins'] )
+
+    df_price_renovated = _por_grupo( con, 'is_renovated', ['price','price_per_m2_living','m2_living'],
+                                     ['Renovado','Preço Médio','Preço / área construída (m2) Médio', 'Área Construída (m2) Média'],
+                                     where = 'WHERE age >= 50' )
+
+    df_price_waterfront = _por_grupo( con, 'waterfront', COLUNAS_HIPOTESES, ['Vista Água'] + ROTULOS_HIPOTESES )
+
+    df3 = _comparacao( con, 'yr_built < 1955', ['Antigos','Novos'] )
+
+    return price_per_condition, df_price_renovated, df_price_waterfront, df3
+
+
+
+# Artefato das hipóteses em um GROUP BY - mesmo formato de metricas_hr.agregados_hipoteses
+def agregados_hipoteses_sql(con):
+
+    somas = ', '.join( 'coalesce(sum({0}), 0) AS soma_{0}'.format( col ) for col in COLUNAS_HIPOTESES )
+    contagens = ', '.join( 'count({0}) AS n_{0}'.format( col ) for col in COLUNAS_HIPOTESES )
+
+    return _consulta( con, '''
+        SELECT condition >= 3 AS condicao_boa, yr_built < 1955 AS antigo, age >= 50 AS idade_50,
+               is_renovated = 'Yes' AS renovado, waterfront = 'Yes' AS vista_agua, CAST(seasons AS VARCHAR) AS seasons,
+               count(*) AS vendas, {0}, {1}
+        FROM vendas GROUP BY ALL ORDER BY min(_linha)'''.format( somas, contagens ) )
+
+
+
+# Balizadores e análise de compra - mesmo formato de recomendacoes_hr.recomendacoes
+def recomendacoes_sql(con):
+
+    agregados = _consulta( con, '''
+        WITH primeiras AS ( SELECT zipcode, price_per_m2_living FROM vendas
+                            QUALIFY row_number() OVER ( PARTITION BY id ORDER BY _linha ) = 1 ),
+             recentes AS ( SELECT zipcode, grade FROM vendas
+                           QUALIFY row_number() OVER ( PARTITION BY id ORDER BY date DESC ) = 1 ),
+             compra AS ( SELECT zipcode, median(price_per_m2_living) AS target_buy FROM primeiras GROUP BY zipcode ),
+             venda AS ( SELECT zipcode, seasons, median(price_per_m2_living) AS median_venda FROM vendas GROUP BY zipcode, seasons ),
+             grade AS ( SELECT zipcode, avg(grade) AS mean_grade_per_zip FROM recentes GROUP BY zipcode )
+        SELECT zipcode, seasons, target_buy, median_venda, mean_grade_per_zip
+        FROM venda LEFT JOIN compra USING (zipcode) LEFT JOIN grade USING (zipcode)
+        ORDER BY zipcode, seasons''' )
+
+    # Venda mais recente de cada imóvel com o balizador de compra da região
+    df_compra = _consulta( con, '''
+        SELECT v.* EXCLUDE (_linha), a.target_buy
+        FROM vendas v LEFT JOIN ( SELECT DISTINCT zipcode, target_buy FROM agregados ) a ON v.zipcode = a.zipcode
+        QUALIFY row_number() OVER ( PARTITION BY v.id ORDER BY v.date DESC ) = 1
+        ORDER BY v.id DESC, v.date DESC''', agregados = agregados )
+
+    df_compra['status'] = compra_house( df_compra )
+
+    return agregados, df_compra
+
+
+
+# Preço de venda, lucro e ROI dos imóveis para compra - mesmo formato de recomendacoes_hr.calcular_compra_venda
+def calcular_compra_venda_sql(con, df_compra, agregados):
+
+    df_compra_venda = _consulta( con, '''
+        SELECT c.* EXCLUDE (status), a.median_venda, a.mean_grade_per_zip
+        FROM df_compra c LEFT JOIN agregados a ON c.zipcode = a.zipcode AND c.seasons = a.seasons
+        WHERE c.status = 'Compra'
+        ORDER BY c.id DESC, c.date DESC''', df_compra = df_compra, agregados = agregados )
+
+    df_compra_venda['price_venda'] = venda_house( df_compra_venda )
+    df_compra_venda['lucro'] = df_compra_venda['price_venda'] - df_compra_venda['price']
+    df_compra_venda['roi'] = ( df_compra_venda['lucro'] / df_compra_venda['price'] ) * 100
+
+    return df_compra_venda
+
+
+
+## Conferência ###-----------------------------------------------------------------------------------
+
+def _comparar(nome, pandas, duckdb, rtol):
+
+    try:
+        pd.testing.assert_frame_equal( pandas.reset_index( drop = True ), duckdb.reset_index( drop = True ),
+                                       check_dtype = False, check_index_type = False, check_column_type = False, rtol = rtol )
+        return { 'tabela': nome, 'igual': True, 'erro': '' }
+
+    except AssertionError as erro:
+        return { 'tabela': nome, 'igual': False, 'erro': str( erro ).strip().splitlines()[0] }
+
+
+
+# Confere se pandas e DuckDB geram as mesmas tabelas ( valores, ordem de linhas e colunas; floats com tolerância rtol )
+def paridade(path, selecoes = ( [], [98001], [98001, 98004, 98103] ), rtol = RTOL_PARIDADE, con = None):
+
+    con = con or conectar( path )
+
+    df_clean = carregar_dados_limpos( path )
+    cubo = cubo_zipcode( df_clean )
+
+    resultados = []
+    for zipcodes in selecoes:
+
+        resultados.append( _comparar( 'metricas_por_regiao {0}'.format( zipcodes ),
+                                      metricas_por_regiao( cubo, zipcodes ), metricas_por_regiao_sql( con, zipcodes ), rtol ) )
+
+        # O índice (atributos) também precisa ser o mesmo
+        resultados.append( _comparar( 'estatistica_descritiva {0}'.format( zipcodes ),
+                                      estatistica_descritiva( cubo, zipcodes ).reset_index(),
+                                      estatistica_descritiva_sql( con, zipcodes ).reset_index(), rtol ) )
+
+    # Tabelas da aplicação ( artefato das hipóteses ) contra as médias calculadas direto em SQL
+    agregados_hip = agregados_hipoteses( df_clean )
+    tabelas_hip = tabelas_agregados_hipoteses( agregados_hip )
+
+    for i, (nome, b) in enumerate( zip( ['condicao', 'reforma', 'vista_agua', 'ano_construcao'], tabelas_hipoteses_sql( con ) ) ):
+        resultados.append( _comparar( 'hipotese H{0}'.format( i + 1 ), tabelas_hip[nome].reset_index(), b.reset_index(), rtol ) )
+
+    resultados.append( _comparar( 'agregados hipoteses', agregados_hip, agregados_hipoteses_sql( con ), rtol ) )
+
+    agregados, df_compra = recomendacoes( df_clean )
+    agregados_sql, df_compra_sql = recomendacoes_sql( con )
+
+    resultados.append( _comparar( 'agregados', agregados, agregados_sql, rtol ) )
+    resultados.append( _comparar( 'compra', df_compra, df_compra_sql, rtol ) )
+    resultados.append( _comparar( 'compra_venda', calcular_compra_venda( df_compra, agregados ),
+                                  calcular_compra_venda_sql( con, df_compra_sql, agregados_sql ), rtol ) )
+
+    return pd.DataFrame( resultados )
+
+
+
+### -----------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser( description = 'Confere se os backends pandas e DuckDB geram as mesmas tabelas.' )
+    parser.add_argument( 'dados', help = 'arquivo .csv da base ( kc_house_data.csv )' )
+    parser.add_argument( '--rtol', type = float, default = RTOL_PARIDADE, help = 'tolerância relativa dos floats' )
+    parser.add_argument( '--threads', type = int, default = None, help = 'threads do DuckDB (padrão: todos os núcleos)' )
+    args = parser.parse_args()
+
+    resultado = paridade( args.dados, rtol = args.rtol, con = conectar( args.dados, args.threads ) )
+
+    print( resultado.to_string( index = False ) )
+
+    if not resultado['igual'].all():
+        sys.exit( 1 )
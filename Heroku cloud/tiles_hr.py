@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+"""
+Pirâmide local de tiles (PNG 256 px, esquema XYZ) das camadas de densidade e de imóveis investidos.
+
+Os tiles são gerados a partir da base tratada ( densidade: todas as vendas ) e da análise de
+compra/venda ( investidos: cor pelo lucro estimado ) e gravados em tiles/<camada>/{z}/{x}/{y}.png
+ao lado do .csv. O navegador busca só os tiles da área visível através de um servidor HTTP local,
+em vez de receber todos os pontos dentro do HTML do mapa.
+
+Cada pixel soma os pontos num raio de RAIO_PONTO pixels; as cores usam faixas fixas ( não dependem
+do resto da base ), então um tile só muda quando mudam os pontos dentro dele. A reconstrução
+incremental compara os pontos com os da última geração ( pontos.arrow ) e gera de novo apenas os
+tiles onde algum ponto entrou ou saiu. A geração é dividida entre processos.
+
+Uso: python tiles_hr.py construir kc_house_data.csv --processos 8
+     python tiles_hr.py servir kc_house_data.csv --porta 8502
+"""
+
+## Libraries ###-------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import re
+import shutil
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import folium
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from dados_hr import carregar_dados_limpos, versao_dados
+from mapas_hr import celulas_grade
+from recomendacoes_hr import carregar_recomendacoes, calcular_compra_venda
+
+
+## Configuração ###----------------------------------------------------------------
+
+# Pasta (ao lado do .csv) da pirâmide de tiles
+PASTA_TILES = 'tiles'
+
+# Versão do formato dos tiles - aumentar sempre que cores, raio ou projeção mudarem ( força reconstrução completa )
+VERSAO_TILES = 1
+
+# Níveis de zoom gerados - acima do último o navegador amplia os tiles do último nível
+ZOOMS_TILES = list( range( 8, 16 ) )
+
+# Tamanho do tile e raio (px) de cada ponto
+TAMANHO_TILE = 256
+RAIO_PONTO = 2
+
+# Tiles por tarefa enviada aos processos
+TILES_POR_TAREFA = 256
+
+# Porta padrão do servidor de tiles ( a aplicação Streamlit usa a 8501 )
+PORTA_TILES = 8502
+
+# Faixas fixas das cores: quantidade de vendas por pixel ( densidade ) e lucro estimado médio ( investidos )
+LIMITES_CAMADAS = { 'densidade': [1, 2, 4, 8, 16, 32], 'investidos': [0, 25000, 50000, 100000, 200000, 400000] }
+
+# Cores RGBA das faixas ( YlOrRd para densidade, YlGn para lucro )
+CORES_CAMADAS = { 'densidade': [(255, 255, 178, 200), (254, 217, 118, 210), (254, 178, 76, 220),
+                                (253, 141, 60, 230), (240, 59, 32, 240), (189, 0, 38, 250)],
+                  'investidos': [(255, 255, 204, 220), (217, 240, 163, 225), (173, 221, 142, 230),
+                                 (120, 198, 121, 235), (49, 163, 84, 245), (0, 104, 55, 250)] }
+
+CAMADAS = list( LIMITES_CAMADAS )
+
+# Estado dos processos de geração: pontos da camada e projeção do último zoom usado
+_PONTOS = None
+_ZOOM = None
+
+
+## Functions ###-------------------------------------------------------------------------------------
+
+# PNG RGBA sem dependências externas ( zlib ) - imagem uint8 com forma ( altura, largura, 4 )
+def png_rgba(imagem):
+
+    altura, largura = imagem.shape[:2]
+
+    # Filtro 0 (nenhum) no início de cada linha
+    linhas = np.concatenate( [ np.zeros( (altura, 1), dtype = 'uint8' ), imagem.reshape( altura, largura * 4 ) ], axis = 1 )
+
+    def bloco(tipo, dados):
+        return struct.pack( '>I', len( dados ) ) + tipo + dados + struct.pack( '>I', zlib.crc32( tipo + dados ) & 0xffffffff )
+
+    return ( b'\x89PNG\r\n\x1a\n' + bloco( b'IHDR', struct.pack( '>IIBBBBB', largura, altura, 8, 6, 0, 0, 0 ) )
+             + bloco( b'IDAT', zlib.compress( linhas.tobytes(), 6 ) ) + bloco( b'IEND', b'' ) )
+
+
+
+# Tile vazio (transparente) devolvido pelo servidor onde não há pontos
+TILE_VAZIO = png_rgba( np.zeros( (1, 1, 4), dtype = 'uint8' ) )
+
+
+
+def pasta_camada(path, camada):
+
+    return os.path.join( os.path.dirname( os.path.abspath( path ) ), PASTA_TILES, camada )
+
+
+
+# Pontos de cada camada ( lat, long, valor ) a partir da base tratada e da análise de compra/venda
+def pontos_camadas(path):
+
+    df_clean = carregar_dados_limpos( path )
+
+    agregados, df_compra = carregar_recomendacoes( path )
+    df_compra_venda = calcular_compra_venda( df_compra, agregados )
+
+    densidade = pd.DataFrame({ 'lat': df_clean['lat'].to_numpy( dtype = 'float64' ), 'long': df_clean['long'].to_numpy( dtype = 'float64' ),
+                               'valor': np.ones( len( df_clean ) ) })
+
+    investidos = pd.DataFrame({ 'lat': df_compra_venda['lat'].to_numpy( dtype = 'float64' ),
+                                'long': df_compra_venda['long'].to_numpy( dtype = 'float64' ),
+                                'valor': df_compra_venda['lucro'].to_numpy( dtype = 'float64' ) })
+
+    return { 'densidade': densidade, 'investidos': investidos.loc[ investidos['valor'].notna() ].reset_index( drop = True ) }
+
+
+
+# Tiles (z, x, y) alcançados pelos pontos em cada zoom - inclui os vizinhos quando o raio do ponto passa da borda
+def tiles_pontos(pontos, zooms = ZOOMS_TILES):
+
+    tiles = set()
+    for z in zooms:
+
+        px, py = celulas_grade( pontos['lat'], pontos['long'], z + 8 )
+
+        for dx in ( -RAIO_PONTO, RAIO_PONTO ):
+            for dy in ( -RAIO_PONTO, RAIO_PONTO ):
+
+                n = 2 ** z
+                tx = np.clip( ( px + dx ) // TAMANHO_TILE, 0, n - 1 )
+                ty = np.clip( ( py + dy ) // TAMANHO_TILE, 0, n - 1 )
+
+                tiles.update( ( z, int( x ), int( y ) ) for x, y in set( zip( tx.tolist(), ty.tolist() ) ) )
+
+    return tiles
+
+
+
+# Pontos que entraram ou saíram entre duas gerações ( diferença de multiconjuntos pelas linhas lat, long, valor )
+def pontos_alterados(antigos, novos):
+
+    h_antigos = pd.util.hash_pandas_object( antigos[['lat','long','valor']], index = False ).to_numpy()
+    h_novos = pd.util.hash_pandas_object( novos[['lat','long','valor']], index = False ).to_numpy()
+
+    # Contagem de cada linha nas duas gerações - linha repetida conta como mudança se a quantidade mudou
+    chaves, contagem_antiga = np.unique( h_antigos, return_counts = True )
+    chaves_novas, contagem_nova = np.unique( h_novos, return_counts = True )
+
+    todas = np.union1d( chaves, chaves_novas )
+    antes = np.zeros( len( todas ), dtype = 'int64' )
+    depois = np.zeros( len( todas ), dtype = 'int64' )
+    antes[ np.searchsorted( todas, chaves ) ] = contagem_antiga
+    depois[ np.searchsorted( todas, chaves_novas ) ] = contagem_nova
+
+    mudou = todas[ antes != depois ]
+
+    return pd.concat([ antigos.loc[ np.isin( h_antigos, mudou ) ], novos.loc[ np.isin( h_novos, mudou ) ] ], ignore_index = True)
+
+
+
+def _iniciar_processo(pontos, camada, pasta):
+
+    global _PONTOS, _ZOOM
+    _PONTOS = { 'lat': pontos['lat'].to_numpy(), 'long': pontos['long'].to_numpy(), 'valor': pontos['valor'].to_numpy(),
+                'camada': camada, 'pasta': pasta }
+    _ZOOM = None
+
+
+
+# Pixels globais dos pontos no zoom, ordenados pelo tile - refeito só quando o zoom das tarefas muda
+def _projecao(z):
+
+    global _ZOOM
+
+    if _ZOOM is None or _ZOOM['z'] != z:
+
+        px, py = celulas_grade( _PONTOS['lat'], _PONTOS['long'], z + 8 )
+        chave = ( px // TAMANHO_TILE ) * 2 ** z + py // TAMANHO_TILE
+        ordem = np.argsort( chave, kind = 'stable' )
+
+        _ZOOM = { 'z': z, 'chave': chave[ordem], 'px': px[ordem], 'py': py[ordem], 'valor': _PONTOS['valor'][ordem] }
+
+    return _ZOOM
+
+
+
+# Imagem RGBA do tile ou None quando nenhum ponto alcança o tile
+def renderizar_tile(z, x, y, camada):
+
+    proj = _projecao( z )
+    n = 2 ** z
+    lado = TAMANHO_TILE + 2 * RAIO_PONTO
+
+    # Pontos do tile e dos 8 vizinhos (o raio pode passar da borda)
+    partes = []
+    for vx in ( x - 1, x, x + 1 ):
+        if 0 <= vx < n:
+            inicio, fim = np.searchsorted( proj['chave'], [ vx * n + max( y - 1, 0 ), vx * n + min( y + 1, n - 1 ) + 1 ] )
+            partes.append( np.arange( inicio, fim ) )
+
+    sel = np.concatenate( partes )
+
+    # Pixel no tile com margem do raio
+    lx = proj['px'][sel] - x * TAMANHO_TILE + RAIO_PONTO
+    ly = proj['py'][sel] - y * TAMANHO_TILE + RAIO_PONTO
+    dentro = ( lx >= 0 ) & ( lx < lado ) & ( ly >= 0 ) & ( ly < lado )
+
+    if not dentro.any():
+        return None
+
+    pos = ly[dentro] * lado + lx[dentro]
+    quantidade = np.bincount( pos, minlength = lado * lado ).reshape( lado, lado ).astype( 'float64' )
+    soma = np.bincount( pos, weights = proj['valor'][sel][dentro], minlength = lado * lado ).reshape( lado, lado )
+
+    # Soma na janela ( 2 * RAIO_PONTO + 1 )² de cada pixel por somas acumuladas
+    def janela(grade):
+        acumulado = np.pad( grade, ( (1, 0), (1, 0) ) ).cumsum( axis = 0 ).cumsum( axis = 1 )
+        d = 2 * RAIO_PONTO + 1
+        return acumulado[d:, d:] - acumulado[:-d, d:] - acumulado[d:, :-d] + acumulado[:-d, :-d]
+
+    quantidade, soma = janela( quantidade ), janela( soma )
+
+    # Arredondamento evita resíduos de ponto flutuante das somas acumuladas
+    quantidade = np.round( quantidade )
+    valor = quantidade if camada == 'densidade' else np.divide( soma, quantidade, out = np.zeros_like( soma ), where = quantidade > 0 )
+
+    classe = np.clip( np.searchsorted( LIMITES_CAMADAS[camada], valor, side = 'right' ) - 1, 0, len( CORES_CAMADAS[camada] ) - 1 )
+
+    cores = np.array( CORES_CAMADAS[camada], dtype = 'uint8' )
+    imagem = cores[classe]
+    imagem[ quantidade == 0 ] = 0
+
+    return imagem
+
+
+
+def caminho_tile(pasta, z, x, y):
+
+    return os.path.join( pasta, str( z ), str( x ), '{0}.png'.format( y ) )
+
+
+
+# Gera (ou remove, quando ficou sem pontos) os tiles de uma tarefa - gravação atômica, o servidor pode estar lendo
+def _gerar_tiles(tiles):
+
+    gravados = 0
+    for z, x, y in tiles:
+
+        destino = caminho_tile( _PONTOS['pasta'], z, x, y )
+        imagem = renderizar_tile( z, x, y, _PONTOS['camada'] )
+
+        if imagem is None:
+            if os.path.exists( destino ):
+                os.remove( destino )
+            continue
+
+        os.makedirs( os.path.dirname( destino ), exist_ok = True )
+
+        tmp = destino + '.tmp'
+        with open( tmp, 'wb' ) as f:
+            f.write( png_rgba( imagem ) )
+        os.replace( tmp, destino )
+
+        gravados += 1
+
+    return gravados
+
+
+
+# Gera os tiles de uma camada: todos ( completo ) ou só os alcançados pelos pontos que mudaram desde a última geração
+def construir_camada(path, camada, pontos, processos = 1, completo = False, zooms = ZOOMS_TILES):
+
+    pasta = pasta_camada( path, camada )
+    path_manifesto = os.path.join( pasta, 'manifesto.json' )
+    path_pontos = os.path.join( pasta, 'pontos.arrow' )
+
+    manifesto = None
+    if os.path.exists( path_manifesto ) and os.path.exists( path_pontos ):
+        with open( path_manifesto, encoding = 'utf-8' ) as f:
+            manifesto = json.load( f )
+
+    # Formato ou níveis diferentes invalidam os tiles gravados
+    if manifesto is None or manifesto['versao_tiles'] != VERSAO_TILES or manifesto['zooms'] != list( zooms ):
+        completo = True
+
+    if completo:
+        shutil.rmtree( pasta, ignore_errors = True )
+        alterados = pontos
+    else:
+        alterados = pontos_alterados( feather.read_table( path_pontos ).to_pandas(), pontos )
+
+    tiles = sorted( tiles_pontos( alterados, zooms ) )
+    tarefas = [ tiles[i:i + TILES_POR_TAREFA] for i in range( 0, len( tiles ), TILES_POR_TAREFA ) ]
+
+    os.makedirs( pasta, exist_ok = True )
+
+    if processos == 1 or len( tarefas ) <= 1:
+        _iniciar_processo( pontos, camada, pasta )
+        gravados = sum( _gerar_tiles( t ) for t in tarefas )
+    else:
+        with ProcessPoolExecutor( max_workers = processos, initializer = _iniciar_processo, initargs = (pontos, camada, pasta) ) as pool:
+            gravados = sum( pool.map( _gerar_tiles, tarefas ) )
+
+    # Pontos e manifesto gravados por último: uma geração interrompida é refeita na próxima vez
+    tmp = path_pontos + '.tmp'
+    feather.write_feather( pa.Table.from_pandas( pontos[['lat','long','valor']], preserve_index = False ), tmp, compression = 'uncompressed' )
+    os.replace( tmp, path_pontos )
+
+    with open( path_manifesto, 'w', encoding = 'utf-8' ) as f:
+        json.dump({ 'versao_tiles': VERSAO_TILES, 'versao_dados': versao_dados( path ), 'zooms': list( zooms ),
+                    'pontos': len( pontos ), 'gerado_em': round( time.time(), 3 ) }, f )
+
+    return { 'camada': camada, 'completo': completo, 'pontos_alterados': len( alterados ), 'tiles_processados': len( tiles ),
+             'tiles_gravados': gravados }
+
+
+
+# Gera (ou atualiza) as duas camadas da base
+def construir_tiles(path, processos = 1, completo = False, zooms = ZOOMS_TILES):
+
+    return [ construir_camada( path, camada, pontos, processos, completo, zooms )
+             for camada, pontos in pontos_camadas( path ).items() ]
+
+
+
+## Servidor ###--------------------------------------------------------------------------------------
+
+class ServidorTiles(BaseHTTPRequestHandler):
+
+    # Pasta tiles/ ( definida em servir_tiles )
+    pasta = None
+
+    ROTA = re.compile( r'^/(\w+)/(\d+)/(\d+)/(\d+)\.png$' )
+
+
+    def do_GET(self):
+
+        rota = self.ROTA.match( self.path.split( '?' )[0] )
+
+        if rota is None or rota.group( 1 ) not in CAMADAS:
+            self.send_error( 404 )
+            return
+
+        camada, z, x, y = rota.group( 1 ), *map( int, rota.groups()[1:] )
+        arquivo = caminho_tile( os.path.join( self.pasta, camada ), z, x, y )
+
+        try:
+            with open( arquivo, 'rb' ) as f:
+                conteudo = f.read()
+                info = os.fstat( f.fileno() )
+            etag = '"{0:x}-{1:x}"'.format( info.st_mtime_ns, info.st_size )
+        except FileNotFoundError:
+            conteudo, etag = TILE_VAZIO, '"vazio"'
+
+        # Tiles podem mudar na reconstrução incremental: o navegador revalida pelo ETag
+        if self.headers.get( 'If-None-Match' ) == etag:
+            self.send_response( 304 )
+            self.send_header( 'ETag', etag )
+            self.end_headers()
+            return
+
+        self.send_response( 200 )
+        self.send_header( 'Content-Type', 'image/png' )
+        self.send_header( 'Content-Length', str( len( conteudo ) ) )
+        self.send_header( 'Cache-Control', 'no-cache' )
+        self.send_header( 'ETag', etag )
+        self.send_header( 'Access-Control-Allow-Origin', '*' )
+        self.end_headers()
+        self.wfile.write( conteudo )
+
+
+    # Sem uma linha de log por tile
+    def log_message(self, formato, *args):
+
+        pass
+
+
+
+# Servidor HTTP local dos tiles: http://<host>:<porta>/<camada>/{z}/{x}/{y}.png
+def servir_tiles(path, host = '127.0.0.1', porta = PORTA_TILES):
+
+    ServidorTiles.pasta = os.path.join( os.path.dirname( os.path.abspath( path ) ), PASTA_TILES )
+
+    servidor = ThreadingHTTPServer( (host, porta), ServidorTiles )
+    servidor.daemon_threads = True
+
+    return servidor
+
+
+
+# Camada de tiles do servidor local num mapa Folium ( url_base: http://127.0.0.1:8502 )
+def camada_tiles(mapa, url_base, camada, nome = None, zooms = ZOOMS_TILES):
+
+    folium.TileLayer( tiles = '{0}/{1}/{{z}}/{{x}}/{{y}}.png'.format( url_base.rstrip( '/' ), camada ), attr = 'House Rocket',
+                      name = nome or camada, overlay = True, control = False, min_zoom = min( zooms ),
+                      max_native_zoom = max( zooms ), max_zoom = 18 ).add_to( mapa )
+
+    return mapa
+
+
+
+### -----------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser( description = 'Pirâmide de tiles das camadas de densidade e de imóveis investidos.' )
+    parser.add_argument( 'comando', choices = ['construir', 'servir'] )
+    parser.add_argument( 'dados', help = 'arquivo .csv da base ( kc_house_data.csv )' )
+    parser.add_argument( '--processos', type = int, default = None, help = 'processos em paralelo (padrão: todos os núcleos)' )
+    parser.add_argument( '--completo', action = 'store_true', help = 'gera todos os tiles de novo ( padrão: incremental )' )
+    parser.add_argument( '--zooms', type = int, nargs = 2, default = [ZOOMS_TILES[0], ZOOMS_TILES[-1]], metavar = ('MIN', 'MAX') )
+    parser.add_argument( '--host', default = '127.0.0.1' )
+    parser.add_argument( '--porta', type = int, default = PORTA_TILES )
+    args = parser.parse_args()
+
+    if not os.path.exists( args.dados ):
+        parser.error( 'base não encontrada: {0}'.format( args.dados ) )
+
+    if args.comando == 'construir':
+
+        t0 = time.perf_counter()
+        resumo = construir_tiles( args.dados, args.processos or os.cpu_count() or 1, args.completo,
+                                  list( range( args.zooms[0], args.zooms[1] + 1 ) ) )
+
+        for r in resumo:
+            print( '{camada}: {tiles_processados} tiles processados, {tiles_gravados} gravados '
+                   '({pontos_alterados} pontos alterados, completo={completo})'.format( **r ) )
+
+        print( '  {0:.1f} s'.format( time.perf_counter() - t0 ) )
+
+    else:
+
+        servidor = servir_tiles( args.dados, args.host, args.porta )
+        print( 'tiles em http://{0}:{1}/<camada>/{{z}}/{{x}}/{{y}}.png ( camadas: {2} )'.format( args.host, args.porta, ', '.join( CAMADAS ) ) )
+
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            servidor.server_close()
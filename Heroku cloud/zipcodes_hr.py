@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Atribuição de códigos postais pelas coordenadas ( junção espacial ponto-em-polígono ).
+
+Os polígonos de Zip_Codes.geojson ( originais, do arquivo pré-processado de mapas_hr.py ) vão
+para uma STR-tree do shapely montada de uma vez, e os pontos são consultados em lotes com
+predicados vetorizados: cada venda recebe o ZIP do polígono que contém lat/long. Pontos logo
+fora de todos os polígonos ( costa, arredondamento das coordenadas ) recebem o polígono mais
+próximo até DISTANCIA_MAXIMA. Vendas sem lat/long válidas ( vazias ou infinitas ) não são consultadas.
+
+A conferência compara o ZIP das coordenadas com o zipcode declarado e marca as divergências.
+
+Uso: python zipcodes_hr.py Zip_Codes.geojson kc_house_data.csv --saida divergencias.csv
+"""
+
+## Libraries ###-------------------------------------------------------------------
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from mapas_hr import carregar_geometrias
+
+
+## Configuração ###----------------------------------------------------------------
+
+# ZIP atribuído aos pontos fora de todos os polígonos
+SEM_ZIPCODE = -1
+
+# Distância máxima (graus, ~100 m) até o polígono mais próximo para pontos fora de todos os polígonos
+DISTANCIA_MAXIMA = 0.001
+
+# Pontos por consulta à STR-tree
+LOTE_PONTOS = 1000000
+
+# Resultados da conferência ( coluna conferencia_zipcode )
+CONFERENCIA = ['igual', 'divergente', 'sem_declarado', 'sem_poligono', 'sem_coordenadas']
+
+
+## Functions ###-------------------------------------------------------------------------------------
+
+# STR-tree dos polígonos originais ( tolerância 0.0 ) e os ZIPs na mesma ordem
+def indice_zipcodes(path_geojson):
+
+    nivel = carregar_geometrias( path_geojson )[0.0]
+
+    zips = np.fromiter( nivel.keys(), dtype = 'int64', count = len( nivel ) )
+    poligonos = shapely.from_wkb( list( nivel.values() ) )
+
+    # Preparar acelera os predicados repetidos sobre os mesmos polígonos
+    shapely.prepare( poligonos )
+
+    return { 'arvore': shapely.STRtree( poligonos ), 'zips': zips }
+
+
+
+# ZIP de cada ponto ( SEM_ZIPCODE fora dos polígonos ou sem coordenadas válidas ) - no limite entre duas regiões fica o menor ZIP
+def atribuir_zipcodes(indice, lat, long):
+
+    lat = np.asarray( lat, dtype = 'float64' )
+    long = np.asarray( long, dtype = 'float64' )
+
+    zipcodes = np.full( len( lat ), SEM_ZIPCODE, dtype = 'int64' )
+
+    # Pontos com lat/long vazias ou infinitas ficam fora das consultas ( query_nearest falha com coordenadas NaN )
+    validos = np.flatnonzero( np.isfinite( lat ) & np.isfinite( long ) )
+
+    for inicio in range( 0, len( validos ), LOTE_PONTOS ):
+
+        lote = validos[inicio:inicio + LOTE_PONTOS]
+        pontos = shapely.points( long[lote], lat[lote] )
+
+        ponto, poligono = indice['arvore'].query( pontos, predicate = 'intersects' )
+
+        # Um ZIP por ponto: pares ordenados por ponto e ZIP, fica o primeiro de cada ponto
+        ordem = np.lexsort( ( indice['zips'][poligono], ponto ) )
+        ponto, poligono = ponto[ordem], poligono[ordem]
+        primeiro = np.diff( ponto, prepend = -1 ) != 0
+
+        resultado = np.full( len( lote ), SEM_ZIPCODE, dtype = 'int64' )
+        resultado[ ponto[primeiro] ] = indice['zips'][ poligono[primeiro] ]
+
+        # Pontos sem polígono: o mais próximo dentro da distância máxima
+        fora = np.flatnonzero( resultado == SEM_ZIPCODE )
+        if len( fora ):
+
+            ponto, poligono = indice['arvore'].query_nearest( pontos[fora], max_distance = DISTANCIA_MAXIMA, all_matches = False )
+            resultado[ fora[ponto] ] = indice['zips'][poligono]
+
+        zipcodes[lote] = resultado
+
+    return zipcodes
+
+
+
+# Acrescenta zipcode_geo ( ZIP pelas coordenadas ) e conferencia_zipcode ( igual, divergente, sem_declarado, sem_poligono,
+# sem_coordenadas )
+def conferir_zipcodes(df, indice):
+
+    lat = pd.to_numeric( df['lat'], errors = 'coerce' ).to_numpy( dtype = 'float64' )
+    long = pd.to_numeric( df['long'], errors = 'coerce' ).to_numpy( dtype = 'float64' )
+
+    zipcode_geo = atribuir_zipcodes( indice, lat, long )
+    declarado = pd.to_numeric( df['zipcode'], errors = 'coerce' ).to_numpy( dtype = 'float64' )
+
+    conferencia = np.select( [ ~( np.isfinite( lat ) & np.isfinite( long ) ), zipcode_geo == SEM_ZIPCODE,
+                               np.isnan( declarado ), declarado != zipcode_geo ],
+                             ['sem_coordenadas', 'sem_poligono', 'sem_declarado', 'divergente'], default = 'igual' )
+
+    df = df.copy()
+    df['zipcode_geo'] = zipcode_geo
+    df['conferencia_zipcode'] = pd.Categorical( conferencia, categories = CONFERENCIA )
+
+    return df
+
+
+
+# Preenche zipcodes vazios com o ZIP das coordenadas ( divergências só são marcadas, não corrigidas )
+def preencher_zipcodes(df, indice):
+
+    df = conferir_zipcodes( df, indice )
+
+    vazio = df['conferencia_zipcode'] == 'sem_declarado'
+    df.loc[vazio, 'zipcode'] = df.loc[vazio, 'zipcode_geo']
+
+    return df
+
+
+
+### -----------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser( description = 'Confere os códigos postais das vendas pelas coordenadas.' )
+    parser.add_argument( 'geojson', help = 'polígonos dos códigos postais ( Zip_Codes.geojson )' )
+    parser.add_argument( 'dados', help = 'arquivo .csv com id, lat, long e zipcode' )
+    parser.add_argument( '--saida', default = None, help = 'arquivo .csv para gravar as vendas que não conferem' )
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    indice = indice_zipcodes( args.geojson )
+    t_indice = time.perf_counter() - t0
+
+    df = pd.read_csv( args.dados, usecols = ['id', 'lat', 'long', 'zipcode'] )
+
+    t0 = time.perf_counter()
+    df = conferir_zipcodes( df, indice )
+    t_consulta = time.perf_counter() - t0
+
+    print( 'índice: {0} polígonos em {1:.3f} s - {2} pontos em {3:.3f} s ({4:,.0f} pontos/min)'.format(
+           len( indice['zips'] ), t_indice, len( df ), t_consulta, len( df ) / max( t_consulta, 1e-9 ) * 60 ) )
+
+    for resultado, quantidade in df['conferencia_zipcode'].value_counts( sort = False ).items():
+        print( '  {0}: {1}'.format( resultado, quantidade ) )
+
+    if args.saida:
+        df.loc[ df['conferencia_zipcode'] != 'igual' ].to_csv( args.saida, index = False )